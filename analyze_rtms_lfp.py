@@ -11,19 +11,22 @@ Loads simulation outputs (spikes, LFP) and generates multi-panel figures showing
 - Power spectral density (PSD) analysis
 
 Usage:
-    python analyze_rtms_lfp.py <data_file.json> [output_prefix]
+    python analyze_rtms_lfp.py <data_file.json | data_dir> [output_prefix]
 
 Example:
-    python analyze_rtms_lfp.py output/Healthy_rTMS_40Vm_data.json figures/healthy_rtms
+    python analyze_rtms_lfp.py output/Healthy_rTMS_40Vm_data figures/healthy_rtms
 """
 
-import json
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.gridspec import GridSpec
 from scipy import signal
 import sys
 import os
+from types import SimpleNamespace
+
+import output_io
+from parallel import pop_gid_ranges
 
 # Matplotlib settings
 plt.rcParams.update({
@@ -36,6 +39,12 @@ plt.rcParams.update({
     'figure.dpi': 100
 })
 
+# Raster panel: above this many spikes, draw a 2D spike-density image per
+# population instead of one marker per spike
+RASTER_MAX_MARKERS = 200000
+RASTER_IMAGE_COLS = 2000        # time bins of the density image
+RASTER_IMAGE_ROWS = 1000        # max cell rows per population in the density image
+
 
 class RTMSLFPAnalyzer:
     """
@@ -47,51 +56,132 @@ class RTMSLFPAnalyzer:
         Initialize analyzer and load data.
 
         Args:
-            data_file: Path to NetPyNE output JSON file
+            data_file: Path to NetPyNE output JSON file or npy output directory
+                (cfg.saveFormat = 'npy', see output_io.py)
         """
         self.data_file = data_file
+        self.data_dir = None
         self.data = None
+        self.arrays = {}
         self.spikes = None
-        self.lfp = None
+        self._lfp = None
         self.config = None
         self.duration = None
+        self.pops = []
+        self.pop_ranges = {}
+        self.pop_of_gid = None
+        self.pop_spike_index = {}
 
         self.load_data()
 
     def load_data(self):
-        """Load simulation data from JSON file."""
+        """
+        Open simulation data lazily.
+
+        A JSON file is converted once to an npy directory next to it (see
+        output_io.ensure_npy_output). Spike arrays are memory-mapped; the LFP is
+        memory-mapped on first use, and lfp_trace() reads only the requested
+        electrode and time window.
+        """
         print(f"\n[Loading] {self.data_file}")
 
-        with open(self.data_file, 'r') as f:
-            self.data = json.load(f)
+        self.data_dir = output_io.ensure_npy_output(self.data_file)
+        meta = output_io.load_meta(self.data_dir)
+        self.data = {'simConfig': meta['simConfig'], 'pops': meta['pops']}
+        self.arrays = meta['arrays']
 
-        # Extract spike data
-        if 'simData' in self.data and 'spkt' in self.data['simData']:
+        # Spike data (memory-mapped)
+        if 'spkt' in self.arrays:
             self.spikes = {
-                'times': np.array(self.data['simData']['spkt']),
-                'ids': np.array(self.data['simData']['spkid'])
+                'times': output_io.load_array(self.data_dir, 'spkt', mmap=True),
+                'ids': output_io.load_array(self.data_dir, 'spkid', mmap=True)
             }
             print(f"  ✓ Loaded {len(self.spikes['times'])} spikes")
         else:
             print("  ✗ No spike data found")
-            self.spikes = {'times': np.array([]), 'ids': np.array([])}
+            self.spikes = {'times': np.array([]), 'ids': np.array([], dtype=np.int32)}
 
-        # Extract LFP data
-        if 'simData' in self.data and 'LFP' in self.data['simData']:
-            self.lfp = np.array(self.data['simData']['LFP'])
-            print(f"  ✓ Loaded LFP: shape {self.lfp.shape}")
+        # LFP data (opened on first use)
+        if 'LFP' in self.arrays:
+            print(f"  ✓ LFP: shape {tuple(self.arrays['LFP']['shape'])} (memory-mapped)")
         else:
             print("  ✗ No LFP data found")
-            self.lfp = None
 
         # Extract config
-        if 'simConfig' in self.data:
+        if self.data['simConfig']:
             self.config = self.data['simConfig']
             self.duration = self.config.get('duration', 2000.0)
             print(f"  ✓ Duration: {self.duration} ms")
         else:
             self.duration = 2000.0
 
+        self.build_population_index()
+
+    @property
+    def lfp(self):
+        """LFP array (timepoints x electrodes), memory-mapped; None if not recorded."""
+        if self._lfp is None and 'LFP' in self.arrays:
+            self._lfp = output_io.load_array(self.data_dir, 'LFP', mmap=True)
+        return self._lfp
+
+    def lfp_trace(self, electrode_idx, time_window=None):
+        """
+        LFP of one electrode, read from disk for the given window only.
+
+        Args:
+            electrode_idx: Electrode index
+            time_window: [t_start, t_end] in ms (None = full duration)
+
+        Returns:
+            times (ms), LFP (mV) as float64 arrays
+        """
+        lfp_dt = self.config.get('LFP_dt', 0.1)
+        n_samples = self.arrays['LFP']['shape'][0]
+        if time_window is None:
+            idx_start, idx_end = 0, n_samples
+        else:
+            idx_start = min(int(time_window[0] / lfp_dt), n_samples)
+            idx_end = min(int(time_window[1] / lfp_dt), n_samples)
+
+        trace = np.array(self.lfp[idx_start:idx_end, electrode_idx], dtype=float)
+        return np.arange(idx_start, idx_end) * lfp_dt, trace
+
+    def build_population_index(self):
+        """
+        gid -> population lookup and per-population spike grouping (once, at load).
+
+        Population gid ranges come from the output sidecar; without them they
+        are rebuilt from the simConfig (parallel.pop_gid_ranges: the recorded
+        popGidRanges, or cellNumber in allpops order for scale = 1). Spikes
+        are grouped with one stable argsort of their population index, so
+        every per-population selection afterwards is a slice.
+        """
+        ranges = self.data.get('pops') or {}
+        if not ranges and self.config and 'cellNumber' in self.config:
+            ranges = pop_gid_ranges(SimpleNamespace(allpops=self.config.get('allpops', list(self.config['cellNumber'])),
+                                                    cellNumber=self.config['cellNumber'],
+                                                    scale=self.config.get('scale', 1.0),
+                                                    popGidRanges=self.config.get('popGidRanges')))
+
+        self.pop_ranges = {pop: (int(first), int(stop)) for pop, (first, stop) in ranges.items()}
+        self.pops = list(self.pop_ranges)
+        n_cells = max((stop for _, stop in self.pop_ranges.values()), default=0)
+
+        # gid -> index into self.pops (-1: not a network cell, e.g. stimulator pops)
+        self.pop_of_gid = np.full(n_cells, -1, dtype=np.int32)
+        for i, (first, stop) in enumerate(self.pop_ranges.values()):
+            self.pop_of_gid[first:stop] = i
+
+        ids = np.asarray(self.spikes['ids'], dtype=np.int64)
+        spike_pop = np.full(len(ids), -1, dtype=np.int32)
+        known = (ids >= 0) & (ids < n_cells)
+        spike_pop[known] = self.pop_of_gid[ids[known]]
+
+        order = np.argsort(spike_pop, kind='stable')
+        bounds = np.searchsorted(spike_pop[order], np.arange(len(self.pops) + 1))
+        self.pop_spike_index = {pop: order[bounds[i]:bounds[i + 1]]
+                                for i, pop in enumerate(self.pops)}
+
     def get_population_cell_count(self, pop_name):
         """
         Get number of cells in a population.
@@ -102,21 +192,8 @@ class RTMSLFPAnalyzer:
         Returns:
             Number of cells in that population
         """
-        # Try simConfig.cellNumber first (most reliable)
-        if self.config and 'cellNumber' in self.config:
-            return self.config['cellNumber'].get(pop_name, 0)
-
-        # Fallback: try net.pops
-        if 'net' in self.data and 'pops' in self.data['net']:
-            if pop_name in self.data['net']['pops']:
-                return self.data['net']['pops'][pop_name].get('cellGids', 0)
-
-        # Last resort: count from cells if available
-        if 'net' in self.data and 'cells' in self.data['net']:
-            return sum(1 for cell in self.data['net']['cells']
-                      if cell.get('tags', {}).get('pop') == pop_name)
-
-        return 0
+        first, stop = self.pop_ranges.get(pop_name, (0, 0))
+        return stop - first
 
     def get_population_gids(self, pop_name):
         """
@@ -126,47 +203,27 @@ class RTMSLFPAnalyzer:
             pop_name: Population name
 
         Returns:
-            List of GIDs for that population
+            Array of GIDs for that population
         """
-        # Try net.cells first (most detailed)
-        if 'net' in self.data and 'cells' in self.data['net']:
-            return [cell['gid'] for cell in self.data['net']['cells']
-                   if cell.get('tags', {}).get('pop') == pop_name]
-
-        # Fallback: use cellNumber to infer GID ranges
-        # Assumes sequential GID assignment in order: PYR, PV, SST, VIP
-        if self.config and 'cellNumber' in self.config:
-            cell_counts = self.config['cellNumber']
-            pop_order = ['HL23PYR', 'HL23PV', 'HL23SST', 'HL23VIP']
-
-            gid_start = 0
-            for pop in pop_order:
-                count = cell_counts.get(pop, 0)
-                if pop == pop_name:
-                    return list(range(gid_start, gid_start + count))
-                gid_start += count
-
-        return []
-
-    def get_population_spikes(self, pop_name):
+        first, stop = self.pop_ranges.get(pop_name, (0, 0))
+        return np.arange(first, stop)
+
+    def get_population_spikes(self, pop_name, with_ids=False):
         """
         Extract spikes for a specific population.
 
         Args:
             pop_name: Population name (e.g., 'HL23PYR')
+            with_ids: Also return the gid of every spike
 
         Returns:
-            Array of spike times for that population
+            Array of spike times for that population (and gids if with_ids)
         """
-        # Get cell IDs for this population
-        pop_gids = self.get_population_gids(pop_name)
-
-        if not pop_gids:
-            return np.array([])
-
-        # Filter spikes
-        mask = np.isin(self.spikes['ids'], pop_gids)
-        return self.spikes['times'][mask]
+        index = self.pop_spike_index.get(pop_name, np.array([], dtype=np.int64))
+        times = np.asarray(self.spikes['times'])[index]
+        if with_ids:
+            return times, np.asarray(self.spikes['ids'])[index]
+        return times
 
     def compute_firing_rate_histogram(self, pop_name, bin_size=50.0):
         """
@@ -244,20 +301,66 @@ class RTMSLFPAnalyzer:
         lfp_dt = self.config.get('LFP_dt', 0.1)  # ms
         fs = 1000.0 / lfp_dt  # Hz
 
-        lfp_trace = self.lfp[:, electrode_idx]
-
-        # Select time window
-        if time_window is not None:
-            t_start, t_end = time_window
-            idx_start = int(t_start / lfp_dt)
-            idx_end = int(t_end / lfp_dt)
-            lfp_trace = lfp_trace[idx_start:idx_end]
+        _, lfp_trace = self.lfp_trace(electrode_idx, time_window)
 
         # Welch's method for PSD
         freqs, psd = signal.welch(lfp_trace, fs=fs, nperseg=nperseg, scaling='density')
 
         return freqs, psd
 
+    def plot_raster(self, ax, populations, colors, max_markers=RASTER_MAX_MARKERS):
+        """
+        Raster of all populations, one artist per population.
+
+        Each population is drawn as a single scatter collection of its spikes
+        (y = row of the cell within the population). Above max_markers spikes
+        in total, each population is drawn as a 2D histogram image
+        (RASTER_IMAGE_COLS time bins x up to RASTER_IMAGE_ROWS cell rows)
+        shaded in the population color, with empty bins transparent.
+
+        Args:
+            ax: Axes to draw in
+            populations: Population names, bottom to top
+            colors: dict pop -> color
+            max_markers: Spike count above which the density image is used
+
+        Returns:
+            y_offset (top of the last population), y_ticks, y_labels
+        """
+        from matplotlib.colors import LinearSegmentedColormap
+
+        pop_spikes = {pop: self.get_population_spikes(pop, with_ids=True) for pop in populations}
+        as_image = sum(len(times) for times, _ in pop_spikes.values()) > max_markers
+
+        y_offset = 0
+        y_ticks = []
+        y_labels = []
+        for pop in populations:
+            n_cells = self.get_population_cell_count(pop)
+            if n_cells == 0:
+                continue
+
+            times, ids = pop_spikes[pop]
+            rows = y_offset + (ids - self.pop_ranges[pop][0])
+            if as_image:
+                counts, _, _ = np.histogram2d(
+                    rows, times,
+                    bins=[min(n_cells, RASTER_IMAGE_ROWS), RASTER_IMAGE_COLS],
+                    range=[[y_offset, y_offset + n_cells], [0, self.duration]])
+                cmap = LinearSegmentedColormap.from_list(pop, ['white', colors[pop]])
+                cmap.set_bad(alpha=0)
+                ax.imshow(np.ma.masked_equal(counts, 0), cmap=cmap, origin='lower',
+                          aspect='auto', interpolation='nearest',
+                          extent=(0, self.duration, y_offset, y_offset + n_cells))
+            elif len(times):
+                ax.scatter(times, rows, s=2, c=colors[pop], marker='|', linewidths=0.5)
+
+            y_ticks.append(y_offset + n_cells / 2)
+            y_labels.append(pop)
+            y_offset += n_cells + 2
+
+        return y_offset, y_ticks, y_labels
+
     def plot_comprehensive_analysis(self, output_prefix='figures/rtms_lfp_analysis',
                                      electrode_idx=2, pre_window=[0, 500],
                                      post_window=[1500, 2000]):
@@ -289,29 +392,7 @@ class RTMSLFPAnalyzer:
         # ========== Panel A: Raster Plot ==========
         ax_raster = fig.add_subplot(gs[0, :])
 
-        y_offset = 0
-        y_ticks = []
-        y_labels = []
-
-        for pop in populations:
-            # Get cell IDs for this pop using robust method
-            pop_gids = self.get_population_gids(pop)
-
-            if len(pop_gids) > 0:
-                # Plot spikes
-                for i, gid in enumerate(pop_gids):
-                    # Get spikes for this specific cell
-                    cell_spike_mask = self.spikes['ids'] == gid
-                    cell_spike_times = self.spikes['times'][cell_spike_mask]
-
-                    if len(cell_spike_times) > 0:
-                        ax_raster.scatter(cell_spike_times,
-                                        np.ones_like(cell_spike_times) * (y_offset + i),
-                                        s=2, c=colors[pop], marker='|', linewidths=0.5)
-
-                y_ticks.append(y_offset + len(pop_gids) / 2)
-                y_labels.append(pop)
-                y_offset += len(pop_gids) + 2
+        y_offset, y_ticks, y_labels = self.plot_raster(ax_raster, populations, colors)
 
         # Mark TMS pulses
         for t in pulse_times:
@@ -348,10 +429,9 @@ class RTMSLFPAnalyzer:
         ax_lfp = fig.add_subplot(gs[2, :])
 
         if self.lfp is not None:
-            lfp_dt = self.config.get('LFP_dt', 0.1)
-            t_lfp = np.arange(self.lfp.shape[0]) * lfp_dt
+            t_lfp, lfp_full = self.lfp_trace(electrode_idx)
 
-            ax_lfp.plot(t_lfp, self.lfp[:, electrode_idx], 'k-', linewidth=0.8)
+            ax_lfp.plot(t_lfp, lfp_full, 'k-', linewidth=0.8)
 
             # Mark TMS pulses
             for t in pulse_times:
@@ -376,18 +456,15 @@ class RTMSLFPAnalyzer:
         ax_pre = fig.add_subplot(gs[3, 0])
 
         if self.lfp is not None:
-            idx_pre_start = int(pre_window[0] / lfp_dt)
-            idx_pre_end = int(pre_window[1] / lfp_dt)
-            t_pre = np.arange(idx_pre_start, idx_pre_end) * lfp_dt
+            t_pre, pre_lfp = self.lfp_trace(electrode_idx, pre_window)
 
-            ax_pre.plot(t_pre, self.lfp[idx_pre_start:idx_pre_end, electrode_idx], 'b-', linewidth=1)
+            ax_pre.plot(t_pre, pre_lfp, 'b-', linewidth=1)
             ax_pre.set_xlabel('Time (ms)', fontweight='bold')
             ax_pre.set_ylabel('LFP (mV)', fontweight='bold')
             ax_pre.set_title('D. Pre-TMS LFP Detail', fontweight='bold', fontsize=11)
             ax_pre.grid(True, alpha=0.3)
 
             # Stats
-            pre_lfp = self.lfp[idx_pre_start:idx_pre_end, electrode_idx]
             pre_mean = np.mean(pre_lfp)
             pre_std = np.std(pre_lfp)
             ax_pre.text(0.02, 0.98, f'Mean: {pre_mean:.3f} mV\nStd: {pre_std:.3f} mV',
@@ -400,18 +477,15 @@ class RTMSLFPAnalyzer:
         ax_post = fig.add_subplot(gs[3, 1])
 
         if self.lfp is not None:
-            idx_post_start = int(post_window[0] / lfp_dt)
-            idx_post_end = int(post_window[1] / lfp_dt)
-            t_post = np.arange(idx_post_start, idx_post_end) * lfp_dt
+            t_post, post_lfp = self.lfp_trace(electrode_idx, post_window)
 
-            ax_post.plot(t_post, self.lfp[idx_post_start:idx_post_end, electrode_idx], 'g-', linewidth=1)
+            ax_post.plot(t_post, post_lfp, 'g-', linewidth=1)
             ax_post.set_xlabel('Time (ms)', fontweight='bold')
             ax_post.set_ylabel('LFP (mV)', fontweight='bold')
             ax_post.set_title('E. Post-TMS LFP Detail', fontweight='bold', fontsize=11)
             ax_post.grid(True, alpha=0.3)
 
             # Stats
-            post_lfp = self.lfp[idx_post_start:idx_post_end, electrode_idx]
             post_mean = np.mean(post_lfp)
             post_std = np.std(post_lfp)
             ax_post.text(0.02, 0.98, f'Mean: {post_mean:.3f} mV\nStd: {post_std:.3f} mV',
@@ -506,9 +580,9 @@ class RTMSLFPAnalyzer:
 def main():
     """Main execution."""
     if len(sys.argv) < 2:
-        print("Usage: python analyze_rtms_lfp.py <data_file.json> [output_prefix]")
+        print("Usage: python analyze_rtms_lfp.py <data_file.json | data_dir> [output_prefix]")
         print("\nExample:")
-        print("  python analyze_rtms_lfp.py output/Healthy_rTMS_40Vm_data.json figures/healthy_rtms")
+        print("  python analyze_rtms_lfp.py output/Healthy_rTMS_40Vm_data figures/healthy_rtms")
         sys.exit(1)
 
     data_file = sys.argv[1]
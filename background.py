@@ -0,0 +1,245 @@
+"""
+background.py
+Background drive for the network, selected with cfg.backgroundMode
+
+- 'netstim':   one NetStim (Poisson, noise=1) per target cell, generated inside
+               the NEURON event loop (original behaviour).
+- 'spikebank': all Poisson trains for the run are generated up front with NumPy
+               and replayed by one VecStim per target cell (NEURON's built-in
+               VecStim, also supported by CoreNEURON).
+               Trains depend only on cfg.seeds['stim'] and the population, so
+               they are identical for any number of MPI ranks.
+- 'gfluct':    one Gfluct2 fluctuating-conductance point process per cell
+               (mod/Gfluct.mod, Destexhe et al. 2001) at the soma, calibrated
+               to the mean and variance of the NetStim drive it replaces
+               (gfluct_params). No background events enter the event queue.
+"""
+
+import numpy as np
+
+from parallel import root_print, scaled_cell_number
+
+
+BACKGROUND_MODES = ['netstim', 'spikebank', 'gfluct']
+
+# Kinetics of the 'AMPA' synMech that carries the NetStim background (ms)
+BKG_TAU_RISE = 0.3
+BKG_TAU_DECAY = 3.0
+
+# Random objects must outlive the Gfluct2 instances that point to them
+_GFLUCT_RNGS = []
+
+
+def poisson_trains(rate_hz, n_trains, t_start, t_stop, rng):
+    """
+    Homogeneous Poisson spike trains, generated in one vectorized pass.
+
+    Args:
+        rate_hz: Rate of every train (Hz)
+        n_trains: Number of independent trains
+        t_start, t_stop: Time window (ms)
+        rng: numpy.random.Generator
+
+    Returns:
+        List of n_trains sorted float arrays of spike times (ms)
+    """
+    duration_s = max(t_stop - t_start, 0.0) / 1000.0
+    counts = rng.poisson(rate_hz * duration_s, size=n_trains)
+
+    times = rng.uniform(t_start, t_stop, size=counts.sum())
+    owner = np.repeat(np.arange(n_trains), counts)
+    times = times[np.lexsort((times, owner))]
+
+    return np.split(times, np.cumsum(counts)[:-1])
+
+
+def spike_bank(cfg):
+    """
+    Poisson trains for every background target cell.
+
+    Each population draws from its own stream seeded by
+    (cfg.seeds['stim'], population index), so adding or resizing one
+    population does not change the trains of the others. There is one train
+    per created cell, i.e. cfg.cellNumber scaled by cfg.scale.
+
+    Returns:
+        dict pop -> list of spike-time arrays, one per cell
+    """
+    bank = {}
+    for i, pop in enumerate(cfg.allpops):
+        rng = np.random.default_rng([cfg.seeds['stim'], i])
+        bank[pop] = poisson_trains(cfg.backgroundRate[pop], scaled_cell_number(cfg, pop),
+                                   0.0, cfg.duration, rng)
+    return bank
+
+
+def exp2syn_moments(rate_hz, weight, tau_rise, tau_decay):
+    """
+    Mean and standard deviation of the conductance produced by Poisson input
+    onto an Exp2Syn (Campbell's theorem).
+
+    The Exp2Syn kernel is normalized to a peak of `weight`:
+        k(t) = weight * f * (exp(-t/tau_decay) - exp(-t/tau_rise))
+    so for rate r (1/ms)
+        mean = r * integral(k)   = r * weight * f * (tau_decay - tau_rise)
+        var  = r * integral(k^2) = r * (weight * f)^2 *
+               (tau_decay/2 + tau_rise/2 - 2*tau_rise*tau_decay/(tau_rise + tau_decay))
+
+    Returns:
+        (mean, std) in the units of weight (uS)
+    """
+    tp = tau_rise * tau_decay / (tau_decay - tau_rise) * np.log(tau_decay / tau_rise)
+    f = 1.0 / (np.exp(-tp / tau_decay) - np.exp(-tp / tau_rise))
+    r = rate_hz / 1000.0
+
+    mean = r * weight * f * (tau_decay - tau_rise)
+    var = r * (weight * f) ** 2 * (tau_decay / 2 + tau_rise / 2
+                                   - 2 * tau_rise * tau_decay / (tau_rise + tau_decay))
+    return mean, np.sqrt(var)
+
+
+def gfluct_params(rate_hz, weight):
+    """
+    Gfluct2 parameters equivalent to NetStim background at rate_hz with weight (uS).
+
+    The excitatory OU process gets the shot-noise mean and std, with its
+    correlation time set to the synaptic decay; the inhibitory branch is
+    switched off because the NetStim background is excitatory only.
+    """
+    g_e0, std_e = exp2syn_moments(rate_hz, weight, BKG_TAU_RISE, BKG_TAU_DECAY)
+    return {
+        'E_e': 0,
+        'g_e0': float(g_e0),
+        'std_e': float(std_e),
+        'tau_e': BKG_TAU_DECAY,
+        'g_i0': 0.0,
+        'std_i': 0.0,
+    }
+
+
+def add_netstim_background(netParams, cfg, log):
+    """One NetStim source per population, connected to every cell ('netstim' mode)."""
+    for pop in cfg.allpops:
+        # Create NetStim source
+        netParams.stimSourceParams[f'bkg_{pop}'] = {
+            'type': 'NetStim',
+            'rate': cfg.backgroundRate[pop],
+            'noise': 1.0,
+            'start': 0
+        }
+
+        # Connect to population
+        netParams.stimTargetParams[f'bkg->{pop}'] = {
+            'source': f'bkg_{pop}',
+            'conds': {'pop': pop},
+            'weight': cfg.backgroundWeight[pop],
+            'delay': 0.5,
+            'synMech': 'AMPA',
+            'sec': 'spiny'
+        }
+
+        log(f"✓ Background -> {pop}: {cfg.backgroundRate[pop]} Hz, weight={cfg.backgroundWeight[pop]}")
+
+
+def add_spikebank_background(netParams, cfg, log):
+    """
+    A VecStim population per target population, replaying precomputed trains
+    one-to-one onto its cells ('spikebank' mode).
+
+    NetPyNE scales numCells of every pop, so the VecStim pop gets the same
+    unscaled cfg.cellNumber as its target and both are created with
+    scaled_cell_number cells, the number of trains and connList entries.
+    """
+    bank = spike_bank(cfg)
+
+    for pop in cfg.allpops:
+        trains = bank[pop]
+        n_cells = len(trains)
+
+        netParams.popParams[f'bkg_{pop}'] = {
+            'cellModel': 'VecStim',
+            'numCells': cfg.cellNumber[pop],
+            'spkTimes': [train.tolist() for train in trains]
+        }
+
+        netParams.connParams[f'bkg->{pop}'] = {
+            'preConds': {'pop': f'bkg_{pop}'},
+            'postConds': {'pop': pop},
+            'connList': [[i, i] for i in range(n_cells)],
+            'weight': cfg.backgroundWeight[pop],
+            'delay': 0.5,
+            'synMech': 'AMPA',
+            'sec': 'spiny'
+        }
+
+        n_spikes = sum(len(train) for train in trains)
+        log(f"✓ Background -> {pop}: {cfg.backgroundRate[pop]} Hz spike bank "
+            f"({n_spikes} spikes), weight={cfg.backgroundWeight[pop]}")
+
+
+def add_gfluct_background(netParams, cfg, log):
+    """One somatic Gfluct2 per cell, calibrated to the NetStim drive ('gfluct' mode)."""
+    for pop in cfg.allpops:
+        params = gfluct_params(cfg.backgroundRate[pop], cfg.backgroundWeight[pop])
+
+        netParams.stimSourceParams[f'bkg_{pop}'] = dict(type='Gfluct2', **params)
+
+        netParams.stimTargetParams[f'bkg->{pop}'] = {
+            'source': f'bkg_{pop}',
+            'conds': {'pop': pop},
+            'sec': 'soma_0',
+            'loc': 0.5
+        }
+
+        log(f"✓ Background -> {pop}: Gfluct2 g_e0={params['g_e0']:.5f} uS, "
+            f"std_e={params['std_e']:.5f} uS ({cfg.backgroundRate[pop]} Hz x {cfg.backgroundWeight[pop]})")
+
+
+def add_background(netParams, cfg, log):
+    """Add the background drive selected by cfg.backgroundMode."""
+    if cfg.backgroundMode == 'netstim':
+        add_netstim_background(netParams, cfg, log)
+    elif cfg.backgroundMode == 'spikebank':
+        add_spikebank_background(netParams, cfg, log)
+    elif cfg.backgroundMode == 'gfluct':
+        add_gfluct_background(netParams, cfg, log)
+    else:
+        raise ValueError(f"Unknown backgroundMode '{cfg.backgroundMode}' "
+                         f"(expected one of {BACKGROUND_MODES})")
+
+
+def attach_gfluct_rngs(sim, seed):
+    """
+    Give every Gfluct2 its own normal Random123 stream, keyed on (gid, seed).
+
+    Without this Gfluct2 falls back to the shared normrand() stream, which is
+    not reproducible across MPI layouts.
+
+    Returns:
+        Number of Gfluct2 instances that received a stream
+    """
+    from neuron import h
+
+    count = 0
+    for cell in sim.net.cells:
+        for stim in getattr(cell, 'stims', []):
+            hobj = stim.get('hObj')
+            if stim.get('type') != 'Gfluct2' or hobj is None:
+                continue
+            rng = h.Random()
+            rng.Random123(cell.gid, 1, seed)
+            rng.normal(0, 1)
+            hobj.noiseFromRandom(rng)
+            _GFLUCT_RNGS.append(rng)
+            count += 1
+    return count
+
+
+def setup_background(sim, cfg):
+    """Post-create background setup (Gfluct2 RNG streams in 'gfluct' mode)."""
+    if not cfg.addBackground or cfg.backgroundMode != 'gfluct':
+        return 0
+
+    n = attach_gfluct_rngs(sim, cfg.seeds['stim'])
+    root_print(f"✓ Gfluct2 background: {n} Random123 noise streams")
+    return n
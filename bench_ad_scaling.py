@@ -0,0 +1,104 @@
+"""
+bench_ad_scaling.py
+Cost of applying the AD stage multipliers to one HL23PYR cell
+
+Builds HL23PYR cells with the healthy biophysics and times two ways of
+applying AD_STAGE_FACTORS[stage]:
+
+    per-segment:  getattr/setattr on every segment for every parameter
+                  (what apply_AD_changes_to_HL23PYR used to do)
+    section-wide: cellwrapper.scale_range_params, one assignment per section
+                  for parameters the template sets uniformly, one PtrVector
+                  gather/scatter for the distributed ones (apical Ih)
+
+Each timing is the best of REPEATS, each on a freshly built cell. The two
+results are then compared segment by segment.
+
+Usage:
+    nrnivmodl mod/          # once
+    python bench_ad_scaling.py [stage]
+"""
+
+import sys
+import time
+
+from neuron import h
+
+import cellwrapper
+
+STAGE = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+REPEATS = 5
+CELL = 'HL23PYR'
+TEMPLATE = 'NeuronTemplate_HL23PYR'
+
+
+def build():
+    """Healthy HL23PYR cell (morphology cache + biophys_HL23PYR)."""
+    cell = cellwrapper.instantiate_cell(TEMPLATE, f'morphologies/{CELL}.swc')
+    h.biophys_HL23PYR(cell)
+    return cell
+
+
+def scale_per_segment(seclist, factors):
+    """Reference: every segment read and written through getattr/setattr."""
+    for sec in seclist:
+        for mech_param, factor in factors.items():
+            mech, param = mech_param.split('.')
+            if not h.ismembrane(mech, sec=sec):
+                continue
+            name = f'{param}_{mech}'
+            for seg in sec:
+                setattr(seg, name, getattr(seg, name) * factor)
+
+
+def scale_section_wide(seclist, factors):
+    cellwrapper.scale_range_params(seclist, factors,
+                                   cellwrapper.distributed_params(f'models/biophys_{CELL}.hoc'))
+
+
+def timed(scale, factors):
+    best = float('inf')
+    cell = None
+    for _ in range(REPEATS):
+        cell = build()
+        t0 = time.perf_counter()
+        scale(cell.all, factors)
+        best = min(best, time.perf_counter() - t0)
+    return best, cell
+
+
+def range_values(cell, factors):
+    values = []
+    for sec in cell.all:
+        for mech_param in factors:
+            mech, param = mech_param.split('.')
+            if h.ismembrane(mech, sec=sec):
+                values.extend(getattr(seg, f'{param}_{mech}') for seg in sec)
+    return values
+
+
+if __name__ == '__main__':
+    cellwrapper.load_cell_files(CELL, TEMPLATE)
+    factors = cellwrapper.AD_STAGE_FACTORS[STAGE]
+
+    probe = build()
+    n_sec = sum(1 for _ in probe.all)
+    n_seg = sum(sec.nseg for sec in probe.all)
+    print("\n" + "="*70)
+    print(f"AD SCALING BENCHMARK: {CELL}, stage {STAGE}, {n_sec} sections, {n_seg} segments")
+    print("="*70)
+
+    t_seg, cell_seg = timed(scale_per_segment, factors)
+    t_sec, cell_sec = timed(scale_section_wide, factors)
+
+    a, b = range_values(cell_seg, factors), range_values(cell_sec, factors)
+    max_rel = max((abs(x - y) / abs(x) for x, y in zip(a, b) if x), default=0.0)
+
+    print(f"per-segment:  {1e3 * t_seg:8.3f} ms")
+    print(f"section-wide: {1e3 * t_sec:8.3f} ms  ({t_seg / t_sec:.1f}x)")
+    print("-"*70)
+    if len(a) == len(b) and max_rel <= 1e-12:
+        print(f"✓ Same {len(a)} range values (max relative difference {max_rel:.1e})")
+    else:
+        print(f"✗ Range values differ ({len(a)} vs {len(b)}, max relative difference {max_rel:.1e})")
+        sys.exit(1)
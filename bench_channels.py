@@ -0,0 +1,114 @@
+"""
+bench_channels.py
+Per-segment cost of each channel mechanism with analytic vs tabulated rates
+
+Needs the tabulated-rates build (channel_tables.py). For every mechanism, one
+cable with N_SEG segments is simulated with only pas, then with pas + the
+mechanism, once with usetable_<SUFFIX> = 0 (analytic) and once with 1 (tables):
+
+    cost per segment and step = (run time - pas-only run time) / (n_seg * n_steps)
+
+A small sinusoidal current keeps the membrane moving so the rates see a
+range of voltages rather than one value.
+
+Usage:
+    python channel_tables.py && nrnivmodl mod_tables/    # once
+    python bench_channels.py [n_seg] [tstop_ms]
+"""
+
+import sys
+import time
+
+from neuron import h
+
+import channel_tables
+
+h.load_file('stdrun.hoc')
+
+N_SEG = int(sys.argv[1]) if len(sys.argv) > 1 else 2001
+TSTOP = float(sys.argv[2]) if len(sys.argv) > 2 else 500.0
+REPEATS = 3
+
+
+def build(mech=None):
+    """Cable with N_SEG segments, pas (+ mech) and a sinusoidal drive at the middle."""
+    cable = h.Section(name='cable')
+    cable.L = 2000
+    cable.diam = 2
+    cable.nseg = N_SEG
+    cable.insert('pas')
+    if mech is not None:
+        cable.insert(mech)
+        for seg in cable:
+            setattr(seg, f'gbar_{mech}', 1e-5)
+
+    clamp = h.IClamp(cable(0.5))
+    clamp.dur = 1e9
+    t_vec = h.Vector().indgen(0, TSTOP, 1.0)
+    amp_vec = t_vec.c().mul(2 * 3.141592653589793 / 100.0).apply('sin').mul(0.5)    # 10 Hz, 0.5 nA
+    amp_vec.play(clamp._ref_amp, t_vec, 1)
+    return {'cable': cable, 'clamp': clamp, 'vecs': (t_vec, amp_vec)}
+
+
+def timed_run(tstop):
+    best = float('inf')
+    for _ in range(REPEATS):
+        h.finitialize(-70)
+        t0 = time.perf_counter()
+        h.continuerun(tstop)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench(mech, baseline):
+    objs = build(mech)
+    n_steps = TSTOP / h.dt
+
+    times = {}
+    for label, use in [('analytic', 0), ('tables', 1)]:
+        channel_tables.set_channel_tables(use, [mech])
+        times[label] = timed_run(TSTOP)
+    del objs
+
+    return {
+        'analytic_s': times['analytic'],
+        'tables_s': times['tables'],
+        'analytic_ns': 1e9 * max(times['analytic'] - baseline, 0.0) / (N_SEG * n_steps),
+        'tables_ns': 1e9 * max(times['tables'] - baseline, 0.0) / (N_SEG * n_steps),
+    }
+
+
+if __name__ == '__main__':
+    mechs = channel_tables.tabulated_mechs()
+    if not mechs:
+        print("✗ ERROR: tabulated-rates build not loaded")
+        print("   Run: python channel_tables.py && nrnivmodl mod_tables/")
+        sys.exit(1)
+
+    h.dt = 0.025
+    h.celsius = 34
+    manifest = channel_tables.load_manifest()
+    print("\n" + "="*70)
+    print(f"CHANNEL BENCHMARK: {N_SEG} segments, {TSTOP} ms, dt={h.dt} ms"
+          + (f", tables dv={manifest['dv']:g} mV" if manifest else ""))
+    print("="*70)
+
+    objs = build()
+    baseline = timed_run(TSTOP)
+    del objs
+    print(f"pas only: {baseline:.3f} s")
+    print(f"{'mechanism':<10}{'analytic (s)':>14}{'tables (s)':>12}{'ns/seg/step':>20}{'speedup':>9}")
+
+    total = {'analytic_ns': 0.0, 'tables_ns': 0.0}
+    for mech in mechs:
+        r = bench(mech, baseline)
+        speedup = r['analytic_ns'] / r['tables_ns'] if r['tables_ns'] > 0 else float('inf')
+        print(f"{mech:<10}{r['analytic_s']:>14.3f}{r['tables_s']:>12.3f}"
+              f"{r['analytic_ns']:>10.1f} -> {r['tables_ns']:<6.1f}{speedup:>8.2f}x")
+        total['analytic_ns'] += r['analytic_ns']
+        total['tables_ns'] += r['tables_ns']
+
+    print("-"*70)
+    if total['tables_ns'] > 0:
+        print(f"All mechanisms: {total['analytic_ns']:.1f} -> {total['tables_ns']:.1f} ns/seg/step "
+              f"({total['analytic_ns'] / total['tables_ns']:.2f}x)")
@@ -0,0 +1,132 @@
+"""
+bench_synapses.py
+Per-event and per-step cost of the synapse models used by synapses.py
+
+Drives N synapses of each type on a single passive compartment with regular
+NetStims (30 Hz by default, the rTMS pulse rate) and compares the run time
+against the same model with the stimulators silenced:
+
+    per-step cost  = idle run time / (n_syn * n_steps)
+    per-event cost = (driven - idle) run time / n_events
+
+Usage:
+    nrnivmodl mod/          # once
+    python bench_synapses.py [n_syn] [rate_Hz] [tstop_ms]
+"""
+
+import sys
+import time
+
+from neuron import h
+
+h.load_file('stdrun.hoc')
+
+N_SYN = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+RATE_HZ = float(sys.argv[2]) if len(sys.argv) > 2 else 30.0
+TSTOP = float(sys.argv[3]) if len(sys.argv) > 3 else 2000.0
+REPEATS = 3
+
+# label -> (mechanism, parameters); the STP parameters are representative
+# values, the network takes them from Circuit_param.xls. NMDA is off, as in
+# the network by default, so ProbAMPANMDA and Exp2Syn (exc) have the same kinetics
+MODELS = {
+    'Exp2Syn (exc)': ('Exp2Syn', {'tau1': 0.3, 'tau2': 3.0, 'e': 0}),
+    'ProbAMPANMDA': ('ProbAMPANMDA', {'tau_r_AMPA': 0.3, 'tau_d_AMPA': 3.0, 'tau_r_NMDA': 2.0,
+                                      'tau_d_NMDA': 65.0, 'e': 0, 'Use': 0.5, 'Dep': 670.0,
+                                      'Fac': 17.0, 'u0': 0, 'gmax': 1.0,
+                                      'weight_factor_NMDA': 0.0}),
+    'Exp2Syn (inh)': ('Exp2Syn', {'tau1': 1.0, 'tau2': 10.0, 'e': -80}),
+    'ProbUDFsyn': ('ProbUDFsyn', {'tau_r': 1.0, 'tau_d': 10.0, 'e': -80, 'Use': 0.25,
+                                  'Dep': 700.0, 'Fac': 20.0, 'u0': 0, 'gmax': 1.0}),
+}
+
+
+def build(mech, params, n_syn, rate_hz, seed=1234):
+    """Soma with n_syn synapses, each driven by its own regular NetStim."""
+    soma = h.Section(name='soma')
+    soma.L = soma.diam = 20
+    soma.insert('pas')
+
+    objs = {'soma': soma, 'syns': [], 'stims': [], 'ncs': [], 'rngs': []}
+    for i in range(n_syn):
+        syn = getattr(h, mech)(soma(0.5))
+        for key, value in params.items():
+            setattr(syn, key, value)
+        if hasattr(syn, 'setRNG'):
+            rng = h.Random()
+            rng.Random123(i, 0, seed)
+            rng.uniform(0, 1)
+            syn.setRNG(rng)
+            objs['rngs'].append(rng)
+
+        stim = h.NetStim()
+        stim.interval = 1000.0 / rate_hz
+        stim.start = stim.interval * i / n_syn    # stagger the trains
+        stim.noise = 0
+        stim.number = 1e9
+
+        nc = h.NetCon(stim, syn)
+        nc.weight[0] = 1e-5
+        nc.delay = 0.5
+
+        objs['syns'].append(syn)
+        objs['stims'].append(stim)
+        objs['ncs'].append(nc)
+    return objs
+
+
+def timed_run(tstop):
+    best = float('inf')
+    for _ in range(REPEATS):
+        h.finitialize(-70)
+        t0 = time.perf_counter()
+        h.continuerun(tstop)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench(mech, params):
+    objs = build(mech, params, N_SYN, RATE_HZ)
+
+    for stim in objs['stims']:
+        stim.number = 0
+    idle = timed_run(TSTOP)
+
+    for stim in objs['stims']:
+        stim.number = 1e9
+    driven = timed_run(TSTOP)
+
+    n_steps = TSTOP / h.dt
+    n_events = sum(int(max(0.0, TSTOP - 0.5 - stim.start) / stim.interval) + 1 for stim in objs['stims'])
+    return {
+        'idle_s': idle,
+        'driven_s': driven,
+        'step_ns': 1e9 * idle / (N_SYN * n_steps),
+        'event_us': 1e6 * max(driven - idle, 0.0) / n_events,
+        'n_events': n_events,
+    }
+
+
+if __name__ == '__main__':
+    missing = [mech for mech, _ in MODELS.values() if not hasattr(h, mech)]
+    if missing:
+        print(f"✗ ERROR: mechanisms not loaded: {sorted(set(missing))}")
+        print("   Run: nrnivmodl mod/")
+        sys.exit(1)
+
+    h.dt = 0.025
+    print("\n" + "="*70)
+    print(f"SYNAPSE BENCHMARK: {N_SYN} synapses @ {RATE_HZ} Hz, {TSTOP} ms, dt={h.dt} ms")
+    print("="*70)
+    print(f"{'model':<16}{'idle (s)':>10}{'driven (s)':>12}{'ns/syn/step':>14}{'us/event':>11}")
+
+    results = {}
+    for label, (mech, params) in MODELS.items():
+        results[label] = r = bench(mech, params)
+        print(f"{label:<16}{r['idle_s']:>10.3f}{r['driven_s']:>12.3f}{r['step_ns']:>14.1f}{r['event_us']:>11.2f}")
+
+    print("-"*70)
+    for stp, base in [('ProbAMPANMDA', 'Exp2Syn (exc)'), ('ProbUDFsyn', 'Exp2Syn (inh)')]:
+        print(f"{stp} vs {base}: "
+              f"{results[stp]['driven_s'] / results[base]['driven_s']:.2f}x total, "
+              f"{results[stp]['step_ns'] / results[base]['step_ns']:.2f}x per step")
@@ -2,9 +2,219 @@
 cellwrapper.py
 """
 
+import re
 import sys
 import os
 
+from parallel import root_print
+
+
+# HOC files (templates, biophysics, stdlib) already loaded in this process.
+# NEURON keeps templates and procs for the process lifetime, so each file is
+# read and parsed only once no matter how many cells are instantiated.
+_LOADED_HOC_FILES = set()
+
+
+def load_hoc_once(path, template=None):
+    """
+    Load a HOC file unless this process has already loaded it.
+
+    Args:
+        path: HOC file (stdlib names such as 'stdrun.hoc' go through h.load_file)
+        template: Template defined by the file; if it already exists in HOC the
+            file is marked as loaded without re-opening it
+
+    Returns:
+        True if the file was read, False if it was already loaded
+    """
+    from neuron import h
+
+    key = path if not os.path.exists(path) else os.path.abspath(path)
+    if key in _LOADED_HOC_FILES:
+        return False
+
+    if template is not None and hasattr(h, template):
+        _LOADED_HOC_FILES.add(key)
+        return False
+
+    if os.path.exists(path):
+        h.xopen(path)
+    else:
+        h.load_file(path)
+    _LOADED_HOC_FILES.add(key)
+    return True
+
+
+def load_cell_files(cellName, template):
+    """Load the NEURON libraries, biophysics and template needed for cellName (once per process)."""
+    load_hoc_once('stdrun.hoc')
+    load_hoc_once('import3d.hoc')
+    load_hoc_once('models/biophys_' + cellName + '.hoc')
+    load_hoc_once('models/' + template + '.hoc', template=template)
+
+
+# Build cell morphologies from the pre-parsed .npz cache (morphology_cache.py)
+USE_MORPHOLOGY_CACHE = True
+
+
+def instantiate_cell(template, morphpath):
+    """
+    Create a template cell, importing its SWC through the morphology cache.
+
+    Args:
+        template (str): HOC template name (e.g. 'NeuronTemplate_HL23PYR')
+        morphpath (str): SWC file
+
+    Returns:
+        NEURON cell object with morphology, nseg and replaced axon (no biophysics yet)
+    """
+    from neuron import h
+
+    if not USE_MORPHOLOGY_CACHE:
+        return getattr(h, template)(morphpath)
+
+    import morphology_cache
+
+    cell = getattr(h, template)(morphpath, 1)
+    morphology_cache.build_morphology(cell, morphpath)
+    cell.post_morphology()
+    return cell
+
+
+# AD stage multipliers: stage -> {'mechanism.param': factor}
+AD_STAGE_FACTORS = {
+    # STAGE 1: HYPEREXCITABILITY
+    # Goal: Clear firing rate increase vs Healthy (2.6 Hz → 3.5-4 Hz)
+    1: {
+        'NaTg.gbar': 1.25,   # +25% sodium (easier spike initiation)
+        'Nap.gbar': 1.30,    # +30% persistent sodium (sustained depolarization)
+        'Kv3_1.gbar': 0.65,  # -35% Kv3.1 (broader spikes)
+        'SK.gbar': 0.55,     # -45% SK (less adaptation)
+        'K_T.gbar': 0.70,    # -30% transient K
+        'Ih.gbar': 0.65,     # -35% Ih (less hyperpolarization-activated rebound)
+    },
+    # STAGE 2: IMPAIRED / PARTIAL HYPO
+    # Goal: Reduced firing vs Healthy (2.6 Hz → 1.5-2 Hz), altered dynamics
+    2: {
+        'NaTg.gbar': 1.10,   # +10% (reduced from Stage 1's +25%)
+        'Nap.gbar': 1.05,    # +5% (reduced from Stage 1's +30%)
+        'Kv3_1.gbar': 0.45,  # -55% (worse than Stage 1's -35%)
+        'SK.gbar': 0.35,     # -65% (worse than Stage 1's -45%)
+        'K_T.gbar': 0.50,    # -50%
+        'Ih.gbar': 0.45,     # -55% (worse than Stage 1)
+        'pas.g': 1.15,       # +15% leak conductance (harder to maintain Vm)
+    },
+    # STAGE 3: DEPOLARIZATION BLOCK PRONE
+    # Goal: Steep early F-I slope followed by depolarization block
+    # Mechanism: Excessive NaP + severe repolarization deficit → sustained depolarization → Na inactivation
+    3: {
+        'NaTg.gbar': 1.20,   # +20% transient sodium
+        'Nap.gbar': 1.60,    # +60% persistent sodium (AGGRESSIVE)
+        'Kv3_1.gbar': 0.30,  # -70% Kv3.1 (critical repolarization deficit)
+        'SK.gbar': 0.25,     # -75% SK (minimal adaptation)
+        'K_T.gbar': 0.40,    # -60% transient K
+        'Ih.gbar': 0.30,     # -70% Ih
+        'pas.g': 1.20,       # +20% leak
+    },
+}
+
+AD_STAGE_LABELS = {
+    1: 'hyperexcitability',
+    2: 'impaired/hypo',
+    3: 'depolarization-block-prone',
+}
+
+
+# distribute_channels("<sections>","<param>_<mech>",<type>,<offset>,<slope>,...)
+_DISTRIBUTE_RE = re.compile(r'distribute_channels\(\s*"([^"]+)"\s*,\s*"(\w+)"\s*,\s*(\d+)\s*,\s*([^,]+),\s*([^,]+),')
+
+_DISTRIBUTED_PARAMS = {}
+
+
+def distributed_params(biophys_path):
+    """
+    Range parameters a biophysics file sets segment by segment.
+
+    distribute_channels() writes one value per segment; the value is the same
+    along the section only for a linear distribution (type 0) with zero
+    slope, the form used for every somatic and axonal channel. Everything
+    else (e.g. the exponential Ih gradient along 'apic') is distributed.
+    Parameters set by plain forsec assignments are always uniform.
+
+    Args:
+        biophys_path: biophys_<cell>.hoc file (parsed once per process)
+
+    Returns:
+        {'mechanism.param': [forsec section-name patterns]}
+    """
+    if biophys_path in _DISTRIBUTED_PARAMS:
+        return _DISTRIBUTED_PARAMS[biophys_path]
+
+    with open(biophys_path) as f:
+        text = f.read()
+
+    params = {}
+    for secs, range_name, dist_type, _, slope in _DISTRIBUTE_RE.findall(text):
+        if int(dist_type) == 0 and float(slope) == 0.0:
+            continue
+        param, mech = range_name.split('_', 1)
+        params.setdefault(f'{mech}.{param}', []).append(secs)
+
+    _DISTRIBUTED_PARAMS[biophys_path] = params
+    return params
+
+
+def scale_range_params(seclist, factors, distributed=None):
+    """
+    Multiply range parameters, section-wide wherever the template sets one value.
+
+    Uniformity comes from the biophysics template (distributed_params), not
+    from the segments: a section holding a uniform parameter gets one read at
+    its centre and one sec.<param>_<mech> assignment for all its segments.
+    The distributed parameters (sections matched as forsec matches them) are
+    gathered through one PtrVector per parameter, scaled as a Vector and
+    scattered back.
+
+    Args:
+        seclist: Iterable of NEURON sections (e.g. cell.all)
+        factors: {'mechanism.param': factor}
+        distributed: {'mechanism.param': [section-name patterns]}, e.g. from
+            distributed_params(); None = every parameter is uniform
+
+    Returns:
+        {'mechanism.param': number of segments scaled}
+    """
+    from neuron import h
+
+    distributed = distributed or {}
+    counts = {mech_param: 0 for mech_param in factors}
+    pointers = {mech_param: [] for mech_param in factors}
+
+    for sec in seclist:
+        sec_name = sec.name()
+        for mech_param, factor in factors.items():
+            mech, param = mech_param.split('.')
+            if not h.ismembrane(mech, sec=sec):
+                continue
+            name = f'{param}_{mech}'
+            if any(re.search(pattern, sec_name) for pattern in distributed.get(mech_param, ())):
+                pointers[mech_param].extend(getattr(seg, f'_ref_{name}') for seg in sec)
+            else:
+                setattr(sec, name, getattr(sec(0.5), name) * factor)
+            counts[mech_param] += sec.nseg
+
+    for mech_param, refs in pointers.items():
+        if not refs:
+            continue
+        ptrs = h.PtrVector(len(refs))
+        for i, ref in enumerate(refs):
+            ptrs.pset(i, ref)
+        values = h.Vector(len(refs))
+        ptrs.gather(values)
+        ptrs.scatter(values.mul(factors[mech_param]))
+
+    return counts
+
 
 def apply_AD_changes_to_HL23PYR(cell, ad_stage):
     """
@@ -12,6 +222,7 @@ def apply_AD_changes_to_HL23PYR(cell, ad_stage):
 
     This function modifies ion channel conductances post-hoc to implement
     stage-dependent AD pathophysiology with clear network-level effects.
+    The multipliers for each stage live in AD_STAGE_FACTORS.
 
     AD Stage 1 (Early Hyperexcitability):
     - Target: Increased PYR firing (~3.5-4 Hz vs ~2.6 Hz Healthy)
@@ -23,100 +234,23 @@ def apply_AD_changes_to_HL23PYR(cell, ad_stage):
     - Mechanism: Membrane dysfunction, network inhibition dominance
     - Changes: Partial NaTg recovery, severe Kv3.1/SK/Ih loss, increased leak
 
+    AD Stage 3 (Depolarization Block Prone):
+    - Mechanism: Excessive NaP + severe repolarization deficit
+    - Changes: ↑↑Nap, extreme Kv3.1/SK/K_T/Ih loss, increased leak
+
     Args:
         cell: NEURON cell object (HL23PYR)
-        ad_stage: 1 (early hyperexcitability) or 2 (impaired/hypo)
+        ad_stage: 1 (early hyperexcitability), 2 (impaired/hypo) or 3 (depolarization block)
     """
+    if ad_stage not in AD_STAGE_FACTORS:
+        return
+
+    factors = AD_STAGE_FACTORS[ad_stage]
+    scale_range_params(cell.all, factors, distributed_params('models/biophys_HL23PYR.hoc'))
 
-    if ad_stage == 1:
-        # STAGE 1: HYPEREXCITABILITY
-        # Goal: Clear firing rate increase vs Healthy (2.6 Hz → 3.5-4 Hz)
-
-        for sec in cell.all:
-            for seg in sec:
-                # Increase excitability: boost Nav channels
-                if hasattr(seg, 'NaTg'):
-                    seg.NaTg.gbar *= 1.25  # +25% sodium (easier spike initiation)
-                if hasattr(seg, 'Nap'):
-                    seg.Nap.gbar *= 1.30   # +30% persistent sodium (sustained depolarization)
-
-                # Reduce repolarization: cut K+ channels
-                if hasattr(seg, 'Kv3_1'):
-                    seg.Kv3_1.gbar *= 0.65  # -35% Kv3.1 (broader spikes)
-                if hasattr(seg, 'SK'):
-                    seg.SK.gbar *= 0.55     # -45% SK (less adaptation)
-                if hasattr(seg, 'K_T'):
-                    seg.K_T.gbar *= 0.70    # -30% transient K
-
-                # Reduce Ih (less stabilization)
-                if hasattr(seg, 'Ih'):
-                    seg.Ih.gbar *= 0.65     # -35% Ih (less hyperpolarization-activated rebound)
-
-        print(f"  [AD Stage 1] Applied hyperexcitability changes:")
-        print(f"    NaTg: ×1.25, Nap: ×1.30, Kv3.1: ×0.65, SK: ×0.55, Ih: ×0.65")
-
-    elif ad_stage == 2:
-        # STAGE 2: IMPAIRED / PARTIAL HYPO
-        # Goal: Reduced firing vs Healthy (2.6 Hz → 1.5-2 Hz), altered dynamics
-
-        for sec in cell.all:
-            for seg in sec:
-                # Partial Nav recovery (less excitable than Stage 1)
-                if hasattr(seg, 'NaTg'):
-                    seg.NaTg.gbar *= 1.10  # +10% (reduced from Stage 1's +25%)
-                if hasattr(seg, 'Nap'):
-                    seg.Nap.gbar *= 1.05   # +5% (reduced from Stage 1's +30%)
-
-                # Severe K+ channel loss (worse than Stage 1)
-                if hasattr(seg, 'Kv3_1'):
-                    seg.Kv3_1.gbar *= 0.45  # -55% (worse than Stage 1's -35%)
-                if hasattr(seg, 'SK'):
-                    seg.SK.gbar *= 0.35     # -65% (worse than Stage 1's -45%)
-                if hasattr(seg, 'K_T'):
-                    seg.K_T.gbar *= 0.50    # -50%
-
-                # Further Ih reduction
-                if hasattr(seg, 'Ih'):
-                    seg.Ih.gbar *= 0.45     # -55% (worse than Stage 1)
-
-                # Increased leak (membrane dysfunction)
-                if hasattr(seg, 'pas'):
-                    seg.pas.g *= 1.15       # +15% leak conductance (harder to maintain Vm)
-
-        print(f"  [AD Stage 2] Applied impaired/hypo changes:")
-        print(f"    NaTg: ×1.10, Nap: ×1.05, Kv3.1: ×0.45, SK: ×0.35, Ih: ×0.45, g_pas: ×1.15")
-
-    elif ad_stage == 3:
-        # STAGE 3: DEPOLARIZATION BLOCK PRONE
-        # Goal: Steep early F-I slope followed by depolarization block
-        # Mechanism: Excessive NaP + severe repolarization deficit → sustained depolarization → Na inactivation
-
-        for sec in cell.all:
-            for seg in sec:
-                # Aggressive NaP increase (drives sustained depolarization)
-                if hasattr(seg, 'NaTg'):
-                    seg.NaTg.gbar *= 1.20  # +20% transient sodium
-                if hasattr(seg, 'Nap'):
-                    seg.Nap.gbar *= 1.60   # +60% persistent sodium (AGGRESSIVE)
-
-                # Extreme K+ channel loss (unable to repolarize)
-                if hasattr(seg, 'Kv3_1'):
-                    seg.Kv3_1.gbar *= 0.30  # -70% Kv3.1 (critical repolarization deficit)
-                if hasattr(seg, 'SK'):
-                    seg.SK.gbar *= 0.25     # -75% SK (minimal adaptation)
-                if hasattr(seg, 'K_T'):
-                    seg.K_T.gbar *= 0.40    # -60% transient K
-
-                # Severe Ih reduction (no hyperpolarization rebound)
-                if hasattr(seg, 'Ih'):
-                    seg.Ih.gbar *= 0.30     # -70% Ih
-
-                # Further increased leak
-                if hasattr(seg, 'pas'):
-                    seg.pas.g *= 1.20       # +20% leak
-
-        print(f"  [AD Stage 3] Applied depolarization-block-prone changes:")
-        print(f"    NaTg: ×1.20, Nap: ×1.60, Kv3.1: ×0.30, SK: ×0.25, Ih: ×0.30, g_pas: ×1.20")
+    summary = ', '.join(f"{mech_param.split('.')[0]}: ×{factor:.2f}" for mech_param, factor in factors.items())
+    root_print(f"  [AD Stage {ad_stage}] Applied {AD_STAGE_LABELS[ad_stage]} changes:")
+    root_print(f"    {summary}")
 
 
 def loadCell_HL23PYR(cellName, ad=False, ad_stage=None):
@@ -131,101 +265,65 @@ def loadCell_HL23PYR(cellName, ad=False, ad_stage=None):
     Returns:
         NEURON cell object
     """
-    templatepath = 'models/NeuronTemplate_HL23PYR.hoc'
     morphpath = 'morphologies/' + cellName + '.swc'
-    biophysics = 'models/biophys_' + cellName + '.hoc'  # Always load healthy baseline
 
     from neuron import h
-    h.load_file("stdrun.hoc")
-    h.load_file('import3d.hoc')
-    h.xopen(biophysics)
-
-    try:
-       h.xopen(templatepath)
-    except:
-        pass
+    load_cell_files(cellName, 'NeuronTemplate_HL23PYR')  # Always load healthy baseline
 
-    cell = getattr(h, 'NeuronTemplate_HL23PYR')(morphpath)
+    cell = instantiate_cell('NeuronTemplate_HL23PYR', morphpath)
     h.biophys_HL23PYR(cell)  # Apply healthy baseline first
 
     # Apply AD changes if requested (Python-side post-hoc modification)
     if ad:
         stage = ad_stage if ad_stage is not None else 1
-        print(f"[AD STAGE {stage}] Applying Python-side AD parameter changes to {cellName}")
+        root_print(f"[AD STAGE {stage}] Applying Python-side AD parameter changes to {cellName}")
         apply_AD_changes_to_HL23PYR(cell, stage)
 
         # Print post-AD conductances for verification
-        print(f"  Post-AD verification:")
-        print(f"    Kv3.1 gbar (soma): {cell.soma[0](0.5).gbar_Kv3_1:.6f}")
-        print(f"    SK gbar (soma): {cell.soma[0](0.5).gbar_SK:.8f}")
-        print(f"    NaTg gbar (axon): {cell.axon[0](0.5).gbar_NaTg:.6f}")
+        root_print(f"  Post-AD verification:")
+        root_print(f"    Kv3.1 gbar (soma): {cell.soma[0](0.5).gbar_Kv3_1:.6f}")
+        root_print(f"    SK gbar (soma): {cell.soma[0](0.5).gbar_SK:.8f}")
+        root_print(f"    NaTg gbar (axon): {cell.axon[0](0.5).gbar_NaTg:.6f}")
     else:
-        print(f"[HEALTHY] Loading {cellName} with healthy baseline biophysics")
-        print(f"  Kv3.1 gbar (soma): {cell.soma[0](0.5).gbar_Kv3_1:.6f}")
-        print(f"  SK gbar (soma): {cell.soma[0](0.5).gbar_SK:.8f}")
-        print(f"  NaTg gbar (axon): {cell.axon[0](0.5).gbar_NaTg:.6f}")
+        root_print(f"[HEALTHY] Loading {cellName} with healthy baseline biophysics")
+        root_print(f"  Kv3.1 gbar (soma): {cell.soma[0](0.5).gbar_Kv3_1:.6f}")
+        root_print(f"  SK gbar (soma): {cell.soma[0](0.5).gbar_SK:.8f}")
+        root_print(f"  NaTg gbar (axon): {cell.axon[0](0.5).gbar_NaTg:.6f}")
 
     return cell
 
 
 def loadCell_HL23VIP(cellName):
-    templatepath = 'models/NeuronTemplate_HL23VIP.hoc'
-    biophysics = 'models/biophys_' + cellName + '.hoc'
     morphpath = 'morphologies/' + cellName + '.swc'
     
     from neuron import h
-    h.load_file("stdrun.hoc")
-    h.load_file('import3d.hoc')
-    h.xopen(biophysics)
-        
-    try:
-       h.xopen(templatepath)
-    except:
-        pass
+    load_cell_files(cellName, 'NeuronTemplate_HL23VIP')
     
-    cell = getattr(h, 'NeuronTemplate_HL23VIP')(morphpath)
-    print(cell)
+    cell = instantiate_cell('NeuronTemplate_HL23VIP', morphpath)
+    root_print(cell)
     h.biophys_HL23VIP(cell)
     return cell
 
 
 def loadCell_HL23PV(cellName):
-    templatepath = 'models/NeuronTemplate_HL23PV.hoc'
-    biophysics = 'models/biophys_' + cellName + '.hoc'
     morphpath = 'morphologies/' + cellName + '.swc'
     
     from neuron import h
-    h.load_file("stdrun.hoc")
-    h.load_file('import3d.hoc')
-    h.xopen(biophysics)
-        
-    try:
-       h.xopen(templatepath)
-    except:
-        pass
+    load_cell_files(cellName, 'NeuronTemplate_HL23PV')
     
-    cell = getattr(h, 'NeuronTemplate_HL23PV')(morphpath)
-    print(cell)
+    cell = instantiate_cell('NeuronTemplate_HL23PV', morphpath)
+    root_print(cell)
     h.biophys_HL23PV(cell)
     return cell
 
 
 def loadCell_HL23SST(cellName):
-    templatepath = 'models/NeuronTemplate_HL23SST.hoc'
-    biophysics = 'models/biophys_' + cellName + '.hoc'
     morphpath = 'morphologies/' + cellName + '.swc'
     
     from neuron import h
-    h.load_file("stdrun.hoc")
-    h.load_file('import3d.hoc')
-    h.xopen(biophysics)
-        
-    try:
-       h.xopen(templatepath)
-    except:
-        pass
+    load_cell_files(cellName, 'NeuronTemplate_HL23SST')
     
-    cell = getattr(h, 'NeuronTemplate_HL23SST')(morphpath)
-    print(cell)
+    cell = instantiate_cell('NeuronTemplate_HL23SST', morphpath)
+    root_print(cell)
     h.biophys_HL23SST(cell)
     return cell
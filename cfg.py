@@ -35,8 +35,18 @@ cfg.createNEURONObj = True
 cfg.createPyStruct = True
 cfg.cvode_active = False
 cfg.cache_efficient = True
+# Channel rate lookup tables; only with the tabulated-rates build
+# (python channel_tables.py; nrnivmodl mod_tables/). False = analytic rates,
+# also with that build; opt in after checking test_channel_tables.py
+cfg.channelTables = False
 cfg.printRunTime = 0.1
 
+# MPI runs (mpiexec -n N python init.py, see parallel.py); ignored when serial
+cfg.mpiLeanGather = True            # Gather spikes/LFP/traces only (gatherOnlySimData)
+# Cell-to-rank assignment: 'roundrobin' (NetPyNE default), 'compartments'
+# (greedy bin packing by segment count) or 'complexity' (segments x mechanisms)
+cfg.loadBalance = 'complexity'
+
 cfg.includeParamsLabel = False
 cfg.printPopAvgRates = True
 cfg.checkErrors = False
@@ -53,11 +63,14 @@ cfg.tms_params = dict(
     stim_end_ms=3000.,                  # TMS stimulation ends (ms)
     ef_amp_V_per_m=60.,                 # Electric field strength (V/m)
     width_ms=1.0,                       # Pulse width (ms) - biphasic total duration
-    pshape="Sine",                      # Pulse shape
+    pshape="Sine",                      # Pulse shape: "Sine", "Biphasic" or "Monophasic"
+    engine="iclamp",                    # "iclamp" (somatic current) or "field" (extracellular, needs xtra.mod)
+    waveform_mode="shared",             # "shared" (one cached pulse train, scaled per amplitude) or "per_cell"
     decay_rate_percent_per_mm=10,       # Spatial decay rate
     E_field_dir=[-1, -1, -1],          # Field direction
     decay_dir=[0, 0, -1],              # Decay direction
     ref_point_um=[0, 0, 0],            # Reference point
+    field_cache_dir='.cache/tms_field', # On-disk cache of per-segment field coupling (None = off)
 )
 
 #------------------------------------------------------------------------------
@@ -86,6 +99,7 @@ cfg.cellNumber = {
 # Recording
 #------------------------------------------------------------------------------
 cfg.recordCells = [(pop, 0) for pop in cfg.allpops]  # Record first cell of each type
+cfg.recordCellsSpikes = cfg.allpops  # Network cells only (not the 'spikebank' VecStims)
 
 cfg.recordTraces = {
     'V_soma': {'sec': 'soma_0', 'loc': 0.5, 'var': 'v'},
@@ -102,6 +116,9 @@ cfg.simLabel = 'Yao_L23_100cell_AD_Stage2'
 cfg.saveFolder = 'output'
 cfg.savePickle = False
 cfg.saveJson = True
+# 'npy': columnar output directory <simLabel>_data/ (spikes, LFP, traces as
+# .npy + meta.json, see output_io.py); 'json': NetPyNE's single JSON file
+cfg.saveFormat = 'npy'
 cfg.saveDataInclude = ['simData', 'simConfig', 'netParams']
 cfg.backupCfgFile = None
 cfg.gatherOnlySimData = False
@@ -161,11 +178,31 @@ cfg.EIGain = 1.0    # E -> I
 cfg.IEGain = 1.0    # I -> E
 cfg.IIGain = 1.0    # I -> I
 
+# Synapse model for the pre+post connections (see synapses.py):
+# 'exp2syn' (deterministic, fastest) or 'stp' (ProbAMPANMDA/ProbUDFsyn with
+# Use/Depression/Facilitation from Circuit_param.xls)
+cfg.synMechMode = 'exp2syn'
+
+# 'stp' mode only: keep the NMDA conductance of ProbAMPANMDA. Off by default
+# so PYR inputs stay AMPA-only (0.3/3 ms), as with Exp2Syn
+cfg.stpNMDA = False
+
+# Share one Exp2Syn per (segment, kinetics) among all NetCons that target it.
+# Exact for linear synapses; STP synapses are left untouched.
+cfg.mergeSynapses = False
+
 #------------------------------------------------------------------------------
 # Background stimulation (NetStim inputs)
 #------------------------------------------------------------------------------
 cfg.addBackground = True
 
+# 'netstim':   Poisson NetStims generated inside the NEURON event loop
+# 'spikebank': Poisson trains precomputed with NumPy (seeded from
+#              cfg.seeds['stim']) and replayed by NEURON's built-in VecStims
+# 'gfluct':    one somatic Gfluct2 per cell with the same conductance mean/std
+#              as the NetStim drive (no background events at all)
+cfg.backgroundMode = 'netstim'
+
 # Background rates (Hz) for each cell type
 cfg.backgroundRate = {
     'HL23PYR': 100.0,
@@ -0,0 +1,309 @@
+"""
+channel_tables.py
+Tabulated-rates build of the channel mechanisms in mod/
+
+The rate procedures of the voltage-gated channels evaluate several exp() calls
+per segment per time step. This script writes a copy of mod/ to mod_tables/ in
+which those rates come from NMODL TABLE lookups (linear interpolation on a
+fixed voltage grid) instead:
+
+- 'voltage': rates(v) is tabulated in v directly (Nap, Kv3_1, K_T, K_P, Im,
+  Ca_HVA, Ca_LVA; Kv3_1's GLOBAL vshift is a TABLE DEPEND)
+- 'kernel': NaTg and Ih have per-section RANGE shifts/slopes (vshiftm,
+  slopem, ... are set per section in models/biophys_*.hoc), which a table
+  over v cannot depend on. Their alpha/beta terms are rewritten in terms of
+  efun(z) = z/(1 - exp(-z)) and only efun is tabulated (z = shifted v / slope)
+
+All other mod files are copied unchanged, so mod_tables/ is a complete build:
+
+    python channel_tables.py [dv_mV] [vmin_mV] [vmax_mV]    # default 0.1 -150 100
+    nrnivmodl mod_tables/                                     # instead of mod/
+
+Each tabulated mechanism gets NEURON's usetable_<SUFFIX> switch;
+setup_channel_tables() sets it from cfg.channelTables, so one build runs both
+the tables and the analytic rates (test_channel_tables.py, bench_channels.py).
+Outside [vmin, vmax] the table value at the nearest end is used.
+"""
+
+import json
+import os
+import re
+import shutil
+import sys
+
+from parallel import root_print
+
+
+TABLES_SRC_DIR = 'mod'
+TABLES_DIR = 'mod_tables'
+TABLES_MANIFEST = 'channel_tables.json'
+
+# Mechanism -> tabulation method (see module docstring)
+TABLE_MECHS = {
+    'NaTg': 'kernel',
+    'Nap': 'voltage',
+    'Kv3_1': 'voltage',
+    'K_T': 'voltage',
+    'K_P': 'voltage',
+    'Im': 'voltage',
+    'Ih': 'kernel',
+    'Ca_HVA': 'voltage',
+    'Ca_LVA': 'voltage',
+}
+
+# efun table: z range and the smallest slope (mV) z is scaled by, so the z step
+# corresponds to at most dv in voltage (NaTg slopes are 6-9 mV, Ih shift2 11.9 mV)
+EFUN_ZMAX = 60.0
+EFUN_MIN_SLOPE = 6.0
+
+# rates() bodies of the 'kernel' mechanisms. Algebraically identical to mod/,
+# e.g. 0.182*(v-c)/(1-exp(-(v-c)/s)) = 0.182*s*efun((v-c)/s); efun(0) = 1 is
+# the limit the original code approaches with its v + 0.0001 nudge.
+KERNEL_RATES = {
+    'NaTg': """
+  LOCAL qt
+  qt = 2.3^((34-21)/10)
+
+	UNITSOFF
+		mAlpha = 0.182 * slopem * efun((v - (-38+vshiftm))/slopem)
+		mBeta  = 0.124 * slopem * efun(-(v - (-38+vshiftm))/slopem)
+		mTau = (1/(mAlpha + mBeta))/qt
+		mInf = mAlpha/(mAlpha + mBeta)
+
+		hAlpha = 0.015 * slopeh * efun(-(v - (-66+vshifth))/slopeh)
+		hBeta  = 0.015 * slopeh * efun((v - (-66+vshifth))/slopeh)
+		hTau = (1/(hAlpha + hBeta))/qt
+		hInf = hAlpha/(hAlpha + hBeta)
+	UNITSON
+""",
+    'Ih': """
+	UNITSOFF
+				if(shift4 == 0){
+						shift4 = shift4 + 0.0001
+				}
+				if(shift2 == 0){
+						shift2 = shift2 + 0.0001
+				}
+		mAlpha =  0.001*(shift5)*(shift2)*efun(-(v+shift1)/(shift2))
+		mBeta  =  0.001*(shift6)*exp((v+shift3)/(shift4))
+		mInf = mAlpha/(mAlpha + mBeta)
+		mTau = 1/(mAlpha + mBeta)
+	UNITSON
+""",
+}
+
+EFUN_FUNCTION = """
+FUNCTION efun(z) {
+	TABLE FROM {zmin} TO {zmax} WITH {n}
+	if (fabs(z) < 1e-6) {
+		efun = 1 + z/2
+	} else {
+		efun = z/(1 - exp(-z))
+	}
+}
+"""
+
+
+def find_block(text, header):
+    """
+    (start, open, close) indices of the first block matching the header regex.
+
+    text[start:close + 1] is the whole block, text[open + 1:close] its body.
+    """
+    match = re.search(header, text)
+    if match is None:
+        raise ValueError(f"Block '{header}' not found")
+    open_ = text.index('{', match.start())
+    depth = 0
+    for i in range(open_, len(text)):
+        if text[i] == '{':
+            depth += 1
+        elif text[i] == '}':
+            depth -= 1
+            if depth == 0:
+                return match.start(), open_, i
+    raise ValueError(f"Unbalanced braces in block '{header}'")
+
+
+def block_body(text, header):
+    _, open_, close = find_block(text, header)
+    return text[open_ + 1:close]
+
+
+def parameter_names(text):
+    return re.findall(r'^\s*(\w+)\s*=', block_body(text, r'\bPARAMETER\s*\{'), flags=re.M)
+
+
+def range_names(text):
+    neuron = block_body(text, r'\bNEURON\s*\{')
+    names = []
+    for line in re.findall(r'\bRANGE\s+([^\n]+)', neuron):
+        names += [n.strip() for n in line.split(',')]
+    return names
+
+
+def rates_outputs(text):
+    """Variables assigned in rates() and used outside it (mInf, mTau, ...)."""
+    start, _, close = find_block(text, r'\bPROCEDURE\s+rates\s*\(\s*\)')
+    body = text[start:close + 1]
+    outside = text[:start] + text[close + 1:]
+    a_start, _, a_close = find_block(outside, r'\bASSIGNED\s*\{')
+    outside = outside[:a_start] + outside[a_close + 1:]
+
+    locals_ = re.findall(r'\bLOCAL\s+([\w\s,]+?)\s*$', body, flags=re.M)
+    locals_ = {n.strip() for line in locals_ for n in line.split(',')}
+    skip = {'v'} | locals_ | set(parameter_names(text))
+
+    outputs = []
+    for name in re.findall(r'\b([A-Za-z_]\w*)\s*=(?!=)', body):
+        if name not in skip and name not in outputs and re.search(rf'\b{name}\b', outside):
+            outputs.append(name)
+    return outputs
+
+
+def table_size(lo, hi, step):
+    return max(1, int(round((hi - lo) / step)))
+
+
+def tabulate_voltage(text, mech, vmin, vmax, dv):
+    """rates() -> rates(v) with a TABLE over v; v is copied to a LOCAL u inside."""
+    start, open_, close = find_block(text, r'\bPROCEDURE\s+rates\s*\(\s*\)')
+    body = text[open_ + 1:close]
+
+    deps = [p for p in parameter_names(text) if p != 'gbar' and re.search(rf'\b{p}\b', body)]
+    per_segment = [p for p in deps if p in range_names(text)]
+    if per_segment:
+        raise ValueError(f"{mech}: rates() depends on RANGE {per_segment}; "
+                         f"a voltage table cannot (use the 'kernel' method)")
+
+    locals_ = ['u']
+    local_line = re.search(r'^\s*LOCAL\s+([\w\s,]+?)\s*$', body, flags=re.M)
+    if local_line:
+        locals_ += [n.strip() for n in local_line.group(1).split(',')]
+        body = body[:local_line.start()] + body[local_line.end():]
+
+    # The original rates() shifts and nudges the global v in place; the
+    # tabulated one works on its own copy
+    body = re.sub(r'\bv\b', 'u', body)
+
+    depend = f" DEPEND {', '.join(deps)}" if deps else ""
+    table = (f"TABLE {', '.join(rates_outputs(text))}{depend} "
+             f"FROM {vmin:g} TO {vmax:g} WITH {table_size(vmin, vmax, dv)}")
+    rates = (f"PROCEDURE rates(v (mV)) {{\n"
+             f"\tLOCAL {', '.join(locals_)}\n"
+             f"\t{table}\n"
+             f"\tu = v\n"
+             f"{body.lstrip(chr(10))}}}")
+
+    text = text[:start] + rates + text[close + 1:]
+    return re.sub(r'\brates\s*\(\s*\)', 'rates(v)', text)
+
+
+def tabulate_kernel(text, mech, dv):
+    """Replace the rates() body with KERNEL_RATES[mech] and add the tabulated efun()."""
+    _, open_, close = find_block(text, r'\bPROCEDURE\s+rates\s*\(\s*\)')
+    text = text[:open_ + 1] + KERNEL_RATES[mech] + text[close:]
+
+    n = table_size(-EFUN_ZMAX, EFUN_ZMAX, dv / EFUN_MIN_SLOPE)
+    efun = EFUN_FUNCTION.replace('{zmin}', f"{-EFUN_ZMAX:g}").replace('{zmax}', f"{EFUN_ZMAX:g}")
+    return text.rstrip() + "\n" + efun.replace('{n}', str(n))
+
+
+def write_table_mods(dv=0.1, vmin=-150.0, vmax=100.0, src=TABLES_SRC_DIR, dst=TABLES_DIR):
+    """
+    Write the tabulated-rates build of src/ to dst/.
+
+    Args:
+        dv: Voltage resolution of the tables (mV)
+        vmin, vmax: Tabulated voltage range (mV)
+        src, dst: Source and output mod directories
+
+    Returns:
+        Manifest dict (also written to dst/channel_tables.json)
+    """
+    os.makedirs(dst, exist_ok=True)
+    manifest = {'dv': dv, 'vmin': vmin, 'vmax': vmax, 'mechs': {}}
+
+    for name in sorted(os.listdir(src)):
+        if not name.endswith('.mod'):
+            continue
+        mech = name[:-4]
+        src_path = os.path.join(src, name)
+        dst_path = os.path.join(dst, name)
+
+        if mech not in TABLE_MECHS:
+            shutil.copyfile(src_path, dst_path)
+            continue
+
+        with open(src_path) as f:
+            text = f.read()
+        method = TABLE_MECHS[mech]
+        outputs = rates_outputs(text)
+        if method == 'voltage':
+            tabled = tabulate_voltage(text, mech, vmin, vmax, dv)
+        else:
+            tabled = tabulate_kernel(text, mech, dv)
+
+        header = (f": Generated by channel_tables.py from {src_path} "
+                  f"({method} table, dv = {dv:g} mV) - edit the original, not this file\n")
+        with open(dst_path, 'w') as f:
+            f.write(header + tabled)
+        manifest['mechs'][mech] = {'method': method, 'outputs': outputs}
+
+    with open(os.path.join(dst, TABLES_MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_manifest(dst=TABLES_DIR):
+    """Manifest written by write_table_mods, or None."""
+    path = os.path.join(dst, TABLES_MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def tabulated_mechs():
+    """Loaded mechanisms that were built with tables (have usetable_<SUFFIX>)."""
+    from neuron import h
+    return [mech for mech in TABLE_MECHS if hasattr(h, f'usetable_{mech}')]
+
+
+def set_channel_tables(enabled, mechs=None):
+    """Switch the rate tables on or off (usetable_<SUFFIX>) for the given mechanisms."""
+    from neuron import h
+    for mech in (mechs if mechs is not None else tabulated_mechs()):
+        setattr(h, f'usetable_{mech}', 1 if enabled else 0)
+
+
+def setup_channel_tables(cfg):
+    """
+    Apply cfg.channelTables to a tabulated-rates build; no-op with the mod/ build.
+
+    Returns:
+        List of tabulated mechanisms found
+    """
+    mechs = tabulated_mechs()
+    if not mechs:
+        return mechs
+
+    set_channel_tables(cfg.channelTables, mechs)
+    manifest = load_manifest()
+    resolution = f", dv = {manifest['dv']:g} mV" if manifest else ""
+    state = 'on' if cfg.channelTables else 'off (analytic rates)'
+    root_print(f"✓ Channel rate tables {state}{resolution}: {', '.join(mechs)}")
+    return mechs
+
+
+if __name__ == '__main__':
+    dv = float(sys.argv[1]) if len(sys.argv) > 1 else 0.1
+    vmin = float(sys.argv[2]) if len(sys.argv) > 2 else -150.0
+    vmax = float(sys.argv[3]) if len(sys.argv) > 3 else 100.0
+
+    manifest = write_table_mods(dv, vmin, vmax)
+    print(f"✓ Wrote {TABLES_DIR}/ ({len(manifest['mechs'])} tabulated mechanisms, "
+          f"{vmin:g} to {vmax:g} mV, dv = {dv:g} mV)")
+    for mech, info in manifest['mechs'].items():
+        print(f"  {mech:<8}{info['method']:<9}{', '.join(info['outputs'])}")
+    print(f"\nBuild with: nrnivmodl {TABLES_DIR}/")
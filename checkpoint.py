@@ -0,0 +1,305 @@
+"""
+checkpoint.py
+Checkpoint the network just before the TMS onset and branch several protocols
+from it
+
+Every condition simulates the same pre-stimulus period (0 - stim_start_ms).
+run_warmup() simulates it once, up to one recordStep before the onset
+(checkpoint_time), and saves:
+- the full simulator state (h.SaveState: states, event queue including spikes
+  in flight and NetStim self-events, play/record positions)
+- the position of every h.Random stream (NetStim noise, STP synapses,
+  Gfluct2), which SaveState does not cover
+- the data recorded so far (spikes, traces; the LFP array keeps its prefix)
+  and references to the Vectors/arrays sim.simData records into
+
+run_branch() then restores that state and simulates the checkpoint to duration
+for one stimulation protocol; the recorded prefix is stitched back in front,
+so sim.simData looks like a full run and sim.gatherData()/sim.analyze() work
+unchanged. Each restore reinstalls the checkpoint's recording objects in
+sim.simData and clears the previous branch's data from them, so nothing
+depends on what gathering or saving a branch did to sim.simData.
+
+Usage (run_tms_branches wraps this loop):
+    sim.create(netParams, cfg)
+    applied = tms.apply_tms_from_params(sim, cfg)     # clamps must exist before warm-up
+    ckpt = checkpoint.run_warmup(sim, cfg)
+    for params in variants:
+        tms.replay_tms(applied, params, t_restore=ckpt['t'])
+        checkpoint.run_branch(sim, cfg, ckpt)
+        sim.gatherData(); sim.saveData(); output_io.save_data(sim, cfg)
+
+The model structure (cells, synapses, clamps, number of played vectors) must
+not change between the warm-up and the branches; only vector contents may.
+SaveState restores every play position (sample index and pending event), so
+each played time vector must also keep its samples up to and including the
+first one after the checkpoint (tms.check_replay_times, run by replay_tms
+when given t_restore); its length and later samples may change. Taken before
+the onset, that is only the onset sample itself, so branches may change the
+pulse width and shape as well as amplitude and frequency.
+test_checkpoint.py checks single and consecutive branches against a straight
+run.
+"""
+
+import numpy as np
+from neuron import h
+
+import output_io
+from parallel import root_print
+import tms
+
+
+# Event-list entries of simData; everything else recorded is sampled at recordStep
+SPIKE_KEYS = ['spkt', 'spkid']
+
+
+def random_streams():
+    """Every h.Random instance, in creation order."""
+    return list(h.List('Random'))
+
+
+def _snapshot(value):
+    """Copy a simData entry (Vector or dict of Vectors) to NumPy."""
+    if isinstance(value, dict):
+        copies = {k: _snapshot(v) for k, v in value.items()}
+        copies = {k: v for k, v in copies.items() if v is not None}
+        return copies or None
+    if hasattr(value, 'to_python'):
+        return np.array(value.to_python())
+    return None
+
+
+def snapshot_sim_data(sim):
+    """NumPy copies of the recorded spike and trace vectors in sim.simData."""
+    prefix = {}
+    for key, value in sim.simData.items():
+        copy = _snapshot(value)
+        if copy is not None:
+            prefix[key] = copy
+    return prefix
+
+
+def _stitch(value, prefix, drop_first):
+    """Write prefix + recorded branch data back into a Vector (or dict of Vectors)."""
+    if isinstance(value, dict):
+        for k, v in value.items():
+            if k in prefix:
+                _stitch(v, prefix[k], drop_first)
+        return
+    branch = np.array(value.to_python())
+    if drop_first:
+        branch = branch[1:]     # frecord_init sample at the checkpoint time, already in the prefix
+    value.from_python(np.concatenate([prefix, branch]))
+
+
+def _is_vector(value):
+    return hasattr(value, 'hname') and value.hname().startswith('Vector')
+
+
+def live_sim_data(sim):
+    """
+    The objects sim.simData records into: Vectors, dicts of Vectors and arrays (LFP).
+
+    Branches must keep running into these exact objects; references are kept
+    (dicts are copied one level deep) so they can be reinstalled by
+    restore_sim_data whatever sim.gatherData()/sim.saveData() did to sim.simData.
+    """
+    live = {}
+    for key, value in sim.simData.items():
+        if isinstance(value, dict):
+            entries = {k: v for k, v in value.items() if _is_vector(v) or isinstance(v, np.ndarray)}
+            if entries:
+                live[key] = entries
+        elif _is_vector(value) or isinstance(value, np.ndarray):
+            live[key] = value
+    return live
+
+
+def restore_sim_data(sim, ckpt):
+    """
+    Reinstall the recording objects of the checkpoint in sim.simData and clear
+    what a previous branch recorded: spike Vectors are emptied and array rows
+    (LFP samples) from the checkpoint time on are zeroed. Trace Vectors are
+    reset by h.frecord_init().
+    """
+    row = int(round(ckpt['t'] / sim.cfg.recordStep))
+
+    for key, value in ckpt['live'].items():
+        entries = value if isinstance(value, dict) else {None: value}
+        for k, entry in entries.items():
+            if isinstance(entry, np.ndarray):
+                entry[row:] = 0
+            elif not _is_vector(entry):
+                raise RuntimeError(f"simData['{key}']{'' if k is None else f'[{k}]'} is no longer "
+                                   f"a recording Vector; it cannot be restored")
+        sim.simData[key] = dict(value) if isinstance(value, dict) else value
+
+    for key in SPIKE_KEYS:
+        if key in sim.simData:
+            sim.simData[key].resize(0)
+
+
+def save_checkpoint(sim, label=None):
+    """
+    Save the current simulator state (call at the checkpoint time).
+
+    Returns:
+        dict with 'id', 't', 'state' (h.SaveState), 'rng_seq', 'prefix' and
+        'live' (live_sim_data)
+    """
+    state = h.SaveState()
+    state.save()
+
+    t = h.t
+    return {
+        'id': label or f"t{t:.0f}ms",
+        't': t,
+        'state': state,
+        'rng_seq': [rng.seq() for rng in random_streams()],
+        'prefix': snapshot_sim_data(sim),
+        'live': live_sim_data(sim),
+    }
+
+
+def checkpoint_time(cfg):
+    """
+    Default checkpoint time: one recordStep before the TMS onset.
+
+    The first played sample of every pulse train sits at stim_start_ms; a
+    checkpoint strictly before it leaves only that sample for
+    tms.check_replay_times to compare, whatever the width or shape of the
+    pulse. Staying on the recordStep grid keeps the LFP rows aligned.
+    """
+    return cfg.tms_params['stim_start_ms'] - cfg.recordStep
+
+
+def run_warmup(sim, cfg, t_checkpoint=None, label=None):
+    """
+    Simulate 0 - t_checkpoint through the normal NetPyNE run and checkpoint there.
+
+    Args:
+        sim: NetPyNE sim object (after sim.create and TMS setup)
+        cfg: SimConfig; cfg.duration is restored after the warm-up
+        t_checkpoint: Checkpoint time (ms), default checkpoint_time(cfg)
+        label: Checkpoint id recorded by the branches (default 't<ms>ms')
+
+    Returns:
+        Checkpoint dict (see save_checkpoint)
+    """
+    if t_checkpoint is None:
+        t_checkpoint = checkpoint_time(cfg)
+
+    duration = cfg.duration
+    cfg.duration = t_checkpoint
+    try:
+        sim.runSim()
+    finally:
+        cfg.duration = duration
+
+    ckpt = save_checkpoint(sim, label)
+    root_print(f"✓ Checkpoint '{ckpt['id']}' saved at t = {ckpt['t']:.1f} ms "
+          f"({len(ckpt['rng_seq'])} random streams)")
+    return ckpt
+
+
+def restore_checkpoint(sim, cfg, ckpt):
+    """
+    Restore a checkpoint: states, event queue, play/record positions, RNG
+    streams and the sim.simData recording objects (restore_sim_data).
+
+    Recorded spike vectors are emptied; trace vectors restart at the checkpoint time.
+    """
+    h.finitialize(float(cfg.hParams['v_init']))
+    ckpt['state'].restore()
+
+    streams = random_streams()
+    if len(streams) != len(ckpt['rng_seq']):
+        raise RuntimeError(f"Checkpoint '{ckpt['id']}' has {len(ckpt['rng_seq'])} random streams, "
+                           f"model now has {len(streams)}; the model changed since the warm-up")
+    for rng, seq in zip(streams, ckpt['rng_seq']):
+        rng.seq(seq)
+
+    restore_sim_data(sim, ckpt)
+    h.frecord_init()
+
+
+def run_branch(sim, cfg, ckpt, t_stop=None):
+    """
+    Simulate from a checkpoint to t_stop and stitch the warm-up data back in.
+
+    Apply the branch's stimulation (tms.replay_tms with t_restore=ckpt['t'])
+    before calling this.
+
+    Args:
+        sim: NetPyNE sim object
+        cfg: SimConfig
+        ckpt: Checkpoint from run_warmup
+        t_stop: End time (ms), default cfg.duration
+    """
+    if t_stop is None:
+        t_stop = cfg.duration
+
+    restore_checkpoint(sim, cfg, ckpt)
+    sim.pc.psolve(t_stop)
+
+    for key, prefix in ckpt['prefix'].items():
+        _stitch(sim.simData[key], prefix, drop_first=key not in SPIKE_KEYS)
+
+    cfg.checkpointId = ckpt['id']
+
+
+def variant_label(variant):
+    """File-name friendly label for a tms_params variant, e.g. 'ef_amp_V_per_m40_freq_Hz10'."""
+    return "_".join(f"{key}{value:g}" if isinstance(value, (int, float)) else f"{key}{value}"
+                    for key, value in variant.items())
+
+
+def run_tms_branches(sim, cfg, applied, variants, label):
+    """
+    Warm up once, then run and save one branch per tms_params variant.
+
+    Args:
+        sim: NetPyNE sim object (after sim.create)
+        cfg: SimConfig; cfg.tms_params is the base every variant overrides
+        applied: dict returned by tms.apply_tms_from_params
+        variants: List of dicts of tms_params overrides (e.g. amplitude/frequency)
+        label: Condition label; branches are saved as '<label>__<variant>'
+
+    Returns:
+        List of branch records: simLabel, variant, checkpoint id and time
+    """
+    base_params = dict(cfg.tms_params)
+    base_label = cfg.simLabel
+
+    ckpt = run_warmup(sim, cfg, label=f"{label}@{checkpoint_time(cfg):g}ms")
+
+    records = []
+    try:
+        for i, variant in enumerate(variants, 1):
+            params = dict(base_params, **variant)
+            onsets = tms.get_pulse_onsets(params)
+            if len(onsets) and onsets[0] < ckpt['t']:
+                raise ValueError(f"Variant {variant} starts at {onsets[0]} ms, before checkpoint "
+                                 f"'{ckpt['id']}' at {ckpt['t']} ms")
+
+            cfg.tms_params = params
+            cfg.simLabel = f"{label}__{variant_label(variant)}"
+            root_print(f"\n[Branch {i}/{len(variants)}] {cfg.simLabel} (from '{ckpt['id']}')")
+
+            tms.replay_tms(applied, params, t_restore=ckpt['t'])
+            run_branch(sim, cfg, ckpt)
+            sim.gatherData()
+            sim.saveData()
+            output_io.save_data(sim, cfg)
+
+            records.append({
+                'simLabel': cfg.simLabel,
+                'variant': variant,
+                'checkpoint': ckpt['id'],
+                't_checkpoint': ckpt['t'],
+            })
+    finally:
+        cfg.tms_params = base_params
+        cfg.simLabel = base_label
+
+    return records
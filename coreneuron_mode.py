@@ -0,0 +1,192 @@
+"""
+coreneuron_mode.py
+CoreNEURON (CPU) execution path, enabled with cfg.coreneuron = True
+
+Setup:
+    nrnivmodl -coreneuron mod/      # builds NEURON and CoreNEURON mechanisms
+
+What is supported:
+- The network with Exp2Syn synapses and NetStim or 'spikebank' background
+  (NEURON's built-in VecStim runs under CoreNEURON)
+- TMS with engine='iclamp' (the played IClamp waveform is transferred to
+  CoreNEURON like any other Vector.play)
+- LFP: NetPyNE computes the LFP from i_membrane_ in a NEURON-side callback,
+  which CoreNEURON does not call. With recordLFP set, i_membrane_ of every
+  segment is recorded (fast_imem) at cfg.recordStep and the LFP is computed
+  afterwards with the same transfer resistances (record_imembrane, add_lfp).
+  Every pc.psolve() transfers the model to CoreNEURON again, so the run is
+  one psolve, split only when the recorded currents would exceed
+  LFP_BUFFER_MB (a few psolves for the default 3 s run, instead of one per
+  recordStep).
+
+What is not (check_compatibility raises before anything is built):
+- engine='field': CoreNEURON has no extracellular mechanism
+- synMechMode='stp' and backgroundMode='gfluct': ProbAMPANMDA, ProbUDFsyn and
+  Gfluct2 keep their Random objects in a NEURON-only POINTER
+"""
+
+import glob
+import math
+import os
+
+from parallel import root_print
+
+# Upper bound on the recorded i_membrane_ buffer per rank (MB); sets the psolve chunk length
+LFP_BUFFER_MB = 1024
+
+# Sample-time Vector of the i_membrane_ recordings, must outlive the run
+_LFP_TIMES = []
+
+
+def check_compatibility(cfg):
+    """
+    Configuration options that cannot run under CoreNEURON.
+
+    Returns:
+        List of problem descriptions (empty if compatible)
+    """
+    problems = []
+    if cfg.tms_enabled and cfg.tms_params['engine'] == 'field':
+        problems.append("tms_params['engine'] = 'field' (no extracellular in CoreNEURON); use 'iclamp'")
+    if cfg.synMechMode == 'stp':
+        problems.append("synMechMode = 'stp' (ProbAMPANMDA/ProbUDFsyn RNG pointers are NEURON-only)")
+    if cfg.addBackground and cfg.backgroundMode == 'gfluct':
+        problems.append("backgroundMode = 'gfluct' (Gfluct2 RNG pointer is NEURON-only)")
+    if cfg.cvode_active:
+        problems.append("cvode_active = True (CoreNEURON runs fixed-step only)")
+    return problems
+
+
+def coreneuron_mechanisms_built(mech_dir='x86_64'):
+    """True if nrnivmodl -coreneuron has been run (CoreNEURON mechanism library present)."""
+    return bool(glob.glob(os.path.join(mech_dir, '*corenrnmech*')))
+
+
+def configure_coreneuron(cfg):
+    """
+    Validate cfg for CoreNEURON and set the options it requires.
+
+    Call before sim.create(). Raises ValueError for unsupported options and
+    RuntimeError if the CoreNEURON mechanisms were not built.
+    """
+    problems = check_compatibility(cfg)
+    if problems:
+        raise ValueError("cfg.coreneuron = True is incompatible with:\n  - " + "\n  - ".join(problems))
+
+    if not coreneuron_mechanisms_built():
+        raise RuntimeError("CoreNEURON mechanisms not found in x86_64/. Run: nrnivmodl -coreneuron mod/")
+
+    # Required by CoreNEURON's SoA data layout and Random123 NetStims
+    cfg.cache_efficient = True
+    cfg.random123 = True
+    cfg.gpu = False
+
+    root_print("✓ CoreNEURON (CPU) mode")
+
+
+def enable_coreneuron():
+    """Route every subsequent pc.psolve() through CoreNEURON (in-memory transfer)."""
+    from neuron import coreneuron
+
+    coreneuron.enable = True
+    coreneuron.gpu = False
+
+
+def simulate(sim, cfg):
+    """
+    Run and gather, through CoreNEURON if cfg.coreneuron (drop-in for sim.simulate()).
+    """
+    if not cfg.coreneuron:
+        sim.simulate()
+        return
+
+    from neuron import h
+
+    h.CVode().cache_efficient(1)
+    enable_coreneuron()
+
+    if cfg.recordLFP:
+        # NetPyNE's LFP callback runs on the NEURON side only; replace it by
+        # recorded i_membrane_ (a no-op if it was not registered)
+        sim.cvode.extra_scatter_gather_remove(sim.calculateLFP)
+        recorded = record_imembrane(sim, cfg)
+        n_seg = sum(len(vecs) for _, vecs in recorded)
+        chunk = max(1, int(LFP_BUFFER_MB * 1e6 // (8 * max(n_seg, 1)))) * cfg.recordStep
+        chunk = min(chunk, cfg.duration)
+        root_print(f"✓ CoreNEURON LFP: {n_seg} segments recorded, "
+              f"{math.ceil(cfg.duration / chunk)} psolve(s) of {chunk:g} ms")
+        done = [0]
+
+        def flush(t):
+            done[0] = add_lfp(sim, recorded, done[0])
+
+        sim.runSimWithIntervalFunc(chunk, flush)
+        n_rows = len(sim.simData['LFP'])
+        if done[0] != n_rows:
+            raise RuntimeError(f"CoreNEURON returned {done[0]} i_membrane_ samples, expected {n_rows}")
+    else:
+        sim.runSim()
+
+    sim.gatherData()
+
+
+def record_imembrane(sim, cfg):
+    """
+    Record i_membrane_ of every segment of the local cells at the LFP sample times.
+
+    Samples are taken at t = k * cfg.recordStep (k = 1..n), the times at which
+    NetPyNE fills LFP row k - 1; segments are in the order of cell.getImemb().
+
+    Returns:
+        List of (cell, [Vector per segment])
+    """
+    from neuron import h
+
+    sim.cvode.use_fast_imem(1)
+    n_rows = len(sim.simData['LFP'])
+    times = h.Vector().indgen(1, n_rows, 1).mul(cfg.recordStep)
+    _LFP_TIMES[:] = [times]
+
+    recorded = []
+    for cell in sim.net.compartCells:
+        vecs = []
+        for sec in cell.secs.values():
+            for seg in sec['hObj']:
+                vec = h.Vector()
+                vec.record(seg._ref_i_membrane_, times)
+                vecs.append(vec)
+        recorded.append((cell, vecs))
+    return recorded
+
+
+def add_lfp(sim, recorded, row0):
+    """
+    Add the LFP of the samples recorded since the last call and empty the buffers.
+
+    Same sum as sim.calculateLFP(): transfer resistance (mV/nA) times
+    i_membrane_ (nA), per cell, into LFP (and LFPCells/LFPPops if saved).
+
+    Args:
+        recorded: Output of record_imembrane
+        row0: LFP row of the first buffered sample
+
+    Returns:
+        LFP row after the last buffered sample
+    """
+    import numpy as np
+
+    n = len(recorded[0][1][0]) if recorded and recorded[0][1] else 0
+    rows = slice(row0, row0 + n)
+    for cell, vecs in recorded:
+        if any(len(vec) != n for vec in vecs):
+            raise RuntimeError(f"Unequal i_membrane_ buffers for gid {cell.gid}")
+        im = np.array([vec.as_numpy() for vec in vecs])     # segments x samples
+        ecp = sim.net.recXElectrode.getTransferResistance(cell.gid) @ im
+        sim.simData['LFP'][rows, :] += ecp.T
+        if cell.gid in sim.simData.get('LFPCells', {}):
+            sim.simData['LFPCells'][cell.gid][rows, :] = ecp.T
+        if cell.tags['pop'] in sim.simData.get('LFPPops', {}):
+            sim.simData['LFPPops'][cell.tags['pop']][rows, :] += ecp.T
+        for vec in vecs:
+            vec.resize(0)
+    return row0 + n
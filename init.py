@@ -9,9 +9,10 @@ Now supports:
 
 Usage:
     python init.py
+    mpiexec -n 64 python init.py    # MPI (see parallel.py)
 
 Output:
-    - output/Yao_L23_100cell_data.json
+    - output/Yao_L23_100cell_data/ (cfg.saveFormat = 'npy', see output_io.py)
     - output/Yao_L23_100cell_raster.png
     - output/Yao_L23_100cell_traces.png
     - output/Yao_L23_100cell_LFP.dat (if LFP enabled)
@@ -22,12 +23,17 @@ import sys
 from neuron import h
 import neuron
 
+import numpy as np
+
+import parallel
+from parallel import root_print  # Rank 0 only under mpiexec
+
 # Load NEURON mechanisms
-print("\n" + "="*70)
-print("YAO ET AL. L2/3 HUMAN CORTICAL MICROCIRCUIT - 100 CELLS")
-print("="*70)
+root_print("\n" + "="*70)
+root_print("YAO ET AL. L2/3 HUMAN CORTICAL MICROCIRCUIT - 100 CELLS")
+root_print("="*70)
 
-print("\n[1/7] Checking prerequisites...")
+root_print("\n[1/7] Checking prerequisites...")
 
 # Check for required files
 required_files = [
@@ -43,10 +49,10 @@ for fname in required_files:
         missing_files.append(fname)
 
 if missing_files:
-    print(f"✗ ERROR: Missing required files: {missing_files}")
+    root_print(f"✗ ERROR: Missing required files: {missing_files}")
     sys.exit(1)
 
-print("✓ All required Python files present")
+root_print("✓ All required Python files present")
 
 # Check for cell-specific templates
 required_templates = [
@@ -62,96 +68,115 @@ for template in required_templates:
         missing_templates.append(template)
 
 if missing_templates:
-    print(f"\n✗ ERROR: Missing cell-specific template files!")
-    print(f"   Missing: {missing_templates}")
-    print(f"\n   Run this first: python create_templates.py")
+    root_print(f"\n✗ ERROR: Missing cell-specific template files!")
+    root_print(f"   Missing: {missing_templates}")
+    root_print(f"\n   Run this first: python create_templates.py")
     sys.exit(1)
 
-print("✓ All cell-specific templates present")
+root_print("✓ All cell-specific templates present")
 
-print("\n[2/7] Loading NEURON mechanisms...")
+root_print("\n[2/7] Loading NEURON mechanisms...")
 if os.path.exists('x86_64'):
     neuron.load_mechanisms('x86_64')
-    print("✓ Loaded mechanisms from x86_64/")
+    root_print("✓ Loaded mechanisms from x86_64/")
 elif os.path.exists('mod'):
-    print("✗ ERROR: mod/ folder exists but not compiled!")
-    print("   Run: nrnivmodl mod/")
+    root_print("✗ ERROR: mod/ folder exists but not compiled!")
+    root_print("   Run: nrnivmodl mod/")
     sys.exit(1)
 else:
-    print("⚠ WARNING: No mechanism folder found, using default NEURON mechanisms")
+    root_print("⚠ WARNING: No mechanism folder found, using default NEURON mechanisms")
 
 # Import NetPyNE
-print("\n[3/7] Importing NetPyNE...")
+root_print("\n[3/7] Importing NetPyNE...")
 from netpyne import sim
 
 # Import configuration
-print("\n[4/7] Loading configuration...")
+root_print("\n[4/7] Loading configuration...")
 from cfg import cfg
-print(f"✓ Simulation duration: {cfg.duration} ms")
-print(f"✓ Time step: {cfg.dt} ms")
-print(f"✓ Cell populations: {cfg.allpops}")
-print(f"✓ Total cells: {sum(cfg.cellNumber.values())}")
+root_print(f"✓ Simulation duration: {cfg.duration} ms")
+root_print(f"✓ Time step: {cfg.dt} ms")
+root_print(f"✓ Cell populations: {cfg.allpops}")
+root_print(f"✓ Total cells: {sum(cfg.cellNumber.values())}")
 
 # Fix LFP configuration (convert boolean to list if needed)
 if hasattr(cfg, 'recordLFP'):
     if isinstance(cfg.recordLFP, bool):
         if cfg.recordLFP and hasattr(cfg, 'LFP_electrodes'):
             cfg.recordLFP = cfg.LFP_electrodes
-            print(f"✓ LFP recording enabled: {len(cfg.recordLFP)} electrodes")
+            root_print(f"✓ LFP recording enabled: {len(cfg.recordLFP)} electrodes")
         else:
             cfg.recordLFP = []
-            print("  (LFP disabled)")
+            root_print("  (LFP disabled)")
     elif isinstance(cfg.recordLFP, list) and len(cfg.recordLFP) > 0:
-        print(f"✓ LFP recording enabled: {len(cfg.recordLFP)} electrodes")
+        root_print(f"✓ LFP recording enabled: {len(cfg.recordLFP)} electrodes")
     else:
-        print("  (LFP disabled)")
+        root_print("  (LFP disabled)")
 
 # Report TMS status (check if tms_enabled flag is set)
 if hasattr(cfg, 'tms_enabled') and cfg.tms_enabled:
-    print(f"✓ TMS enabled")
+    root_print(f"✓ TMS enabled")
     if hasattr(cfg, 'tms_params'):
-        print(f"  Field strength: {cfg.tms_params.get('ef_amp_V_per_m', 0)} V/m")
-        print(f"  Frequency: {cfg.tms_params.get('freq_Hz', 0)} Hz")
+        root_print(f"  Field strength: {cfg.tms_params.get('ef_amp_V_per_m', 0)} V/m")
+        root_print(f"  Frequency: {cfg.tms_params.get('freq_Hz', 0)} Hz")
 else:
-    print("  (TMS disabled)")
+    root_print("  (TMS disabled)")
 
 # Import network parameters
-print("\n[5/7] Loading network parameters...")
-from netParams import netParams
+root_print("\n[5/7] Loading network parameters...")
+from netParams import build_netParams
+import synapses
+import background
+import coreneuron_mode
+import channel_tables
+import output_io
+import spike_stats
+netParams = build_netParams(cfg)
 
 # Create output directory
 if not os.path.exists(cfg.saveFolder):
     os.makedirs(cfg.saveFolder)
-    print(f"✓ Created output directory: {cfg.saveFolder}/")
+    root_print(f"✓ Created output directory: {cfg.saveFolder}/")
 
 # Create and run simulation
-print("\n[6/7] Creating network...")
-print("-" * 70)
+root_print("\n[6/7] Creating network...")
+root_print("-" * 70)
 
 try:
     # Create network
+    parallel.configure_parallel(sim, cfg)
+    output_io.configure_output(cfg)
+    if cfg.coreneuron:
+        coreneuron_mode.configure_coreneuron(cfg)
     sim.create(netParams, cfg)
+    parallel.record_pop_gid_ranges(sim, cfg)   # sizes after cfg.scale
+    synapses.setup_synapses(sim, cfg)
+    background.setup_background(sim, cfg)
+    channel_tables.setup_channel_tables(cfg)
 
     # Apply TMS if enabled
     if hasattr(cfg, 'tms_enabled') and cfg.tms_enabled:
-        print("\n[Applying TMS...]")
+        root_print("\n[Applying TMS...]")
         import tms
         tms_clamps = tms.apply_tms_from_params(sim, cfg)
 
     # Run simulation
-    print("\n[7/7] Running simulation...")
-    print("-" * 70)
-    sim.simulate()
+    root_print("\n[7/7] Running simulation...")
+    root_print("-" * 70)
+    coreneuron_mode.simulate(sim, cfg)  # sim.simulate(), via CoreNEURON if cfg.coreneuron
+
+    if parallel.nhost() > 1:
+        parallel.report_load_balance(sim, cfg)
 
     # Analysis and saving
-    print("\n[Analyzing and saving...]")
+    root_print("\n[Analyzing and saving...]")
     sim.analyze()
+    output_io.save_data(sim, cfg)
 
-    print("\n" + "="*70)
-    print("✅ SIMULATION COMPLETE!")
-    print("="*70)
-    print(f"\nResults saved to: {cfg.saveFolder}/")
-    print("\nGenerated files:")
+    root_print("\n" + "="*70)
+    root_print("✅ SIMULATION COMPLETE!")
+    root_print("="*70)
+    root_print(f"\nResults saved to: {cfg.saveFolder}/")
+    root_print("\nGenerated files:")
 
     # List generated files
     output_files = []
@@ -159,73 +184,67 @@ try:
         for fname in os.listdir(cfg.saveFolder):
             if fname.startswith(cfg.simLabel):
                 output_files.append(fname)
-                print(f"  ✓ {fname}")
+                root_print(f"  ✓ {fname}")
 
     if not output_files:
-        print("  (No output files found - check cfg.saveFolder)")
+        root_print("  (No output files found - check cfg.saveFolder)")
 
     # Print summary statistics
-    print("\n" + "="*70)
-    print("SUMMARY STATISTICS")
-    print("="*70)
+    root_print("\n" + "="*70)
+    root_print("SUMMARY STATISTICS")
+    root_print("="*70)
 
     if hasattr(sim, 'allSimData') and 'spkt' in sim.allSimData:
         total_spikes = len(sim.allSimData['spkt'])
         duration_sec = cfg.duration / 1000.0
-        num_cells = sum(cfg.cellNumber.values())
+        num_cells = sum(stop - first for first, stop in parallel.pop_gid_ranges(cfg).values())
         avg_rate = total_spikes / (duration_sec * num_cells) if num_cells > 0 else 0
 
-        print(f"Total spikes: {total_spikes}")
-        print(f"Average firing rate: {avg_rate:.2f} Hz")
-        print(f"Simulation time: {cfg.duration} ms")
-        print(f"Number of cells: {num_cells}")
-
-        # Per-population stats
-        print("\nPer-population firing rates:")
-        for pop in cfg.allpops:
-            pop_gids = [cell.gid for cell in sim.net.cells if cell.tags.get('pop') == pop]
-            pop_spikes = [t for i, t in enumerate(sim.allSimData['spkt'])
-                          if sim.allSimData['spkid'][i] in pop_gids]
-            pop_cells = cfg.cellNumber[pop]
-            pop_rate = len(pop_spikes) / (duration_sec * pop_cells) if pop_cells > 0 else 0
-            print(f"  {pop}: {pop_rate:.2f} Hz ({len(pop_spikes)} spikes)")
+        root_print(f"Total spikes: {total_spikes}")
+        root_print(f"Average firing rate: {avg_rate:.2f} Hz")
+        root_print(f"Simulation time: {cfg.duration} ms")
+        root_print(f"Number of cells: {num_cells}")
+
+        # Per-population stats (gid -> pop lookup + bincount, see spike_stats.py)
+        root_print("\nPer-population statistics:")
+        summary = spike_stats.population_summary(sim.allSimData['spkt'], sim.allSimData['spkid'], cfg)
+        spike_stats.print_population_summary(summary)
     else:
-        print("No spike data available")
+        root_print("No spike data available")
 
     # LFP stats
     if hasattr(sim, 'allSimData') and 'LFP' in sim.allSimData:
-        import numpy as np
         lfp_data = np.array(sim.allSimData['LFP'])
-        print(f"\nLFP data recorded:")
-        print(f"  Shape: {lfp_data.shape} (timepoints × electrodes)")
-        print(f"  Duration: {lfp_data.shape[0] * cfg.LFP_dt:.1f} ms")
+        root_print(f"\nLFP data recorded:")
+        root_print(f"  Shape: {lfp_data.shape} (timepoints × electrodes)")
+        root_print(f"  Duration: {lfp_data.shape[0] * cfg.LFP_dt:.1f} ms")
 
-    print("\n" + "="*70)
-    print("🎉 SUCCESS! Check the output/ folder for results!")
-    print("="*70 + "\n")
+    root_print("\n" + "="*70)
+    root_print("🎉 SUCCESS! Check the output/ folder for results!")
+    root_print("="*70 + "\n")
 
 except KeyboardInterrupt:
-    print("\n\n" + "="*70)
-    print("⚠ SIMULATION INTERRUPTED BY USER")
-    print("="*70 + "\n")
+    root_print("\n\n" + "="*70)
+    root_print("⚠ SIMULATION INTERRUPTED BY USER")
+    root_print("="*70 + "\n")
     sys.exit(0)
 
 except Exception as e:
-    print("\n" + "="*70)
-    print("❌ SIMULATION FAILED!")
-    print("="*70)
-    print(f"\nError: {e}")
-    print("\nTroubleshooting steps:")
-    print("1. Make sure you ran: python create_templates.py")
-    print("2. Check that all HOC files exist in models/")
-    print("3. Check that all SWC files exist in morphologies/")
-    print("4. Check that Circuit_param.xls exists")
-    print("5. Verify mechanisms compiled: ls x86_64/")
-    print("6. Check cellwrapper.py functions load correctly")
+    root_print("\n" + "="*70)
+    root_print("❌ SIMULATION FAILED!")
+    root_print("="*70)
+    root_print(f"\nError: {e}")
+    root_print("\nTroubleshooting steps:")
+    root_print("1. Make sure you ran: python create_templates.py")
+    root_print("2. Check that all HOC files exist in models/")
+    root_print("3. Check that all SWC files exist in morphologies/")
+    root_print("4. Check that Circuit_param.xls exists")
+    root_print("5. Verify mechanisms compiled: ls x86_64/")
+    root_print("6. Check cellwrapper.py functions load correctly")
 
     import traceback
-    print("\nFull error traceback:")
-    print("-" * 70)
+    root_print("\nFull error traceback:")
+    root_print("-" * 70)
     traceback.print_exc()
-    print("="*70 + "\n")
+    root_print("="*70 + "\n")
     sys.exit(1)
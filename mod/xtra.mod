@@ -0,0 +1,40 @@
+: xtra.mod
+: Couples an applied extracellular field to the extracellular mechanism.
+: Adapted from the McIntyre/Aberra "xtra" mechanism used for TMS modelling.
+
+COMMENT
+Each segment stores its quasipotential es (mV) for the field at peak
+amplitude. The time course of the stimulus is a single GLOBAL variable
+(stim, unitless) that is driven with Vector.play, so one played vector
+serves every segment of every cell:
+
+	e_extracellular = stim * es
+
+ex must be linked to e_extracellular with setpointer after both
+mechanisms are inserted.
+ENDCOMMENT
+
+NEURON {
+	SUFFIX xtra
+	RANGE es
+	GLOBAL stim
+	POINTER ex
+}
+
+PARAMETER {
+	es = 0 (mV)
+}
+
+ASSIGNED {
+	v (mV)
+	ex (mV)
+	stim (1)
+}
+
+INITIAL {
+	ex = stim*es
+}
+
+BEFORE BREAKPOINT {
+	ex = stim*es
+}
@@ -0,0 +1,183 @@
+"""
+morphology_cache.py
+Pre-parsed binary morphology cache for the SWC files
+
+The first time an SWC file is used it is imported with Import3d as usual and the
+resulting section tree (3D points, diameters, parent indices) is written to a
+compact .npz. Later cells are built straight from those arrays with vector
+pt3dadd calls, skipping Import3d_SWC_read/Import3d_GUI entirely.
+
+Usage (see cellwrapper.instantiate_cell):
+    cell = h.NeuronTemplate_HL23PYR(morphpath, 1)   # deferred: no morphology yet
+    morphology_cache.build_morphology(cell, morphpath)
+    cell.post_morphology()                          # geom_nseg, delete_axon, ...
+"""
+
+import hashlib
+import os
+
+import numpy as np
+
+from parallel import atomic_savez
+
+
+MORPH_CACHE_DIR = os.path.join('.cache', 'morphology')
+CACHE_VERSION = 1
+
+# Import3d section names -> template SectionList they belong to
+SECTION_TYPES = ['soma', 'dend', 'apic', 'axon']
+SECTION_LISTS = {'soma': 'somatic', 'dend': 'basal', 'apic': 'apical', 'axon': 'axonal'}
+
+# Parsed trees already loaded in this process: swc path -> arrays
+_MORPHOLOGIES = {}
+
+
+def cache_path(swc_path):
+    """Cache file for swc_path, keyed on a hash of its contents."""
+    with open(swc_path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(swc_path))[0]
+    return os.path.join(MORPH_CACHE_DIR, f"{name}_{digest}.npz")
+
+
+def import_swc(cell, swc_path):
+    """Instantiate swc_path into cell with Import3d (what the template init normally does)."""
+    from neuron import h
+
+    nl = h.Import3d_SWC_read()
+    nl.quiet = 1
+    nl.input(swc_path)
+    imprt = h.Import3d_GUI(nl, 0)
+    imprt.instantiate(cell)
+
+
+def snapshot_morphology(cell):
+    """
+    Capture the section tree of a freshly imported cell.
+
+    Must be called before post_morphology() (which replaces the axon).
+
+    Returns:
+        dict of NumPy arrays: sec_type, sec_index, parent, parent_x, child_x,
+        pt_offset and pts (x, y, z, diam per 3D point)
+    """
+    secs = list(cell.all)
+    index = {sec.hname(): i for i, sec in enumerate(secs)}
+
+    sec_type = np.zeros(len(secs), dtype=np.int8)
+    sec_index = np.zeros(len(secs), dtype=np.int32)
+    parent = np.full(len(secs), -1, dtype=np.int32)
+    parent_x = np.zeros(len(secs))
+    child_x = np.zeros(len(secs))
+    pt_offset = np.zeros(len(secs) + 1, dtype=np.int64)
+    pts = []
+
+    for i, sec in enumerate(secs):
+        name = sec.hname().split('.')[-1]          # e.g. 'dend[12]'
+        base, idx = name.rstrip(']').split('[')
+        sec_type[i] = SECTION_TYPES.index(base)
+        sec_index[i] = int(idx)
+
+        parent_seg = sec.parentseg()
+        if parent_seg is not None:
+            parent[i] = index[parent_seg.sec.hname()]
+            parent_x[i] = parent_seg.x
+            child_x[i] = sec.orientation()
+
+        n3d = int(sec.n3d())
+        pts.extend([sec.x3d(k), sec.y3d(k), sec.z3d(k), sec.diam3d(k)] for k in range(n3d))
+        pt_offset[i + 1] = pt_offset[i] + n3d
+
+    return {
+        'version': np.array(CACHE_VERSION),
+        'sec_type': sec_type,
+        'sec_index': sec_index,
+        'parent': parent,
+        'parent_x': parent_x,
+        'child_x': child_x,
+        'pt_offset': pt_offset,
+        'pts': np.array(pts, dtype=float).reshape(-1, 4),
+    }
+
+
+def instantiate_morphology(cell, morph):
+    """
+    Create the sections of a deferred template cell from cached arrays.
+
+    Args:
+        cell: Template instance created with init(path, 1)
+        morph: dict returned by snapshot_morphology / load_morphology
+    """
+    from neuron import h
+
+    counts = np.bincount(morph['sec_type'], minlength=len(SECTION_TYPES))
+    for base, n in zip(SECTION_TYPES, counts):
+        if n > 0:
+            h.execute(f'create {base}[{int(n)}]', cell)
+
+    secs = []
+    for i, (t, idx) in enumerate(zip(morph['sec_type'], morph['sec_index'])):
+        base = SECTION_TYPES[t]
+        sec = getattr(cell, base)[int(idx)]
+        secs.append(sec)
+
+        start, stop = morph['pt_offset'][i], morph['pt_offset'][i + 1]
+        xyzd = morph['pts'][start:stop]
+        h.pt3dclear(sec=sec)
+        if len(xyzd):
+            h.pt3dadd(h.Vector(xyzd[:, 0]), h.Vector(xyzd[:, 1]),
+                      h.Vector(xyzd[:, 2]), h.Vector(xyzd[:, 3]), sec=sec)
+
+        cell.all.append(sec=sec)
+        getattr(cell, SECTION_LISTS[base]).append(sec=sec)
+
+    for i, sec in enumerate(secs):
+        p = morph['parent'][i]
+        if p >= 0:
+            sec.connect(secs[p](morph['parent_x'][i]), morph['child_x'][i])
+
+
+def load_morphology(swc_path):
+    """Return the cached arrays for swc_path (memory, then disk), or None on a miss."""
+    if swc_path in _MORPHOLOGIES:
+        return _MORPHOLOGIES[swc_path]
+
+    path = cache_path(swc_path)
+    if not os.path.exists(path):
+        return None
+
+    with np.load(path) as data:
+        morph = {key: data[key] for key in data.files}
+    if int(morph['version']) != CACHE_VERSION:
+        return None
+
+    _MORPHOLOGIES[swc_path] = morph
+    return morph
+
+
+def save_morphology(swc_path, morph):
+    """Write the arrays for swc_path to the cache and keep them in memory."""
+    os.makedirs(MORPH_CACHE_DIR, exist_ok=True)
+    atomic_savez(cache_path(swc_path), **morph)
+    _MORPHOLOGIES[swc_path] = morph
+
+
+def build_morphology(cell, swc_path):
+    """
+    Give a deferred template cell its morphology, importing the SWC only on a cache miss.
+
+    Returns:
+        True if the cache was used, False if the SWC was parsed (and cached)
+    """
+    morph = load_morphology(swc_path)
+    if morph is not None:
+        instantiate_morphology(cell, morph)
+        return True
+
+    import_swc(cell, swc_path)
+    try:
+        save_morphology(swc_path, snapshot_morphology(cell))
+    except ValueError:
+        # Section names other than soma/dend/apic/axon: keep using Import3d
+        pass
+    return False
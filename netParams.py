@@ -2,35 +2,25 @@
 netParams.py
 COMPLETE Network parameters for Yao et al. human L2/3 microcircuit
 100 cells with biophysically detailed models
+
+Nothing is built at import time. Use the factory:
+
+    from netParams import build_netParams
+    netParams = build_netParams(cfg, verbose=False)
+
+or, as before, `from netParams import netParams`, which builds the parameters
+on first access from the cfg in __main__ (falling back to cfg.py).
 """
 
 from netpyne import specs
 import pandas as pd
 import numpy as np
-import sys
+import hashlib
+import os
 
-netParams = specs.NetParams()
-
-try:
-    from __main__ import cfg
-except:
-    from cfg import cfg
-
-#------------------------------------------------------------------------------
-# Network parameters
-#------------------------------------------------------------------------------
-netParams.scale = cfg.scale
-netParams.sizeX = cfg.sizeX
-netParams.sizeY = cfg.sizeY
-netParams.sizeZ = cfg.sizeZ
-netParams.shape = 'cylinder'
-
-#------------------------------------------------------------------------------
-# General connectivity parameters
-#------------------------------------------------------------------------------
-netParams.defaultThreshold = -10.0
-netParams.defaultDelay = 0.5
-netParams.propVelocity = 300.0
+import background
+from parallel import atomic_savez, root_print
+from synapses import syn_mech_params
 
 # Layer boundaries (y-axis, from pia to white matter)
 layer = {
@@ -42,183 +32,225 @@ layer = {
     '6': [2300.0, 3300.0]
 }
 
-#------------------------------------------------------------------------------
-# Import cell models using cellwrapper.py
-#------------------------------------------------------------------------------
-print("\n" + "="*70)
-print("LOADING CELL MODELS")
-print("="*70)
 
-for cellName in cfg.allpops:
-    print(f"\nImporting {cellName}...")
-    try:
-        # Build cellArgs dictionary with AD support for HL23PYR
-        cellArgs = {'cellName': cellName}
-
-        # Add AD parameters for populations specified in cfg.ADpopulations
-        if cfg.ADmodel and cellName in cfg.ADpopulations:
-            cellArgs['ad'] = True
-            cellArgs['ad_stage'] = cfg.ADstage
-            print(f"  [AD MODE] Stage {cfg.ADstage} enabled for {cellName}")
-
-        cellRule = netParams.importCellParams(
-            label=cellName,
-            somaAtOrigin=False,
-            conds={'cellType': cellName, 'cellModel': 'HH_full'},
-            fileName='cellwrapper.py',
-            cellName='loadCell_' + cellName,
-            cellInstance=True,
-            cellArgs=cellArgs
-        )
-        print(f"✓ {cellName} imported successfully")
-    except Exception as e:
-        print(f"✗ ERROR importing {cellName}: {e}")
-        sys.exit(1)
+def _make_logger(verbose):
+    """print when verbose, otherwise a no-op."""
+    if verbose:
+        return root_print
+    return lambda *args, **kwargs: None
 
-#------------------------------------------------------------------------------
-# Load connectivity parameters from Circuit_param.xls
-#------------------------------------------------------------------------------
-print("\n" + "="*70)
-print("LOADING CIRCUIT PARAMETERS")
-print("="*70)
-
-try:
-    circuit_params = pd.read_excel('Circuit_param.xls', sheet_name=None, index_col=0)
-    print(f"✓ Loaded {len(circuit_params)} sheets from Circuit_param.xls")
-
-    conn_probs = circuit_params['conn_probs']
-    syn_cond = circuit_params['syn_cond']
-    n_cont = circuit_params['n_cont']
-    Depression = circuit_params['Depression']
-    Facilitation = circuit_params['Facilitation']
-    Use = circuit_params['Use']
-    Syn_pos = circuit_params['Syn_pos']
-
-    print(f"\nConnection probability matrix:")
-    print(conn_probs)
-
-except Exception as e:
-    print(f"✗ ERROR loading Circuit_param.xls: {e}")
-    print("Using default connectivity values...")
-
-    # Default values if Excel file fails
-    cell_names = cfg.allpops
-    conn_probs = pd.DataFrame(0.1, index=cell_names, columns=cell_names)
-    syn_cond = pd.DataFrame(0.001, index=cell_names, columns=cell_names)
-    n_cont = pd.DataFrame(1, index=cell_names, columns=cell_names)
-    Depression = pd.DataFrame(0.0, index=cell_names, columns=cell_names)
-    Facilitation = pd.DataFrame(0.0, index=cell_names, columns=cell_names)
-    Use = pd.DataFrame(0.5, index=cell_names, columns=cell_names)
-    Syn_pos = pd.DataFrame(0, index=cell_names, columns=cell_names)
 
-#------------------------------------------------------------------------------
-# Add 'spiny' section list to all cells (for synapse placement)
-#------------------------------------------------------------------------------
-print("\n" + "="*70)
-print("CREATING SPINY SECTION LISTS")
-print("="*70)
+def _log_header(log, title):
+    log("\n" + "="*70)
+    log(title)
+    log("="*70)
 
-for cellName in netParams.cellParams.keys():
-    if 'secLists' not in netParams.cellParams[cellName]:
-        netParams.cellParams[cellName]['secLists'] = {}
 
-    # Get all sections
-    all_secs = list(netParams.cellParams[cellName]['secs'].keys())
-
-    # Define non-spiny sections (soma + axon)
-    nonSpiny = [sec for sec in all_secs if 'soma' in sec or 'axon' in sec or 'myelin' in sec]
+#------------------------------------------------------------------------------
+# Circuit parameter loader (binary cache of Circuit_param.xls)
+#------------------------------------------------------------------------------
+CIRCUIT_SHEETS = ['conn_probs', 'syn_cond', 'n_cont', 'Depression', 'Facilitation', 'Use', 'Syn_pos']
+CIRCUIT_CACHE_DIR = os.path.join('.cache', 'circuit_params')
+
+
+def load_circuit_params(xls_path='Circuit_param.xls'):
+    """
+    Load all sheets of Circuit_param.xls as DataFrames.
+
+    The first call reads the workbook with pandas/xlrd and writes every sheet
+    (values, index, columns) to an .npz keyed on the workbook's SHA-1; later
+    calls, in any process, read the .npz and never touch the Excel stack.
+
+    Returns:
+        (dict of DataFrames keyed by sheet name, loaded_from_cache)
+    """
+    with open(xls_path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(xls_path))[0]
+    cache_file = os.path.join(CIRCUIT_CACHE_DIR, f"{name}_{digest}.npz")
+
+    if os.path.exists(cache_file):
+        with np.load(cache_file, allow_pickle=False) as data:
+            sheets = {
+                sheet: pd.DataFrame(data[sheet + '__values'],
+                                    index=data[sheet + '__index'].tolist(),
+                                    columns=data[sheet + '__columns'].tolist())
+                for sheet in CIRCUIT_SHEETS
+            }
+        return sheets, True
+
+    sheets = pd.read_excel(xls_path, sheet_name=None, index_col=0)
+
+    arrays = {}
+    for sheet in CIRCUIT_SHEETS:
+        df = sheets[sheet]
+        try:
+            arrays[sheet + '__values'] = df.to_numpy(dtype=float)
+        except (TypeError, ValueError):
+            arrays[sheet + '__values'] = df.to_numpy().astype(str)
+        arrays[sheet + '__index'] = np.array([str(i) for i in df.index])
+        arrays[sheet + '__columns'] = np.array([str(c) for c in df.columns])
+    os.makedirs(CIRCUIT_CACHE_DIR, exist_ok=True)
+    atomic_savez(cache_file, **arrays)
+
+    return {sheet: sheets[sheet] for sheet in CIRCUIT_SHEETS}, False
+
+
+def default_circuit_params(cell_names):
+    """Fallback connectivity values used when Circuit_param.xls cannot be read."""
+    return {
+        'conn_probs': pd.DataFrame(0.1, index=cell_names, columns=cell_names),
+        'syn_cond': pd.DataFrame(0.001, index=cell_names, columns=cell_names),
+        'n_cont': pd.DataFrame(1, index=cell_names, columns=cell_names),
+        'Depression': pd.DataFrame(0.0, index=cell_names, columns=cell_names),
+        'Facilitation': pd.DataFrame(0.0, index=cell_names, columns=cell_names),
+        'Use': pd.DataFrame(0.5, index=cell_names, columns=cell_names),
+        'Syn_pos': pd.DataFrame(0, index=cell_names, columns=cell_names),
+    }
 
-    # Spiny = everything else (dendrites)
-    netParams.cellParams[cellName]['secLists']['spiny'] = [
-        sec for sec in all_secs if sec not in nonSpiny
-    ]
 
-    # Also create basal and apical lists
-    netParams.cellParams[cellName]['secLists']['basal'] = [
-        sec for sec in all_secs if 'dend' in sec
-    ]
-    netParams.cellParams[cellName]['secLists']['apical'] = [
-        sec for sec in all_secs if 'apic' in sec
-    ]
+#------------------------------------------------------------------------------
+# Cell models
+#------------------------------------------------------------------------------
+def add_cell_params(netParams, cfg, verbose=True):
+    """
+    Import cell models using cellwrapper.py and add the spiny/basal/apical section lists.
+
+    Called by build_netParams unless lazy_cells=True, in which case call it
+    before sim.create().
+    """
+    log = _make_logger(verbose)
+
+    _log_header(log, "LOADING CELL MODELS")
+
+    for cellName in cfg.allpops:
+        log(f"\nImporting {cellName}...")
+        try:
+            # Build cellArgs dictionary with AD support for HL23PYR
+            cellArgs = {'cellName': cellName}
+
+            # Add AD parameters for populations specified in cfg.ADpopulations
+            if cfg.ADmodel and cellName in cfg.ADpopulations:
+                cellArgs['ad'] = True
+                cellArgs['ad_stage'] = cfg.ADstage
+                log(f"  [AD MODE] Stage {cfg.ADstage} enabled for {cellName}")
+
+            netParams.importCellParams(
+                label=cellName,
+                somaAtOrigin=False,
+                conds={'cellType': cellName, 'cellModel': 'HH_full'},
+                fileName='cellwrapper.py',
+                cellName='loadCell_' + cellName,
+                cellInstance=True,
+                cellArgs=cellArgs
+            )
+            log(f"✓ {cellName} imported successfully")
+        except Exception as e:
+            root_print(f"✗ ERROR importing {cellName}: {e}")
+            raise
+
+    #--------------------------------------------------------------------------
+    # Add 'spiny' section list to all cells (for synapse placement)
+    #--------------------------------------------------------------------------
+    _log_header(log, "CREATING SPINY SECTION LISTS")
+
+    for cellName in netParams.cellParams.keys():
+        if 'secLists' not in netParams.cellParams[cellName]:
+            netParams.cellParams[cellName]['secLists'] = {}
+
+        # Get all sections
+        all_secs = list(netParams.cellParams[cellName]['secs'].keys())
+
+        # Define non-spiny sections (soma + axon)
+        nonSpiny = [sec for sec in all_secs if 'soma' in sec or 'axon' in sec or 'myelin' in sec]
+
+        # Spiny = everything else (dendrites)
+        netParams.cellParams[cellName]['secLists']['spiny'] = [
+            sec for sec in all_secs if sec not in nonSpiny
+        ]
+
+        # Also create basal and apical lists
+        netParams.cellParams[cellName]['secLists']['basal'] = [
+            sec for sec in all_secs if 'dend' in sec
+        ]
+        netParams.cellParams[cellName]['secLists']['apical'] = [
+            sec for sec in all_secs if 'apic' in sec
+        ]
+
+        log(f"✓ {cellName}: {len(netParams.cellParams[cellName]['secLists']['spiny'])} spiny sections")
 
-    print(f"✓ {cellName}: {len(netParams.cellParams[cellName]['secLists']['spiny'])} spiny sections")
 
 #------------------------------------------------------------------------------
 # Population parameters
 #------------------------------------------------------------------------------
-print("\n" + "="*70)
-print("CREATING POPULATIONS")
-print("="*70)
-
-for cellName in cfg.allpops:
-    netParams.popParams[cellName] = {
-        'cellType': cellName,
-        'cellModel': 'HH_full',
-        'numCells': cfg.cellNumber[cellName],
-        'yRange': layer['23soma']
-    }
-    print(f"✓ {cellName}: {cfg.cellNumber[cellName]} cells")
+def add_populations(netParams, cfg, log):
+    _log_header(log, "CREATING POPULATIONS")
+
+    for cellName in cfg.allpops:
+        netParams.popParams[cellName] = {
+            'cellType': cellName,
+            'cellModel': 'HH_full',
+            'numCells': cfg.cellNumber[cellName],
+            'yRange': layer['23soma']
+        }
+        log(f"✓ {cellName}: {cfg.cellNumber[cellName]} cells")
+
 
 #------------------------------------------------------------------------------
-# Synaptic mechanisms (SIMPLE - using built-in Exp2Syn)
+# Synaptic mechanisms
 #------------------------------------------------------------------------------
-print("\n" + "="*70)
-print("DEFINING SYNAPTIC MECHANISMS")
-print("="*70)
-
-# Standard mechanisms (always available in NEURON)
-netParams.synMechParams['AMPA'] = {
-    'mod': 'Exp2Syn',
-    'tau1': 0.3,
-    'tau2': 3.0,
-    'e': 0
-}
+def add_synaptic_mechanisms(netParams, cfg, circuit, log):
+    _log_header(log, "DEFINING SYNAPTIC MECHANISMS")
+
+    # Standard mechanisms (always available in NEURON)
+    netParams.synMechParams['AMPA'] = {
+        'mod': 'Exp2Syn',
+        'tau1': 0.3,
+        'tau2': 3.0,
+        'e': 0
+    }
 
-netParams.synMechParams['NMDA'] = {
-    'mod': 'Exp2Syn',
-    'tau1': 2.0,
-    'tau2': 65.0,
-    'e': 0
-}
+    netParams.synMechParams['NMDA'] = {
+        'mod': 'Exp2Syn',
+        'tau1': 2.0,
+        'tau2': 65.0,
+        'e': 0
+    }
 
-netParams.synMechParams['GABAA'] = {
-    'mod': 'Exp2Syn',
-    'tau1': 1.0,
-    'tau2': 10.0,
-    'e': -80
-}
+    netParams.synMechParams['GABAA'] = {
+        'mod': 'Exp2Syn',
+        'tau1': 1.0,
+        'tau2': 10.0,
+        'e': -80
+    }
 
-print("✓ Defined 3 standard synapse types (AMPA, NMDA, GABAA)")
-
-# Create connection-specific synapse parameters
-cell_names = cfg.allpops
-for pre in cell_names:
-    for post in cell_names:
-        if "PYR" in pre:  # Excitatory
-            netParams.synMechParams[pre + post] = {
-                'mod': 'Exp2Syn',
-                'tau1': 0.3,
-                'tau2': 3.0,
-                'e': 0
-            }
-        else:  # Inhibitory
-            netParams.synMechParams[pre + post] = {
-                'mod': 'Exp2Syn',
-                'tau1': 1.0,
-                'tau2': 10.0,
-                'e': -80
-            }
+    log("✓ Defined 3 standard synapse types (AMPA, NMDA, GABAA)")
+
+    # Create connection-specific synapse parameters (Exp2Syn or STP, see synapses.py)
+    cell_names = cfg.allpops
+    for pre in cell_names:
+        for post in cell_names:
+            netParams.synMechParams[pre + post] = syn_mech_params(pre, post, circuit, cfg.synMechMode,
+                                                                    cfg.stpNMDA)
+
+    log(f"✓ Created {len(cell_names)**2} connection-specific synapse types ({cfg.synMechMode})")
 
-print(f"✓ Created {len(cell_names)**2} connection-specific synapse types")
 
 #------------------------------------------------------------------------------
 # Connectivity rules (from Circuit_param.xls)
 #------------------------------------------------------------------------------
-print("\n" + "="*70)
-print("CREATING CONNECTIVITY RULES")
-print("="*70)
+def add_connectivity(netParams, cfg, circuit, log):
+    _log_header(log, "CREATING CONNECTIVITY RULES")
 
-if cfg.addConn:
+    if not cfg.addConn:
+        log("✗ Connectivity disabled in cfg.py")
+        return
+
+    conn_probs = circuit['conn_probs']
+    syn_cond = circuit['syn_cond']
+    n_cont = circuit['n_cont']
+
+    cell_names = cfg.allpops
     conn_count = 0
     for pre in cell_names:
         for post in cell_names:
@@ -255,50 +287,32 @@ if cfg.addConn:
                 }
 
                 conn_count += 1
-                print(f"✓ {pre}->{post}: P={prob:.3f}, W={weight:.4f}, N={int(n_cont.at[pre, post])}")
+                log(f"✓ {pre}->{post}: P={prob:.3f}, W={weight:.4f}, N={int(n_cont.at[pre, post])}")
+
+    log(f"\n✓ Created {conn_count} connectivity rules")
 
-    print(f"\n✓ Created {conn_count} connectivity rules")
-else:
-    print("✗ Connectivity disabled in cfg.py")
 
 #------------------------------------------------------------------------------
-# Background stimulation (NetStim)
+# Background stimulation (see background.py)
 #------------------------------------------------------------------------------
-print("\n" + "="*70)
-print("ADDING BACKGROUND STIMULATION")
-print("="*70)
-
-if cfg.addBackground:
-    for pop in cfg.allpops:
-        # Create NetStim source
-        netParams.stimSourceParams[f'bkg_{pop}'] = {
-            'type': 'NetStim',
-            'rate': cfg.backgroundRate[pop],
-            'noise': 1.0,
-            'start': 0
-        }
+def add_background(netParams, cfg, log):
+    _log_header(log, "ADDING BACKGROUND STIMULATION")
 
-        # Connect to population
-        netParams.stimTargetParams[f'bkg->{pop}'] = {
-            'source': f'bkg_{pop}',
-            'conds': {'pop': pop},
-            'weight': cfg.backgroundWeight[pop],
-            'delay': 0.5,
-            'synMech': 'AMPA',
-            'sec': 'spiny'
-        }
+    if not cfg.addBackground:
+        log("✗ Background stimulation disabled")
+        return
+
+    background.add_background(netParams, cfg, log)
 
-        print(f"✓ Background -> {pop}: {cfg.backgroundRate[pop]} Hz, weight={cfg.backgroundWeight[pop]}")
-else:
-    print("✗ Background stimulation disabled")
 
 #------------------------------------------------------------------------------
 # Current clamp (optional)
 #------------------------------------------------------------------------------
-if cfg.addIClamp:
-    print("\n" + "="*70)
-    print("ADDING CURRENT CLAMPS")
-    print("="*70)
+def add_iclamps(netParams, cfg, log):
+    if not cfg.addIClamp:
+        return
+
+    _log_header(log, "ADDING CURRENT CLAMPS")
 
     for key in [k for k in dir(cfg) if k.startswith('IClamp')]:
         params = getattr(cfg, key, None)
@@ -321,14 +335,94 @@ if cfg.addIClamp:
                 'loc': loc
             }
 
-            print(f"✓ IClamp -> {pop}: {amp} nA for {dur} ms")
+            log(f"✓ IClamp -> {pop}: {amp} nA for {dur} ms")
 
+
+#------------------------------------------------------------------------------
+# Factory
 #------------------------------------------------------------------------------
-print("\n" + "="*70)
-print("NETWORK PARAMETERS COMPLETE")
-print("="*70)
-print(f"✓ Total populations: {len(netParams.popParams)}")
-print(f"✓ Total connectivity rules: {len(netParams.connParams)}")
-print(f"✓ Total synaptic mechanisms: {len(netParams.synMechParams)}")
-print(f"✓ Total cells: {sum(cfg.cellNumber.values())}")
-print("="*70 + "\n")
+def build_netParams(cfg, verbose=True, lazy_cells=False):
+    """
+    Build the network parameters for a given cfg.
+
+    Args:
+        cfg: SimConfig (cfg.py or a modified copy)
+        verbose: Print progress (False for sweep drivers building many variants)
+        lazy_cells: Skip cell import (cellwrapper/NEURON); call
+            add_cell_params(netParams, cfg) before sim.create()
+
+    Returns:
+        specs.NetParams
+    """
+    log = _make_logger(verbose)
+    netParams = specs.NetParams()
+
+    #--------------------------------------------------------------------------
+    # Network parameters
+    #--------------------------------------------------------------------------
+    netParams.scale = cfg.scale
+    netParams.sizeX = cfg.sizeX
+    netParams.sizeY = cfg.sizeY
+    netParams.sizeZ = cfg.sizeZ
+    netParams.shape = 'cylinder'
+
+    #--------------------------------------------------------------------------
+    # General connectivity parameters
+    #--------------------------------------------------------------------------
+    netParams.defaultThreshold = -10.0
+    netParams.defaultDelay = 0.5
+    netParams.propVelocity = 300.0
+
+    if not lazy_cells:
+        add_cell_params(netParams, cfg, verbose=verbose)
+
+    #--------------------------------------------------------------------------
+    # Load connectivity parameters from Circuit_param.xls
+    #--------------------------------------------------------------------------
+    _log_header(log, "LOADING CIRCUIT PARAMETERS")
+
+    try:
+        circuit, from_cache = load_circuit_params('Circuit_param.xls')
+        source = 'cache' if from_cache else 'Circuit_param.xls'
+        log(f"✓ Loaded {len(circuit)} sheets from {source}")
+
+        log(f"\nConnection probability matrix:")
+        log(circuit['conn_probs'])
+
+    except Exception as e:
+        root_print(f"✗ ERROR loading Circuit_param.xls: {e}")
+        root_print("Using default connectivity values...")
+
+        # Default values if Excel file fails
+        circuit = default_circuit_params(cfg.allpops)
+
+    add_populations(netParams, cfg, log)
+    add_synaptic_mechanisms(netParams, cfg, circuit, log)
+    add_connectivity(netParams, cfg, circuit, log)
+    add_background(netParams, cfg, log)
+    add_iclamps(netParams, cfg, log)
+
+    #--------------------------------------------------------------------------
+    _log_header(log, "NETWORK PARAMETERS COMPLETE")
+    log(f"✓ Total populations: {len(netParams.popParams)}")
+    log(f"✓ Total connectivity rules: {len(netParams.connParams)}")
+    log(f"✓ Total synaptic mechanisms: {len(netParams.synMechParams)}")
+    log(f"✓ Total cells: {sum(cfg.cellNumber.values())}")
+    log("="*70 + "\n")
+
+    return netParams
+
+
+def __getattr__(name):
+    """Build `netParams` on first access (`from netParams import netParams`)."""
+    if name != 'netParams':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    try:
+        from __main__ import cfg
+    except ImportError:
+        from cfg import cfg
+
+    netParams = build_netParams(cfg)
+    globals()['netParams'] = netParams
+    return netParams
@@ -0,0 +1,280 @@
+"""
+output_io.py
+Columnar simulation output: one .npy file per array plus a small JSON sidecar
+
+cfg.saveFormat = 'npy' writes output/<simLabel>_data/ instead of NetPyNE's
+monolithic <simLabel>_data.json:
+
+    <simLabel>_data/
+        meta.json                   simConfig, pop gid ranges, array index, scalars
+        spkt.npy                    float32 (float64 if float32 cannot resolve dt)
+        spkid.npy                   int32
+        LFP.npy                     float32, timepoints x electrodes
+        traces/<key>/<cell>.npy     float32, one file per recorded trace
+        <key>.npy                   any other simData array (float32; 't' like spkt)
+
+No cell sections or connections are saved (the analysis needs only the pop
+gid ranges), and every array can be read back with np.load(mmap_mode='r').
+
+    python output_io.py output/<simLabel>_data.json    # convert an old JSON output
+
+analyze_rtms_lfp.py opens outputs through ensure_npy_output, so a JSON output
+is converted the first time it is analyzed and memory-mapped from then on.
+"""
+
+import json
+import os
+import shutil
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from parallel import pop_gid_ranges
+
+
+SAVE_FORMATS = ['json', 'npy']
+OUTPUT_VERSION = 1
+META_FILE = 'meta.json'
+SPIKE_KEYS = ['spkt', 'spkid']
+
+
+def output_path(save_folder, sim_label, fmt='npy'):
+    """Output path of a run: '<folder>/<label>_data/' (npy) or '<folder>/<label>_data.json'."""
+    base = os.path.join(save_folder, f"{sim_label}_data")
+    return base if fmt == 'npy' else base + '.json'
+
+
+def find_output(save_folder, sim_label):
+    """Existing output of a run, preferring the npy directory; None if there is none."""
+    for fmt in ['npy', 'json']:
+        path = output_path(save_folder, sim_label, fmt)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def is_npy_output(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, META_FILE))
+
+
+def spike_time_dtype(duration, dt):
+    """float32 if its resolution at t = duration is at most dt/2, else float64."""
+    return np.float32 if np.spacing(np.float32(duration)) <= dt / 2 else np.float64
+
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if hasattr(value, 'todict'):
+        return value.todict()
+    return str(value)
+
+
+def write_output(path, sim_data, config, pops):
+    """
+    Write simData arrays and the sidecar to the directory path (replaced atomically).
+
+    Args:
+        path: Output directory
+        sim_data: simData dict (lists, Vectors or arrays)
+        config: simConfig as a dict (needs 'duration' and 'dt')
+        pops: dict pop -> (first_gid, last_gid + 1)
+
+    Returns:
+        Total size written (bytes)
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+
+    arrays = {}
+    scalars = {}
+
+    def save(name, values, dtype):
+        values = np.asarray(values, dtype=dtype)
+        file = os.path.join(tmp, name + '.npy')
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        np.save(file, values)
+        arrays[name] = {'dtype': values.dtype.str, 'shape': list(values.shape)}
+
+    t_dtype = spike_time_dtype(config.get('duration', 0.0), config.get('dt', 0.025))
+    save('spkt', sim_data.get('spkt', []), t_dtype)
+    save('spkid', sim_data.get('spkid', []), np.int32)
+
+    for key, value in sim_data.items():
+        if key in SPIKE_KEYS:
+            continue
+        if isinstance(value, dict):
+            for cell, trace in value.items():
+                save(f"traces/{key}/{cell}", trace, np.float32)
+        elif np.ndim(value) == 0:
+            scalars[key] = float(value)
+        else:
+            save(key, value, t_dtype if key == 't' else np.float32)
+
+    meta = {
+        'version': OUTPUT_VERSION,
+        'simConfig': config,
+        'pops': {pop: list(r) for pop, r in pops.items()},
+        'arrays': arrays,
+        'scalars': scalars,
+    }
+    with open(os.path.join(tmp, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=1, default=_json_default)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+    return dir_size(path)
+
+
+def dir_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, f))
+               for root, _, files in os.walk(path) for f in files)
+
+
+def load_meta(path):
+    with open(os.path.join(path, META_FILE)) as f:
+        return json.load(f)
+
+
+def load_array(path, name, mmap=False):
+    """One array of an npy output directory (memory-mapped read-only if mmap)."""
+    file = os.path.join(path, name + '.npy')
+    if mmap:
+        try:
+            return np.load(file, mmap_mode='r')
+        except ValueError:
+            pass    # empty arrays cannot be mapped
+    return np.load(file)
+
+
+def load_output(path, mmap=False):
+    """
+    Read an npy output directory into the layout of NetPyNE's JSON output.
+
+    Returns:
+        dict with 'simData' (arrays; traces as dict key -> {cell: array}),
+        'simConfig' and 'pops'
+    """
+    meta = load_meta(path)
+    sim_data = dict(meta['scalars'])
+    for name in meta['arrays']:
+        parts = name.split('/')
+        if parts[0] == 'traces':
+            sim_data.setdefault(parts[1], {})[parts[2]] = load_array(path, name, mmap)
+        else:
+            sim_data[name] = load_array(path, name, mmap)
+    return {'simData': sim_data, 'simConfig': meta['simConfig'], 'pops': meta['pops']}
+
+
+def configure_output(cfg):
+    """
+    Apply cfg.saveFormat (call before sim.create).
+
+    With 'npy', NetPyNE's own file output is switched off (sim.analyze() and
+    sim.saveData() write nothing) and save_data() writes the directory instead.
+    """
+    if cfg.saveFormat not in SAVE_FORMATS:
+        raise ValueError(f"Unknown saveFormat '{cfg.saveFormat}' (expected one of {SAVE_FORMATS})")
+    if cfg.saveFormat == 'npy':
+        cfg.saveJson = False
+        cfg.savePickle = False
+        cfg.saveCellSecs = False
+        cfg.saveCellConns = False
+
+
+def save_data(sim, cfg):
+    """
+    Write the gathered data in the npy format (rank 0; after sim.gatherData()).
+
+    No-op for cfg.saveFormat = 'json', which NetPyNE's sim.saveData() handles.
+
+    Returns:
+        Output path, or None
+    """
+    if cfg.saveFormat != 'npy' or sim.rank != 0:
+        return None
+
+    path = output_path(cfg.saveFolder, cfg.simLabel, 'npy')
+    os.makedirs(cfg.saveFolder, exist_ok=True)
+    t0 = time.perf_counter()
+    size = write_output(path, sim.allSimData, dict(cfg.__dict__), pop_gid_ranges(cfg))
+    print(f"✓ Saved {path}/ ({size / 1e6:.1f} MB, {time.perf_counter() - t0:.2f} s)")
+    return path
+
+
+def convert_json(json_path, path=None):
+    """
+    Convert a NetPyNE JSON output to the npy format.
+
+    Args:
+        json_path: '<folder>/<label>_data.json'
+        path: Output directory (default: json_path without '.json')
+
+    Returns:
+        Output directory
+    """
+    if path is None:
+        path = os.path.splitext(json_path)[0]
+
+    with open(json_path) as f:
+        data = json.load(f)
+    config = data.get('simConfig', {})
+    pops = pop_gid_ranges(SimpleNamespace(allpops=config.get('allpops', []),
+                                          cellNumber=config.get('cellNumber', {}),
+                                          scale=config.get('scale', 1.0),
+                                          popGidRanges=config.get('popGidRanges')))
+    write_output(path, data.get('simData', {}), config, pops)
+    return path
+
+
+def ensure_npy_output(path):
+    """
+    npy output directory for path, converting a JSON output once if needed.
+
+    The conversion is written next to the JSON ('<label>_data/') and redone
+    only when the JSON is newer than it.
+    """
+    if is_npy_output(path):
+        return path
+
+    npy_path = os.path.splitext(path)[0]
+    if is_npy_output(npy_path) and \
+            os.path.getmtime(os.path.join(npy_path, META_FILE)) >= os.path.getmtime(path):
+        return npy_path
+
+    t0 = time.perf_counter()
+    convert_json(path, npy_path)
+    print(f"  ✓ Converted to {npy_path}/ ({time.perf_counter() - t0:.1f} s, once)")
+    return npy_path
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python output_io.py <data_file.json> [output_dir]")
+        sys.exit(1)
+
+    json_path = sys.argv[1]
+    path = convert_json(json_path, sys.argv[2] if len(sys.argv) > 2 else None)
+
+    t0 = time.perf_counter()
+    with open(json_path) as f:
+        json.load(f)
+    t_json = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    load_output(path)
+    t_npy = time.perf_counter() - t0
+
+    size_json, size_npy = dir_size(json_path), dir_size(path)
+    print(f"✓ {json_path} -> {path}/")
+    print(f"  Size: {size_json / 1e6:.1f} MB -> {size_npy / 1e6:.1f} MB ({size_json / max(size_npy, 1):.1f}x)")
+    print(f"  Read: {t_json:.2f} s -> {t_npy:.3f} s ({t_json / max(t_npy, 1e-9):.1f}x)")
@@ -0,0 +1,330 @@
+"""
+parallel.py
+MPI helpers for running init.py under mpiexec
+
+    mpiexec -n 64 python init.py
+
+- root_print: print from rank 0 only
+- record_pop_gid_ranges / pop_gid_ranges: gid range of every population as
+  created (after netParams.scale)
+- configure_parallel: lean gather (spikes + LFP + recorded traces, no cell/conn
+  dumps) and the load balancer selected by cfg.loadBalance
+- install_load_balance: replaces NetPyNE's round-robin gid assignment with a
+  global greedy (LPT) bin packing of cells by estimated cost
+  ('compartments': segments, 'complexity': segments x mechanisms)
+- report_load_balance: per-rank predicted cost vs measured computation time
+- atomic_savez: cache writes that are safe when several ranks write the same file
+
+Everything here is a no-op (or plain print) in a serial run.
+"""
+
+import os
+
+
+def get_pc():
+    """The (global) NEURON ParallelContext."""
+    from neuron import h
+    return h.ParallelContext()
+
+
+def rank():
+    return int(get_pc().id())
+
+
+def nhost():
+    return int(get_pc().nhost())
+
+
+def is_root():
+    return rank() == 0
+
+
+def root_print(*args, **kwargs):
+    """print() on rank 0 only."""
+    if is_root():
+        print(*args, **kwargs)
+
+
+def atomic_savez(path, **arrays):
+    """np.savez to path via a per-process temporary file and os.replace."""
+    import numpy as np
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+
+
+def scaled_cell_number(cfg, pop):
+    """Number of cells NetPyNE creates for pop: int(netParams.scale * numCells)."""
+    return int(getattr(cfg, 'scale', 1.0) * cfg.cellNumber[pop])
+
+
+def record_pop_gid_ranges(sim, cfg):
+    """
+    Store the gid range of every created network population in cfg.popGidRanges.
+
+    NetPyNE multiplies netParams.scale (cfg.scale) into numCells, so the
+    ranges are taken from the created pops (sim.net.pops[pop].cellGids, merged
+    over ranks) rather than cfg.cellNumber. Being part of cfg, they are saved
+    with the simConfig of every output. Collective; call on every rank right
+    after sim.create().
+
+    Returns:
+        dict pop -> (first_gid, last_gid + 1)
+    """
+    cfg.popGidRanges = None
+    expected = pop_gid_ranges(cfg)     # kept for pops with no cells
+
+    local = {}
+    for pop in cfg.allpops:
+        gids = sim.net.pops[pop].cellGids
+        if gids:
+            local[pop] = (min(gids), max(gids) + 1)
+
+    merged = {}
+    for host_ranges in get_pc().py_allgather(local):
+        for pop, (first, stop) in host_ranges.items():
+            lo, hi = merged.get(pop, (first, stop))
+            merged[pop] = (min(lo, first), max(hi, stop))
+
+    cfg.popGidRanges = {pop: list(merged.get(pop, expected[pop])) for pop in cfg.allpops}
+    return pop_gid_ranges(cfg)
+
+
+def pop_gid_ranges(cfg):
+    """
+    gid range of every network population: dict pop -> (first_gid, last_gid + 1).
+
+    Uses cfg.popGidRanges (record_pop_gid_ranges) when present. Otherwise the
+    ranges are rebuilt in cfg.allpops order (build_netParams adds cfg.allpops
+    first) the way NetPyNE numbers gids: each pop starts where the previous
+    one would end unscaled (lastGid advances by numCells) and holds
+    scaled_cell_number cells, so with cfg.scale < 1 there are unused gids
+    between pops.
+    """
+    recorded = getattr(cfg, 'popGidRanges', None)
+    if recorded:
+        return {pop: (int(first), int(stop)) for pop, (first, stop) in recorded.items()}
+
+    ranges = {}
+    start = 0
+    for pop in cfg.allpops:
+        ranges[pop] = (start, start + scaled_cell_number(cfg, pop))
+        start += cfg.cellNumber[pop]
+    return ranges
+
+
+#------------------------------------------------------------------------------
+# Load balancing (cfg.loadBalance)
+#------------------------------------------------------------------------------
+LOAD_BALANCE_MODES = ['roundrobin', 'compartments', 'complexity']
+
+
+def cell_type_costs(cell_params, model):
+    """
+    Estimated cost of one cell of each imported cell type.
+
+    cellParams hold one instantiated prototype per type (importCellParams), so
+    the estimate needs no extra cells.
+
+    Args:
+        cell_params: netParams.cellParams
+        model: 'compartments' (sum of nseg) or 'complexity' (sum over sections
+            of nseg x (1 + number of density mechanisms))
+
+    Returns:
+        dict cellType -> cost
+    """
+    costs = {}
+    for cell_type, params in cell_params.items():
+        if 'secs' not in params:
+            continue
+        cost = 0
+        for sec in params['secs'].values():
+            nseg = sec.get('geom', {}).get('nseg', 1)
+            if model == 'complexity':
+                cost += nseg * (1 + len(sec.get('mechs', {})))
+            else:
+                cost += nseg
+        costs[cell_type] = cost
+    return costs
+
+
+def make_cell_cost(sim, model):
+    """Function pop tags -> cost of one cell, for the given cost model."""
+    costs = {}
+
+    def cell_cost(tags):
+        if not costs:
+            costs.update(cell_type_costs(sim.net.params.cellParams, model))
+        # Artificial cells (NetStim/VecStim pops) are nearly free
+        return costs.get(tags.get('cellType'), 1)
+
+    return cell_cost
+
+
+def plan_assignment(pop_sizes, pop_cost, n_hosts):
+    """
+    Greedy LPT bin packing of every cell of every population onto n_hosts ranks.
+
+    Cells are taken in decreasing cost (ties in population order, then cell
+    index) and each goes to the currently least-loaded rank (ties to the lowest
+    rank id). Deterministic, so every rank computes the same plan.
+
+    Args:
+        pop_sizes: dict pop -> number of cells (in creation order)
+        pop_cost: dict pop -> cost of one cell
+        n_hosts: Number of ranks
+
+    Returns:
+        plan: dict pop -> {host: [cell indices]}
+        load: list of predicted cost per rank
+    """
+    import heapq
+
+    order = list(pop_sizes)
+    cells = sorted((-pop_cost[pop], k, i, pop)
+                   for k, pop in enumerate(order) for i in range(pop_sizes[pop]))
+
+    heap = [(0.0, host) for host in range(n_hosts)]
+    load = [0.0] * n_hosts
+    plan = {pop: {host: [] for host in range(n_hosts)} for pop in order}
+    for neg_cost, _, i, pop in cells:
+        host_load, host = heapq.heappop(heap)
+        plan[pop][host].append(i)
+        load[host] = host_load - neg_cost
+        heapq.heappush(heap, (load[host], host))
+
+    for pop in order:
+        for host in plan[pop]:
+            plan[pop][host].sort()
+    return plan, load
+
+
+def install_load_balance(sim, cell_cost):
+    """
+    Replace NetPyNE's round-robin Pop._distributeCells with a global LPT plan.
+
+    The plan is computed on the first call from sim.net.params.popParams (all
+    populations at once, so expensive cells of later populations are packed
+    together with cheap ones of earlier populations), with numCells multiplied
+    by netParams.scale. A population whose size still differs
+    from the plan (e.g. density-based pops) falls back to least-loaded
+    assignment within that population, with a warning.
+
+    Args:
+        sim: NetPyNE sim object
+        cell_cost: Function pop tags -> cost of one cell (make_cell_cost)
+    """
+    from netpyne.network.pop import Pop
+
+    state = {'plan': None, 'load': [0.0] * nhost()}
+
+    def _distributeCells(self, numCellsPop):
+        pop = self.tags['pop']
+
+        if state['plan'] is None:
+            pop_params = sim.net.params.popParams
+            scale = sim.net.params.scale
+            sizes = {label: int(p['numCells'] * scale) for label, p in pop_params.items() if 'numCells' in p}
+            costs = {label: cell_cost(dict(p, pop=label)) for label, p in pop_params.items()}
+            state['plan'], state['load'] = plan_assignment(sizes, costs, sim.nhosts)
+
+        plan = state['plan'].get(pop)
+        planned = sum(len(v) for v in plan.values()) if plan is not None else None
+        if planned == numCellsPop:
+            return plan
+        root_print(f"⚠ Load balance: {pop} has {numCellsPop} cells, plan has {planned}; "
+                   "assigning it least-loaded")
+
+        load = state['load']
+        cost = cell_cost(self.tags)
+        hostCells = {host: [] for host in range(sim.nhosts)}
+        for i in range(numCellsPop):
+            host = min(range(sim.nhosts), key=lambda k: (load[k], k))
+            hostCells[host].append(i)
+            load[host] += cost
+        return hostCells
+
+    Pop._distributeCells = _distributeCells
+
+
+def configure_parallel(sim, cfg):
+    """
+    Set up an MPI run (call before sim.create).
+
+    Returns:
+        Number of ranks
+    """
+    n = nhost()
+    if n == 1:
+        return n
+
+    if cfg.mpiLeanGather:
+        # Gather simData (spikes, LFP, traces) only, not every cell's sections/conns
+        cfg.gatherOnlySimData = True
+        cfg.saveCellSecs = False
+        cfg.saveCellConns = False
+
+    if cfg.loadBalance not in LOAD_BALANCE_MODES:
+        raise ValueError(f"Unknown loadBalance '{cfg.loadBalance}' (expected one of {LOAD_BALANCE_MODES})")
+    if cfg.loadBalance != 'roundrobin':
+        install_load_balance(sim, make_cell_cost(sim, cfg.loadBalance))
+
+    root_print(f"✓ MPI: {n} ranks (lean gather: {cfg.mpiLeanGather}, "
+               f"load balance: {cfg.loadBalance})")
+    return n
+
+
+def report_load_balance(sim, cfg):
+    """
+    Print per-rank cells, compartments, predicted cost and measured computation
+    time; collective call.
+
+    Measured time is pc.step_time() (time spent integrating, excluding spike
+    exchange waits). Both predicted and measured columns are also shown
+    relative to their mean, so a good cost model gives matching columns;
+    imbalance = max/mean step time (1.0 = perfect balance).
+
+    Returns:
+        dict with 'step_time', 'predicted', 'n_cells', 'n_compartments' (lists
+        by rank) and 'imbalance', on every rank
+    """
+    pc = get_pc()
+
+    model = cfg.loadBalance if cfg.loadBalance != 'roundrobin' else 'complexity'
+    cell_cost = make_cell_cost(sim, model)
+
+    local_cells = [cell for cell in sim.net.cells if hasattr(cell, 'secs')]
+    local_compartments = sum(sec['hObj'].nseg for cell in local_cells for sec in cell.secs.values())
+    local_predicted = sum(cell_cost(cell.tags) for cell in local_cells)
+
+    step_time = list(pc.py_allgather(pc.step_time()))
+    predicted = list(pc.py_allgather(local_predicted))
+    n_cells = list(pc.py_allgather(len(local_cells)))
+    n_compartments = list(pc.py_allgather(local_compartments))
+
+    mean_time = sum(step_time) / len(step_time)
+    mean_predicted = sum(predicted) / len(predicted)
+    imbalance = max(step_time) / mean_time if mean_time > 0 else 1.0
+    predicted_imbalance = max(predicted) / mean_predicted if mean_predicted > 0 else 1.0
+
+    root_print("\n" + "="*70)
+    root_print(f"LOAD BALANCE ({cfg.loadBalance}, cost model: {model})")
+    root_print("="*70)
+    root_print(f"{'rank':>6}{'cells':>8}{'comps':>9}{'predicted':>12}{'pred/mean':>11}"
+               f"{'step (s)':>10}{'meas/mean':>11}")
+    for r, (c, n, p, t) in enumerate(zip(n_cells, n_compartments, predicted, step_time)):
+        p_rel = p / mean_predicted if mean_predicted > 0 else 1.0
+        t_rel = t / mean_time if mean_time > 0 else 1.0
+        root_print(f"{r:>6}{c:>8}{n:>9}{p:>12.0f}{p_rel:>11.2f}{t:>10.2f}{t_rel:>11.2f}")
+    root_print(f"\nImbalance (max/mean): predicted {predicted_imbalance:.2f}, measured {imbalance:.2f}")
+
+    return {
+        'step_time': step_time,
+        'predicted': predicted,
+        'n_cells': n_cells,
+        'n_compartments': n_compartments,
+        'imbalance': imbalance,
+    }
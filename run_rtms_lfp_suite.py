@@ -16,12 +16,21 @@ All use:
 
 Usage:
     python run_rtms_lfp_suite.py
+    python run_rtms_lfp_suite.py --grid ef_amp_V_per_m=20,40,60 freq_Hz=5,10,20
+
+With --grid, each condition simulates the shared pre-stimulus prefix once,
+checkpoints it just before the onset, and branches every combination of the grid from there
+(see checkpoint.py). results/<condition>_branches.json records which
+checkpoint each branch came from.
 """
 
 import os
 import sys
 import subprocess
 import json
+import itertools
+
+import output_io
 
 # Ensure we're in the project directory
 os.chdir(os.path.dirname(os.path.abspath(__file__)))
@@ -41,7 +50,50 @@ conditions = [
 ]
 
 
-def run_single_simulation(name, ad_model, ad_stage, description):
+# tms_params keys that may vary across a branched grid (all share stim_start_ms;
+# the checkpoint precedes the onset, so width and shape may change too)
+GRID_KEYS = ['ef_amp_V_per_m', 'freq_Hz', 'width_ms', 'pshape']
+
+
+def parse_grid(args):
+    """
+    Parse '--grid key=v1,v2 key=v1,...' command-line arguments.
+
+    Returns:
+        dict key -> list of values (floats where possible), or None without --grid
+    """
+    if '--grid' not in args:
+        return None
+
+    grid = {}
+    for arg in args[args.index('--grid') + 1:]:
+        if arg.startswith('--'):
+            break
+        key, _, values = arg.partition('=')
+        if key not in GRID_KEYS:
+            raise ValueError(f"Grid key '{key}' not supported (expected one of {GRID_KEYS})")
+        parsed = []
+        for value in values.split(','):
+            try:
+                parsed.append(float(value))
+            except ValueError:
+                parsed.append(value)
+        grid[key] = parsed
+    return grid
+
+
+def expand_grid(grid):
+    """All combinations of a grid, as a list of tms_params override dicts."""
+    keys = list(grid)
+    return [dict(zip(keys, combo)) for combo in itertools.product(*(grid[k] for k in keys))]
+
+
+def branches_file(name):
+    """Branch records (simLabel, variant, checkpoint) written by a branched condition."""
+    return f'results/{name}_branches.json'
+
+
+def run_single_simulation(name, ad_model, ad_stage, description, variants=None):
     """
     Run a single simulation with specified parameters.
 
@@ -50,6 +102,9 @@ def run_single_simulation(name, ad_model, ad_stage, description):
         ad_model: True/False for AD
         ad_stage: 0 (healthy), 1, 2, or 3
         description: Human-readable description
+        variants: Optional list of tms_params overrides; the condition is then
+            simulated up to the TMS onset once and every variant is branched from
+            that checkpoint (outputs '<name>__<variant>', see branches_file)
     """
     print("\n" + "="*80)
     print(f"CONDITION: {name}")
@@ -112,24 +167,59 @@ print(f"[CONFIG] TMS: {{cfg.tms_params['ef_amp_V_per_m']}} V/m, {{cfg.tms_params
 print(f"[CONFIG] LFP: {{len(cfg.recordLFP)}} electrodes")
 
 # Load network
-from netParams import netParams
+from netParams import build_netParams
+import synapses
+import background
+import coreneuron_mode
+import channel_tables
+import output_io
+import parallel
+netParams = build_netParams(cfg)
 
 # Create network
 print("\\n[Creating network...]")
+output_io.configure_output(cfg)
+if cfg.coreneuron:
+    coreneuron_mode.configure_coreneuron(cfg)
 sim.create(netParams, cfg)
+parallel.record_pop_gid_ranges(sim, cfg)
+synapses.setup_synapses(sim, cfg)
+background.setup_background(sim, cfg)
+channel_tables.setup_channel_tables(cfg)
 
 # Apply TMS
 print("\\n[Applying TMS...]")
 import tms
 tms_clamps = tms.apply_tms_from_params(sim, cfg)
 
+"""
+
+    if variants is None:
+        run_script += f"""
 # Run simulation
 print("\\n[Running simulation...]")
-sim.simulate()
+coreneuron_mode.simulate(sim, cfg)  # sim.simulate(), via CoreNEURON if cfg.coreneuron
 
 # Save data
 print("\\n[Saving data...]")
 sim.analyze()
+output_io.save_data(sim, cfg)
+
+print("\\n[DONE]")
+"""
+    else:
+        run_script += f"""
+# Branch every TMS variant from one warm-up checkpoint just before stim_start_ms
+import json
+import checkpoint
+if cfg.coreneuron:
+    raise ValueError("TMS grid branching uses SaveState and needs the NEURON path (cfg.coreneuron = False)")
+
+print("\\n[Warm-up to {{checkpoint.checkpoint_time(cfg):g}} ms, then {len(variants)} branches...]")
+records = checkpoint.run_tms_branches(sim, cfg, tms_clamps, {variants!r}, '{name}')
+
+with open('{branches_file(name)}', 'w') as f:
+    json.dump(records, f, indent=2)
 
 print("\\n[DONE]")
 """
@@ -177,11 +267,11 @@ def analyze_simulation(name):
     Args:
         name: Condition name
     """
-    data_file = f'output/{name}_data.json'
+    data_file = output_io.find_output('output', name)
     output_prefix = f'figures/rtms_lfp_{name}'
 
-    if not os.path.exists(data_file):
-        print(f"  ✗ Data file not found: {data_file}")
+    if data_file is None:
+        print(f"  ✗ Data not found: {output_io.output_path('output', name)}/ or .json")
         return False
 
     print(f"\n[Analyzing] {name}...")
@@ -222,12 +312,19 @@ def main():
     for name, ad, stage, desc in conditions:
         print(f"  - {name}: {desc}")
 
+    grid = parse_grid(sys.argv[1:])
+    variants = expand_grid(grid) if grid else None
+    if variants:
+        print(f"\nTMS grid: {grid}")
+        print(f"  {len(variants)} branches per condition from one warm-up checkpoint each")
+
     input("\nPress Enter to start (Ctrl+C to cancel)...")
 
     # Track results
     results = {
         'simulations': {},
-        'analyses': {}
+        'analyses': {},
+        'branches': {}
     }
 
     # Run simulations
@@ -236,18 +333,30 @@ def main():
     print("="*80)
 
     for name, ad_model, ad_stage, description in conditions:
-        success = run_single_simulation(name, ad_model, ad_stage, description)
-        results['simulations'][name] = success
+        success = run_single_simulation(name, ad_model, ad_stage, description, variants)
+        if variants is None:
+            results['simulations'][name] = success
+            continue
+
+        # One result per branch, labelled with its checkpoint
+        branches = []
+        if success and os.path.exists(branches_file(name)):
+            with open(branches_file(name)) as f:
+                branches = json.load(f)
+        results['branches'][name] = branches
+        for branch in branches:
+            results['simulations'][branch['simLabel']] = True
+        if not branches:
+            results['simulations'][name] = False
 
     # Run analyses
     print("\n" + "="*80)
     print("PHASE 2: ANALYZING RESULTS")
     print("="*80)
 
-    for name, _, _, _ in conditions:
-        if results['simulations'].get(name, False):
-            success = analyze_simulation(name)
-            results['analyses'][name] = success
+    for name, success in results['simulations'].items():
+        if success:
+            results['analyses'][name] = analyze_simulation(name)
         else:
             print(f"\n[Skipping] {name} (simulation failed)")
             results['analyses'][name] = False
@@ -276,6 +385,7 @@ def main():
                 {'name': n, 'ad_model': a, 'ad_stage': s, 'description': d}
                 for n, a, s, d in conditions
             ],
+            'grid': grid,
             'results': results
         }, f, indent=2)
 
@@ -289,10 +399,11 @@ def main():
     sim_success = sum(1 for s in results['simulations'].values() if s)
     ana_success = sum(1 for s in results['analyses'].values() if s)
 
-    print(f"\nSuccessful simulations: {sim_success}/{len(conditions)}")
-    print(f"Successful analyses: {ana_success}/{len(conditions)}")
+    n_runs = len(conditions) * (len(variants) if variants else 1)
+    print(f"\nSuccessful simulations: {sim_success}/{n_runs}")
+    print(f"Successful analyses: {ana_success}/{n_runs}")
 
-    if sim_success == len(conditions) and ana_success == len(conditions):
+    if sim_success == n_runs and ana_success == n_runs:
         print("\n🎉 All tests passed!")
     else:
         print("\n⚠ Some tests failed - check output above")
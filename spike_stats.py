@@ -0,0 +1,135 @@
+"""
+spike_stats.py
+Vectorized spike statistics for the run summary
+
+All statistics are computed from the flat spkt/spkid arrays with a gid -> pop
+lookup array and np.bincount, so the cost is O(spikes + cells).
+"""
+
+import numpy as np
+
+from parallel import pop_gid_ranges, root_print
+
+
+def gid_pop_index(cfg):
+    """
+    gid -> population index lookup array (index into cfg.allpops).
+
+    Returns:
+        (pops, pop_of_gid) where pop_of_gid[gid] indexes pops (-1 for gids
+        between populations, left unused when cfg.scale < 1)
+    """
+    ranges = pop_gid_ranges(cfg)
+    pops = list(ranges)
+    n_cells = max(stop for _, stop in ranges.values()) if ranges else 0
+
+    pop_of_gid = np.full(n_cells, -1, dtype=np.int32)
+    for i, pop in enumerate(pops):
+        first, stop = ranges[pop]
+        pop_of_gid[first:stop] = i
+    return pops, pop_of_gid
+
+
+def cell_rates(spkt, spkid, n_cells, t_start, t_stop):
+    """Firing rate (Hz) of every gid in [t_start, t_stop)."""
+    in_window = (spkt >= t_start) & (spkt < t_stop)
+    counts = np.bincount(spkid[in_window], minlength=n_cells)[:n_cells]
+    duration_s = (t_stop - t_start) / 1000.0
+    return counts / duration_s if duration_s > 0 else np.zeros(n_cells)
+
+
+def cell_cv_isi(spkt, spkid, n_cells):
+    """
+    Coefficient of variation of the inter-spike intervals of every gid.
+
+    Returns:
+        Array of CV-ISI per gid (NaN for cells with fewer than 3 spikes)
+    """
+    order = np.lexsort((spkt, spkid))
+    t = spkt[order]
+    gid = spkid[order]
+
+    same_cell = gid[1:] == gid[:-1]
+    isi = np.diff(t)[same_cell]
+    isi_gid = gid[1:][same_cell]
+
+    n = np.bincount(isi_gid, minlength=n_cells)[:n_cells]
+    s1 = np.bincount(isi_gid, weights=isi, minlength=n_cells)[:n_cells]
+    s2 = np.bincount(isi_gid, weights=isi * isi, minlength=n_cells)[:n_cells]
+
+    cv = np.full(n_cells, np.nan)
+    ok = n >= 2
+    mean = s1[ok] / n[ok]
+    var = np.maximum(s2[ok] / n[ok] - mean ** 2, 0.0)
+    cv[ok] = np.sqrt(var) / mean
+    return cv
+
+
+def tms_windows(cfg):
+    """Pre / during / post TMS windows (ms) from cfg.tms_params."""
+    start = cfg.tms_params['stim_start_ms']
+    end = cfg.tms_params['stim_end_ms']
+    return {
+        'pre': (0.0, start),
+        'during': (start, end),
+        'post': (end, cfg.duration),
+    }
+
+
+def population_summary(spkt, spkid, cfg):
+    """
+    Per-population spike statistics.
+
+    Args:
+        spkt, spkid: Spike times (ms) and gids (e.g. sim.allSimData)
+        cfg: SimConfig (populations, duration, tms_params)
+
+    Returns:
+        dict pop -> {'n_spikes', 'rate', 'cell_rates', 'cv_isi',
+                     'window_rates': {'pre', 'during', 'post'}}
+        rate and window rates are means over cells (Hz); cv_isi is the mean
+        over cells with at least 3 spikes
+    """
+    spkt = np.asarray(spkt, dtype=float)
+    spkid = np.asarray(spkid, dtype=np.int64)
+
+    pops, pop_of_gid = gid_pop_index(cfg)
+    n_cells = len(pop_of_gid)
+
+    # Spikes from non-network gids (e.g. stimulator pops) are ignored
+    keep = (spkid >= 0) & (spkid < n_cells)
+    keep[keep] = pop_of_gid[spkid[keep]] >= 0
+    spkt, spkid = spkt[keep], spkid[keep]
+
+    rates = cell_rates(spkt, spkid, n_cells, 0.0, cfg.duration)
+    cv = cell_cv_isi(spkt, spkid, n_cells)
+    window_rates = {name: cell_rates(spkt, spkid, n_cells, t0, t1)
+                    for name, (t0, t1) in tms_windows(cfg).items()}
+    pop_spikes = np.bincount(pop_of_gid[spkid], minlength=len(pops))
+
+    summary = {}
+    for i, pop in enumerate(pops):
+        cells = pop_of_gid == i
+        pop_cv = cv[cells]
+        summary[pop] = {
+            'n_spikes': int(pop_spikes[i]),
+            'rate': float(rates[cells].mean()) if cells.any() else 0.0,
+            'cell_rates': rates[cells],
+            'cv_isi': float(np.nanmean(pop_cv)) if np.isfinite(pop_cv).any() else float('nan'),
+            'window_rates': {name: float(r[cells].mean()) if cells.any() else 0.0
+                             for name, r in window_rates.items()},
+        }
+    return summary
+
+
+def print_population_summary(summary):
+    """Print the table returned by population_summary."""
+    root_print(f"\n{'Population':<12}{'spikes':>8}{'rate (Hz)':>11}{'min-max (Hz)':>15}{'CV-ISI':>8}"
+          f"{'pre':>8}{'during':>8}{'post':>8}")
+    for pop, s in summary.items():
+        r = s['cell_rates']
+        r_range = f"{r.min():.1f}-{r.max():.1f}" if len(r) else "-"
+        w = s['window_rates']
+        root_print(f"{pop:<12}{s['n_spikes']:>8}{s['rate']:>11.2f}{r_range:>15}{s['cv_isi']:>8.2f}"
+              f"{w['pre']:>8.2f}{w['during']:>8.2f}{w['post']:>8.2f}")
+    root_print("(pre/during/post: mean rate in Hz relative to the TMS window)")
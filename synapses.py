@@ -0,0 +1,234 @@
+"""
+synapses.py
+Synaptic mechanism definitions for the connection-specific (pre+post) synapses
+
+Two modes, selected with cfg.synMechMode:
+
+- 'exp2syn': deterministic Exp2Syn (AMPA-like for PYR inputs, GABAA-like for
+  interneuron inputs). Cheapest per event; ignores the STP sheets.
+- 'stp':     ProbAMPANMDA (PYR inputs) / ProbUDFsyn (interneuron inputs) with
+  Use, Dep and Fac taken from the Use, Depression and Facilitation sheets of
+  Circuit_param.xls (Tsodyks-Markram / Fuhrmann et al. 2002 release model).
+  The Depression and Facilitation sheets are already in ms, the unit of the
+  Dep and Fac parameters of both mod files, so they are used unconverted.
+
+In 'stp' mode gmax is set to 1 so the NetCon weight keeps the meaning it has
+for Exp2Syn (peak conductance in uS from syn_cond), and each synapse draws
+its release decisions from its own Random123 stream (attach_synapse_rngs,
+called after sim.create()).
+
+ProbAMPANMDA adds a Mg-blocked NMDA conductance (2/65 ms) scaled by
+weight_factor_NMDA, which defaults to 1 in the mod file. With nmda=False
+(cfg.stpNMDA = False, the default) it is set to 0, so PYR inputs are
+AMPA-only like the Exp2Syn they replace and the two modes differ only by
+short-term plasticity and release failures.
+"""
+
+from parallel import root_print
+
+
+SYN_MECH_MODES = ['exp2syn', 'stp']
+
+# Kinetics shared by both modes (ms, mV)
+EXC_KINETICS = {'tau_r_AMPA': 0.3, 'tau_d_AMPA': 3.0, 'tau_r_NMDA': 2.0, 'tau_d_NMDA': 65.0, 'e': 0}
+INH_KINETICS = {'tau_r': 1.0, 'tau_d': 10.0, 'e': -80}
+
+STP_MECHS = ['ProbAMPANMDA', 'ProbUDFsyn']
+
+# Linear mechanisms whose instances can be shared by several NetCons
+MERGEABLE_MECHS = ['Exp2Syn']
+
+# Random objects must outlive the synapses that point to them
+_SYN_RNGS = []
+
+
+def stp_params(circuit, pre, post):
+    """Use (1), Dep (ms) and Fac (ms) for pre->post from the circuit sheets."""
+    return {
+        'Use': float(circuit['Use'].at[pre, post]),
+        'Dep': float(circuit['Depression'].at[pre, post]),
+        'Fac': float(circuit['Facilitation'].at[pre, post]),
+    }
+
+
+def syn_mech_params(pre, post, circuit=None, mode='exp2syn', nmda=False):
+    """
+    synMechParams entry for connections pre->post.
+
+    Args:
+        pre, post: Population names (excitatory if 'PYR' in pre)
+        circuit: dict of circuit DataFrames (required for mode='stp')
+        mode: 'exp2syn' or 'stp'
+        nmda: In 'stp' mode, keep the NMDA component of ProbAMPANMDA
+            (weight_factor_NMDA = 1) instead of switching it off
+
+    Returns:
+        dict for netParams.synMechParams
+    """
+    excitatory = "PYR" in pre
+
+    if mode == 'exp2syn':
+        if excitatory:
+            return {'mod': 'Exp2Syn', 'tau1': EXC_KINETICS['tau_r_AMPA'],
+                    'tau2': EXC_KINETICS['tau_d_AMPA'], 'e': EXC_KINETICS['e']}
+        return {'mod': 'Exp2Syn', 'tau1': INH_KINETICS['tau_r'],
+                'tau2': INH_KINETICS['tau_d'], 'e': INH_KINETICS['e']}
+
+    if mode == 'stp':
+        params = {'mod': 'ProbAMPANMDA' if excitatory else 'ProbUDFsyn'}
+        params.update(EXC_KINETICS if excitatory else INH_KINETICS)
+        params.update(stp_params(circuit, pre, post))
+        params['u0'] = 0
+        params['gmax'] = 1.0
+        if excitatory:
+            params['weight_factor_NMDA'] = 1.0 if nmda else 0.0
+        return params
+
+    raise ValueError(f"Unknown synMechMode '{mode}' (expected one of {SYN_MECH_MODES})")
+
+
+def attach_synapse_rngs(sim, seed):
+    """
+    Give every ProbAMPANMDA/ProbUDFsyn instance its own uniform Random123 stream.
+
+    Without this the mechanisms fall back to a shared exprand(1) stream, which
+    is neither uniform nor reproducible across MPI layouts. Streams are keyed on
+    (gid, synapse index, seed), so results do not depend on the number of ranks.
+
+    Args:
+        sim: NetPyNE sim object (after sim.create())
+        seed: Integer seed, e.g. cfg.seeds['stim']
+
+    Returns:
+        Number of synapses that received a stream
+    """
+    from neuron import h
+
+    count = 0
+    for cell in sim.net.cells:
+        if not hasattr(cell, 'secs'):
+            continue
+        index = 0
+        for sec_name in sorted(cell.secs):
+            for syn in cell.secs[sec_name].get('synMechs', []):
+                hobj = syn.get('hObj')
+                if hobj is None or hobj.hname().split('[')[0] not in STP_MECHS:
+                    continue
+                rng = h.Random()
+                rng.Random123(cell.gid, index, seed)
+                rng.uniform(0, 1)
+                hobj.setRNG(rng)
+                _SYN_RNGS.append(rng)
+                index += 1
+                count += 1
+    return count
+
+
+def segment_index(sec, loc):
+    """Index of the segment containing loc (0 and 1 are the zero-area end nodes)."""
+    if loc <= 0:
+        return -1
+    if loc >= 1:
+        return sec.nseg
+    return min(int(loc * sec.nseg), sec.nseg - 1)
+
+
+def merge_key(syn_mech_params, label):
+    """Kinetics key for a synMech label, or None if its mechanism is not mergeable."""
+    params = syn_mech_params.get(label)
+    if params is None or params.get('mod') not in MERGEABLE_MECHS:
+        return None
+    return tuple(sorted((k, v) for k, v in params.items() if not callable(v)))
+
+
+def _retarget(sim, netcon, target):
+    """New NetCon from the same source (gid or local NetStim) onto target."""
+    from neuron import h
+
+    srcgid = int(netcon.srcgid())
+    if srcgid >= 0:
+        new = sim.pc.gid_connect(srcgid, target)
+    else:
+        new = h.NetCon(netcon.pre(), target)
+        new.threshold = netcon.threshold
+    new.weight[0] = netcon.weight[0]
+    new.delay = netcon.delay
+    return new
+
+
+def merge_synapses(sim, syn_mech_params):
+    """
+    Collapse identical linear synapses on the same segment into one point process.
+
+    Exp2Syn is linear in its inputs, so N instances with the same kinetics in
+    one segment are equivalent to a single instance receiving all N NetCons.
+    For every cell, synapses are grouped by (section, segment, kinetics); the
+    first of each group is kept and the NetCons of the others are recreated on
+    it (same source, weight and delay). Synapses of different labels with
+    identical parameters (e.g. 'AMPA' and 'HL23PYRHL23PV') are merged too.
+
+    Must run after sim.create() and before the simulation is initialized.
+
+    Args:
+        sim: NetPyNE sim object
+        syn_mech_params: netParams.synMechParams
+
+    Returns:
+        (n_before, n_after) point-process counts for the mergeable mechanisms
+    """
+    n_before = n_after = 0
+    for cell in sim.net.cells:
+        if not hasattr(cell, 'secs'):
+            continue
+
+        replaced = {}   # hname of a removed synapse -> kept synapse hObj
+        for sec in cell.secs.values():
+            keepers = {}
+            kept = []
+            for syn in sec.get('synMechs', []):
+                key = merge_key(syn_mech_params, syn['label'])
+                if key is None or syn.get('hObj') is None:
+                    kept.append(syn)
+                    continue
+                n_before += 1
+                key = (segment_index(sec['hObj'], syn['loc']), key)
+                if key in keepers:
+                    replaced[syn['hObj'].hname()] = keepers[key]['hObj']
+                else:
+                    keepers[key] = syn
+                    kept.append(syn)
+                    n_after += 1
+            if 'synMechs' in sec:
+                sec['synMechs'] = kept
+
+        if not replaced:
+            continue
+        for conn in cell.conns:
+            netcon = conn.get('hObj')
+            if netcon is None:
+                continue
+            target = replaced.get(netcon.syn().hname())
+            if target is not None:
+                conn['hObj'] = _retarget(sim, netcon, target)
+
+    return n_before, n_after
+
+
+def setup_synapses(sim, cfg):
+    """
+    Post-create synapse setup: synapse merging (cfg.mergeSynapses) and, in 'stp'
+    mode, the per-synapse RNG streams.
+    """
+    if cfg.mergeSynapses:
+        n_before, n_after = merge_synapses(sim, sim.net.params.synMechParams)
+        removed = n_before - n_after
+        pct = 100.0 * removed / n_before if n_before else 0.0
+        root_print(f"✓ Synapse merging: {n_before} -> {n_after} point processes "
+              f"({removed} eliminated, {pct:.1f}%)")
+
+    if cfg.synMechMode != 'stp':
+        return 0
+
+    n = attach_synapse_rngs(sim, cfg.seeds['stim'])
+    root_print(f"✓ STP synapses: {n} Random123 release streams")
+    return n
@@ -0,0 +1,219 @@
+"""
+test_channel_tables.py
+
+Accuracy of the tabulated channel rates (channel_tables.py) against the
+analytic rates, with the same tabulated-rates build:
+
+1. Rate functions: every table output (mInf, mTau, ...) of every mechanism on
+   a voltage grid that falls between the table points (worst case for linear
+   interpolation)
+2. Network: the 100-cell network (Healthy, iclamp-engine rTMS at 10 Hz, LFP
+   on) run once with cfg.channelTables = False and once with True, each in
+   its own process; population rates, spike trains and LFP are compared
+
+Usage:
+    python channel_tables.py [dv_mV]
+    nrnivmodl mod_tables/
+    python test_channel_tables.py
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+# Ensure correct directory
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+DURATION = 1000.0         # ms
+V_PROBE = (-100.0, 60.0)  # mV, voltage range of the rate-function check
+INF_TOL = 1e-3            # max abs error of steady states
+TAU_TOL = 1e-2            # max relative error of time constants
+RATE_TOL = 0.05           # max relative difference of population rates
+OUTPUT_DIR = 'test_output'
+
+
+def rate_errors(mech, outputs, v_grid):
+    """Max error of each table output of mech over v_grid (abs for *Inf, relative otherwise)."""
+    import numpy as np
+    from neuron import h
+
+    sec = h.Section(name=f'probe_{mech}')
+    sec.insert(mech)
+
+    values = {}
+    for use in (0, 1):
+        setattr(h, f'usetable_{mech}', use)
+        rows = []
+        for v in v_grid:
+            h.finitialize(v)    # INITIAL calls rates() at v
+            rows.append([getattr(h, f'{name}_{mech}') for name in outputs])
+        values[use] = np.array(rows)
+    del sec
+
+    errors = {}
+    for i, name in enumerate(outputs):
+        exact, tabled = values[0][:, i], values[1][:, i]
+        if name.endswith('Inf'):
+            errors[name] = float(np.max(np.abs(tabled - exact)))
+        else:
+            errors[name] = float(np.max(np.abs(tabled - exact) / np.abs(exact)))
+    return errors
+
+
+def check_rate_functions():
+    import numpy as np
+    from neuron import h
+    import channel_tables
+
+    manifest = channel_tables.load_manifest()
+    dv = manifest['dv']
+    v_grid = np.arange(V_PROBE[0] + 0.37 * dv, V_PROBE[1], 0.73 * dv)
+
+    h.celsius = 34
+    ok = True
+    print(f"  {'mechanism':<10}{'method':<9}{'output':<8}{'max error':>12}")
+    for mech, info in manifest['mechs'].items():
+        for name, err in rate_errors(mech, info['outputs'], v_grid).items():
+            tol = INF_TOL if name.endswith('Inf') else TAU_TOL
+            mark = '✓' if err <= tol else '✗'
+            kind = 'abs' if name.endswith('Inf') else 'rel'
+            print(f"  {mech:<10}{info['method']:<9}{name:<8}{err:>12.2e} {kind} {mark}")
+            ok = ok and err <= tol
+    return ok
+
+
+def run_single(mode):
+    """Build and run the network with mode = 'analytic' or 'tables'; save spikes and LFP."""
+    from netpyne import sim
+    from cfg import cfg
+
+    cfg.channelTables = (mode == 'tables')
+    cfg.duration = DURATION
+    cfg.tms_enabled = True
+    cfg.tms_params['engine'] = 'iclamp'
+    cfg.tms_params['freq_Hz'] = 10.
+    cfg.tms_params['stim_start_ms'] = 400.0
+    cfg.tms_params['stim_end_ms'] = 700.0
+    cfg.tms_params['duration_ms'] = DURATION
+    cfg.simLabel = f'channel_tables_{mode}'
+    cfg.saveFolder = OUTPUT_DIR
+    cfg.saveJson = False
+    for plot in cfg.analysis.values():
+        plot['saveFig'] = False
+
+    from netParams import build_netParams
+    import channel_tables
+    import tms
+
+    netParams = build_netParams(cfg, verbose=False)
+
+    sim.create(netParams, cfg)
+    channel_tables.setup_channel_tables(cfg)
+    tms.apply_tms_from_params(sim, cfg)
+    sim.simulate()
+
+    result = {
+        'spkt': list(sim.allSimData['spkt']),
+        'spkid': list(sim.allSimData['spkid']),
+        'LFP': [list(row) for row in sim.allSimData['LFP']] if 'LFP' in sim.allSimData else [],
+        'runTime': sim.timingData.get('runTime'),
+    }
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    with open(os.path.join(OUTPUT_DIR, f'{cfg.simLabel}.json'), 'w') as f:
+        json.dump(result, f)
+
+
+def compare_networks(ref, test):
+    """Compare analytic (ref) and tabulated (test) runs; True if population rates agree."""
+    import numpy as np
+    from cfg import cfg
+    import spike_stats
+
+    cfg.duration = DURATION
+    ok = True
+
+    ref_summary = spike_stats.population_summary(ref['spkt'], ref['spkid'], cfg)
+    test_summary = spike_stats.population_summary(test['spkt'], test['spkid'], cfg)
+    print(f"  {'Population':<12}{'analytic (Hz)':>15}{'tables (Hz)':>13}{'rel diff':>10}")
+    for pop in ref_summary:
+        r_ref, r_test = ref_summary[pop]['rate'], test_summary[pop]['rate']
+        rel = abs(r_test - r_ref) / r_ref if r_ref > 0 else abs(r_test)
+        mark = '✓' if rel <= RATE_TOL else '✗'
+        print(f"  {pop:<12}{r_ref:>15.2f}{r_test:>13.2f}{rel:>10.3f} {mark}")
+        ok = ok and rel <= RATE_TOL
+
+    # Spike-train agreement up to the first divergence
+    _, pop_of_gid = spike_stats.gid_pop_index(cfg)
+    ref_t, ref_id = np.asarray(ref['spkt']), np.asarray(ref['spkid'])
+    test_t, test_id = np.asarray(test['spkt']), np.asarray(test['spkid'])
+    first_diff = DURATION
+    same_count = 0
+    for gid in range(len(pop_of_gid)):
+        a = np.sort(ref_t[ref_id == gid])
+        b = np.sort(test_t[test_id == gid])
+        same_count += len(a) == len(b)
+        n = min(len(a), len(b))
+        apart = np.nonzero(np.abs(a[:n] - b[:n]) > 0.1)[0]
+        if len(apart):
+            first_diff = min(first_diff, a[apart[0]], b[apart[0]])
+        elif len(a) != len(b):
+            first_diff = min(first_diff, (a if len(a) > n else b)[n])
+    print(f"  Cells with identical spike counts: {same_count}/{len(pop_of_gid)}")
+    if first_diff < DURATION:
+        print(f"  First spike differing by > 0.1 ms: {first_diff:.1f} ms")
+    else:
+        print("  No spike differs by > 0.1 ms")
+
+    if ref['LFP'] and test['LFP']:
+        lfp_ref = np.array(ref['LFP'])
+        lfp_test = np.array(test['LFP'])
+        rel = np.sqrt(np.mean((lfp_ref - lfp_test) ** 2)) / (np.std(lfp_ref) or 1.0)
+        print(f"  LFP RMS difference / LFP std: {rel:.2e}")
+
+    if ref.get('runTime') and test.get('runTime'):
+        print(f"  Run time: analytic {ref['runTime']:.1f} s, tables {test['runTime']:.1f} s "
+              f"({ref['runTime'] / test['runTime']:.2f}x)")
+    return ok
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--run':
+        run_single(sys.argv[2])
+        sys.exit(0)
+
+    import channel_tables
+
+    print("\n" + "="*80)
+    print("ACCURACY TEST: tabulated vs analytic channel rates")
+    print("="*80)
+
+    manifest = channel_tables.load_manifest()
+    if manifest is None or not channel_tables.tabulated_mechs():
+        print("✗ ERROR: tabulated-rates build not loaded")
+        print("   Run: python channel_tables.py && nrnivmodl mod_tables/")
+        sys.exit(1)
+    print(f"Tables: {manifest['vmin']:g} to {manifest['vmax']:g} mV, dv = {manifest['dv']:g} mV")
+
+    print("\n[1/3] Rate functions...")
+    rates_ok = check_rate_functions()
+
+    results = {}
+    for i, mode in enumerate(['analytic', 'tables'], 2):
+        print(f"\n[{i}/3] Running network with {mode} rates...")
+        proc = subprocess.run([sys.executable, __file__, '--run', mode])
+        if proc.returncode != 0:
+            print(f"  ✗ {mode} run failed (exit code {proc.returncode})")
+            sys.exit(1)
+        with open(os.path.join(OUTPUT_DIR, f'channel_tables_{mode}.json')) as f:
+            results[mode] = json.load(f)
+        print(f"  ✓ {len(results[mode]['spkt'])} spikes")
+
+    print("\nNetwork comparison:")
+    network_ok = compare_networks(results['analytic'], results['tables'])
+
+    if rates_ok and network_ok:
+        print("\n✓ PASS: tabulated rates match the analytic rates")
+    else:
+        print("\n✗ FAIL: tabulated rates exceed the tolerances above")
+        sys.exit(1)
@@ -0,0 +1,210 @@
+"""
+test_checkpoint.py
+
+Checkpoint/branch test: a branch resumed from the checkpoint before the TMS
+onset (checkpoint.run_warmup + run_branch) against a straight 0 - duration run.
+
+Runs the 100-cell network (Healthy, iclamp-engine rTMS) five times, each in
+its own process:
+1. straight:       the variant protocol applied from the start, plain
+                   sim.simulate()
+2. branch:         the base protocol applied, warm-up to the checkpoint, then
+                   tms.replay_tms to the variant and run_branch to the end
+3. branches:       checkpoint.run_tms_branches with two variants, a stronger
+                   one with another width and shape first and the variant
+                   second; the second branch is read back from its saved output
+4. straight_shape: as 1. with the base amplitude and frequency but another
+                   pulse width and shape
+5. branch_shape:   as 2. towards that width/shape variant
+and compares spike times gid by gid, the recorded voltage traces and the LFP
+of each branch with its straight run. The second branch only matches if
+nothing of the first one (spikes, trace samples, LFP rows) survives into it.
+
+Usage:
+    python test_checkpoint.py
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+# Ensure correct directory
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+DURATION = 800.0          # ms
+STIM_START = 300.0        # ms, the checkpoint is one recordStep earlier
+STIM_END = 600.0          # ms
+BASE = {'ef_amp_V_per_m': 40.0, 'freq_Hz': 10., 'width_ms': 1.0, 'pshape': 'Sine'}
+VARIANT = {'ef_amp_V_per_m': 60.0, 'freq_Hz': 20.}
+SHAPE = {'width_ms': 0.4, 'pshape': 'Monophasic'}
+FIRST = {'ef_amp_V_per_m': 120.0, 'freq_Hz': 40., 'width_ms': 2.0, 'pshape': 'Biphasic'}  # run before VARIANT in 'branches'
+MODES = ['straight', 'branch', 'branches', 'straight_shape', 'branch_shape']
+SPIKE_TOL_MS = 1e-6       # a branch must continue the run, not approximate it
+TRACE_TOL_MV = 1e-6
+LFP_TOL = 1e-6            # max |LFP difference| / max |LFP|
+OUTPUT_DIR = 'test_output'
+
+
+def target(mode):
+    """tms_params overrides a straight run applies and a branch switches to."""
+    return SHAPE if mode.endswith('_shape') else VARIANT
+
+
+def configure(cfg, mode):
+    cfg.duration = DURATION
+    cfg.tms_enabled = True
+    cfg.tms_params['engine'] = 'iclamp'
+    cfg.tms_params['stim_start_ms'] = STIM_START
+    cfg.tms_params['stim_end_ms'] = STIM_END
+    cfg.tms_params['duration_ms'] = DURATION
+    cfg.tms_params.update(BASE)
+    if mode.startswith('straight'):
+        cfg.tms_params.update(target(mode))
+    cfg.simLabel = f'checkpoint_{mode}'
+    cfg.saveFolder = OUTPUT_DIR
+    cfg.saveJson = False
+    for plot in cfg.analysis.values():
+        plot['saveFig'] = False
+
+
+def result_of(data, trace_keys):
+    """Spikes, traces and LFP of gathered or saved simData as JSON-friendly lists."""
+    traces = {key: {str(cell): [float(v) for v in trace] for cell, trace in data[key].items()}
+              for key in trace_keys if key in data}
+    return {
+        'spkt': [float(t) for t in data['spkt']],
+        'spkid': [int(gid) for gid in data['spkid']],
+        'traces': traces,
+        'LFP': [[float(v) for v in row] for row in data['LFP']] if 'LFP' in data else [],
+    }
+
+
+def run_single(mode):
+    """Build and run the network with one of MODES; save the result."""
+    from netpyne import sim
+    from cfg import cfg
+
+    configure(cfg, mode)
+
+    from netParams import build_netParams
+    import checkpoint
+    import output_io
+    import parallel
+    import tms
+
+    netParams = build_netParams(cfg, verbose=False)
+
+    sim.create(netParams, cfg)
+    parallel.record_pop_gid_ranges(sim, cfg)
+    applied = tms.apply_tms_from_params(sim, cfg)
+
+    if mode.startswith('straight'):
+        sim.simulate()
+        data = sim.allSimData
+    elif mode in ('branch', 'branch_shape'):
+        ckpt = checkpoint.run_warmup(sim, cfg)
+        tms.replay_tms(applied, dict(cfg.tms_params, **target(mode)), t_restore=ckpt['t'])
+        checkpoint.run_branch(sim, cfg, ckpt)
+        sim.gatherData()
+        data = sim.allSimData
+    else:
+        cfg.saveFormat = 'npy'
+        records = checkpoint.run_tms_branches(sim, cfg, applied, [FIRST, VARIANT], cfg.simLabel)
+        first, second = [output_io.load_output(output_io.output_path(OUTPUT_DIR, r['simLabel']))['simData']
+                         for r in records]
+        print(f"  First branch {FIRST}: {len(first['spkt'])} spikes")
+        data = second
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    with open(os.path.join(OUTPUT_DIR, f'{cfg.simLabel}.json'), 'w') as f:
+        json.dump(result_of(data, cfg.recordTraces), f)
+
+
+def spikes_by_gid(result):
+    trains = {}
+    for t, gid in zip(result['spkt'], result['spkid']):
+        trains.setdefault(int(gid), []).append(t)
+    return {gid: sorted(ts) for gid, ts in trains.items()}
+
+
+def compare(ref, test, label):
+    """Compare a branch (test) with a straight run (ref); True if they agree within the tolerances."""
+    import numpy as np
+
+    ok = True
+    print(f"  {label}: straight {len(ref['spkt'])} spikes, branch {len(test['spkt'])} spikes")
+
+    ref_trains, test_trains = spikes_by_gid(ref), spikes_by_gid(test)
+    mismatched = []
+    max_dt = 0.0
+    for gid in sorted(set(ref_trains) | set(test_trains)):
+        a, b = ref_trains.get(gid, []), test_trains.get(gid, [])
+        if len(a) != len(b):
+            mismatched.append((gid, len(a), len(b)))
+        elif a:
+            max_dt = max(max_dt, float(np.max(np.abs(np.array(a) - np.array(b)))))
+    if mismatched:
+        ok = False
+        print(f"  ✗ Spike count differs for {len(mismatched)} cells, e.g. gid {mismatched[0][0]}: "
+              f"{mismatched[0][1]} vs {mismatched[0][2]}")
+    print(f"  Max spike time difference: {max_dt:.2e} ms (tolerance {SPIKE_TOL_MS:g} ms)")
+    ok = ok and max_dt <= SPIKE_TOL_MS
+
+    max_dv = 0.0
+    for key, cells in ref['traces'].items():
+        for cell, trace in cells.items():
+            other = test['traces'].get(key, {}).get(cell)
+            if other is None or len(other) != len(trace):
+                ok = False
+                print(f"  ✗ Trace {key}/{cell}: {len(trace)} samples vs "
+                      f"{'none' if other is None else len(other)}")
+                continue
+            max_dv = max(max_dv, float(np.max(np.abs(np.array(trace) - np.array(other)))))
+    print(f"  Max trace difference: {max_dv:.2e} mV (tolerance {TRACE_TOL_MV:g} mV)")
+    ok = ok and max_dv <= TRACE_TOL_MV
+
+    if ref['LFP'] and test['LFP']:
+        lfp_ref, lfp_test = np.array(ref['LFP']), np.array(test['LFP'])
+        if lfp_ref.shape != lfp_test.shape:
+            ok = False
+            print(f"  ✗ LFP shape differs: {lfp_ref.shape} vs {lfp_test.shape}")
+        else:
+            rel = np.max(np.abs(lfp_ref - lfp_test)) / (np.max(np.abs(lfp_ref)) or 1.0)
+            print(f"  LFP max relative difference: {rel:.2e} (tolerance {LFP_TOL:g})")
+            ok = ok and rel <= LFP_TOL
+
+    return ok
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--run':
+        run_single(sys.argv[2])
+        sys.exit(0)
+
+    print("\n" + "="*80)
+    print("CHECKPOINT TEST: branch from before the TMS onset vs straight run")
+    print("="*80)
+    print(f"Duration: {DURATION} ms, onset at {STIM_START} ms, base {BASE} -> variants {VARIANT}, {SHAPE}")
+
+    results = {}
+    n_steps = len(MODES) + 1
+    for i, mode in enumerate(MODES, 1):
+        print(f"\n[{i}/{n_steps}] Running {mode}...")
+        proc = subprocess.run([sys.executable, __file__, '--run', mode])
+        if proc.returncode != 0:
+            print(f"  ✗ {mode} run failed (exit code {proc.returncode})")
+            sys.exit(1)
+        with open(os.path.join(OUTPUT_DIR, f'checkpoint_{mode}.json')) as f:
+            results[mode] = json.load(f)
+        print(f"  ✓ {len(results[mode]['spkt'])} spikes")
+
+    print(f"\n[{n_steps}/{n_steps}] Comparing...")
+    ok = compare(results['straight'], results['branch'], 'single branch')
+    ok = compare(results['straight'], results['branches'], f'second branch (after {FIRST})') and ok
+    ok = compare(results['straight_shape'], results['branch_shape'], f'width/shape branch {SHAPE}') and ok
+    if ok:
+        print("\n✓ PASS: every branch reproduces the straight run")
+    else:
+        print("\n✗ FAIL: a branch differs from the straight run")
+        sys.exit(1)
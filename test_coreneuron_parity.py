@@ -0,0 +1,152 @@
+"""
+test_coreneuron_parity.py
+
+Parity test: NEURON vs CoreNEURON on the same network.
+
+Runs a short simulation (Healthy, iclamp-engine rTMS at 10 Hz, LFP on) once
+with NEURON and once with CoreNEURON, each in its own process, then compares
+spike times gid by gid and the LFP traces.
+
+Usage:
+    nrnivmodl -coreneuron mod/
+    python test_coreneuron_parity.py
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+# Ensure correct directory
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+DURATION = 600.0          # ms
+SPIKE_TOL_MS = 0.025      # one time step
+LFP_TOL = 1e-3            # max |LFP difference| / max |LFP|
+OUTPUT_DIR = 'test_output'
+
+
+def run_single(mode):
+    """Build and run the network with mode = 'neuron' or 'coreneuron'; save spikes and LFP."""
+    from netpyne import sim
+    from cfg import cfg
+
+    cfg.coreneuron = (mode == 'coreneuron')
+    cfg.random123 = True            # same NetStim streams in both simulators
+    cfg.duration = DURATION
+    cfg.tms_enabled = True
+    cfg.tms_params['engine'] = 'iclamp'
+    cfg.tms_params['freq_Hz'] = 10.
+    cfg.tms_params['stim_start_ms'] = 200.0
+    cfg.tms_params['stim_end_ms'] = 400.0
+    cfg.tms_params['duration_ms'] = DURATION
+    cfg.simLabel = f'coreneuron_parity_{mode}'
+    cfg.saveFolder = OUTPUT_DIR
+    cfg.saveJson = False
+    for plot in cfg.analysis.values():
+        plot['saveFig'] = False
+
+    from netParams import build_netParams
+    import coreneuron_mode
+    import tms
+
+    netParams = build_netParams(cfg, verbose=False)
+
+    if cfg.coreneuron:
+        coreneuron_mode.configure_coreneuron(cfg)
+    sim.create(netParams, cfg)
+    tms.apply_tms_from_params(sim, cfg)
+    coreneuron_mode.simulate(sim, cfg)
+
+    result = {
+        'spkt': list(sim.allSimData['spkt']),
+        'spkid': list(sim.allSimData['spkid']),
+        'LFP': [list(row) for row in sim.allSimData['LFP']] if 'LFP' in sim.allSimData else [],
+    }
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    with open(os.path.join(OUTPUT_DIR, f'{cfg.simLabel}.json'), 'w') as f:
+        json.dump(result, f)
+
+
+def spikes_by_gid(result):
+    trains = {}
+    for t, gid in zip(result['spkt'], result['spkid']):
+        trains.setdefault(int(gid), []).append(t)
+    return {gid: sorted(ts) for gid, ts in trains.items()}
+
+
+def compare(ref, test):
+    """Compare two runs; returns True if spikes match within SPIKE_TOL_MS and LFP within LFP_TOL."""
+    import numpy as np
+
+    ref_trains = spikes_by_gid(ref)
+    test_trains = spikes_by_gid(test)
+
+    ok = True
+    print(f"  Spikes: NEURON {len(ref['spkt'])}, CoreNEURON {len(test['spkt'])}")
+
+    mismatched = []
+    max_dt = 0.0
+    for gid in sorted(set(ref_trains) | set(test_trains)):
+        a = ref_trains.get(gid, [])
+        b = test_trains.get(gid, [])
+        if len(a) != len(b):
+            mismatched.append((gid, len(a), len(b)))
+            continue
+        if a:
+            max_dt = max(max_dt, float(np.max(np.abs(np.array(a) - np.array(b)))))
+
+    if mismatched:
+        ok = False
+        print(f"  ✗ Spike count differs for {len(mismatched)} cells, e.g. gid {mismatched[0][0]}: "
+              f"{mismatched[0][1]} vs {mismatched[0][2]}")
+    print(f"  Max spike time difference: {max_dt:.6f} ms (tolerance {SPIKE_TOL_MS} ms)")
+    if max_dt > SPIKE_TOL_MS:
+        ok = False
+
+    if ref['LFP'] and test['LFP']:
+        lfp_ref = np.array(ref['LFP'])
+        lfp_test = np.array(test['LFP'])
+        if lfp_ref.shape != lfp_test.shape:
+            ok = False
+            print(f"  ✗ LFP shape differs: {lfp_ref.shape} vs {lfp_test.shape}")
+        else:
+            scale = np.max(np.abs(lfp_ref)) or 1.0
+            rel = np.max(np.abs(lfp_ref - lfp_test)) / scale
+            print(f"  LFP max relative difference: {rel:.2e} (tolerance {LFP_TOL:g})")
+            if rel > LFP_TOL:
+                ok = False
+    else:
+        ok = False
+        print("  ✗ LFP not recorded in one of the runs")
+
+    return ok
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--run':
+        run_single(sys.argv[2])
+        sys.exit(0)
+
+    print("\n" + "="*80)
+    print("PARITY TEST: NEURON vs CoreNEURON")
+    print("="*80)
+    print(f"Duration: {DURATION} ms, rTMS 10 Hz (iclamp engine), LFP on")
+
+    results = {}
+    for i, mode in enumerate(['neuron', 'coreneuron'], 1):
+        print(f"\n[{i}/3] Running {mode}...")
+        proc = subprocess.run([sys.executable, __file__, '--run', mode])
+        if proc.returncode != 0:
+            print(f"  ✗ {mode} run failed (exit code {proc.returncode})")
+            sys.exit(1)
+        with open(os.path.join(OUTPUT_DIR, f'coreneuron_parity_{mode}.json')) as f:
+            results[mode] = json.load(f)
+        print(f"  ✓ {len(results[mode]['spkt'])} spikes")
+
+    print("\n[3/3] Comparing...")
+    if compare(results['neuron'], results['coreneuron']):
+        print("\n✓ PASS: CoreNEURON matches NEURON")
+    else:
+        print("\n✗ FAIL: CoreNEURON differs from NEURON")
+        sys.exit(1)
@@ -3,10 +3,28 @@ tms.py
 Transcranial Magnetic Stimulation (TMS) module for NetPyNE simulations
 
 Implements realistic field-based rTMS with biphasic pulses and field→current conversion.
+The whole pulse train is precomputed as one current waveform and played into a single
+IClamp per cell with Vector.play.
+
+Alternatively ('engine': 'field') the spatial tms_params drive a real extracellular
+field: per-segment quasipotentials feed e_extracellular through the xtra mechanism.
 """
 
 from neuron import h
 import numpy as np
+import hashlib
+import json
+import os
+
+from parallel import atomic_savez, root_print
+
+
+# Shared waveforms: (freq, width, pshape, dt, duration, start, end) ->
+# {'t': t_vec, 'amps': {amp: amp_vec}}, the unit-amplitude train under amp 1.0
+_WAVEFORM_CACHE = {}
+
+# tms_params entries that determine the per-segment field coupling
+FIELD_GEOMETRY_KEYS = ['E_field_dir', 'decay_dir', 'ref_point_um', 'decay_rate_percent_per_mm']
 
 
 def convert_field_to_current(field_Vm, cell_type='HL23PYR', compartment='soma'):
@@ -40,17 +58,180 @@ def apply_biphasic_pulse(soma_sec, onset, amp_nA, duration=1.0):
     return [stim1, stim2]
 
 
-def apply_tms_from_params(sim, cfg, target_pop='HL23PYR'):
+def get_pulse_onsets(tms_params):
+    """Return the onset times (ms) of all pulses in the train as a NumPy array."""
+    freq_Hz = tms_params['freq_Hz']
+    stim_start = tms_params['stim_start_ms']
+    stim_end = tms_params['stim_end_ms']
+
+    stim_duration = stim_end - stim_start
+    n_pulses = int(stim_duration * freq_Hz / 1000.0)
+    pulse_interval = 1000.0 / freq_Hz
+
+    return stim_start + np.arange(n_pulses) * pulse_interval
+
+
+def pulse_template(pshape, width_ms, dt):
+    """
+    Single-pulse template as (time offsets, unit amplitudes).
+
+    Rectangular shapes are encoded with repeated time points so that the
+    continuous Vector.play reproduces the step edges exactly; the sine shape
+    is sampled at dt over one full period.
+
+    Args:
+        pshape: 'Biphasic', 'Sine' or 'Monophasic' (case-insensitive)
+        width_ms: Total pulse duration (ms)
+        dt: Sampling interval for smooth shapes (ms)
+
+    Returns:
+        offsets (ms), values (unitless, peak = 1)
+    """
+    shape = pshape.lower()
+    half = width_ms / 2.0
+
+    if shape == 'biphasic':
+        offsets = np.array([0.0, 0.0, half, half, width_ms, width_ms])
+        values = np.array([0.0, 1.0, 1.0, -1.0, -1.0, 0.0])
+    elif shape == 'monophasic':
+        offsets = np.array([0.0, 0.0, width_ms, width_ms])
+        values = np.array([0.0, 1.0, 1.0, 0.0])
+    elif shape == 'sine':
+        n_samples = max(int(round(width_ms / dt)), 2)
+        offsets = np.linspace(0.0, width_ms, n_samples + 1)
+        values = np.sin(2.0 * np.pi * offsets / width_ms)
+        values[-1] = 0.0
+    else:
+        raise ValueError(f"Unknown TMS pulse shape '{pshape}' (expected Biphasic, Sine or Monophasic)")
+
+    return offsets, values
+
+
+def build_waveform(tms_params, amp):
+    """
+    Precompute the full pulse-train waveform.
+
+    Args:
+        tms_params: cfg.tms_params dictionary
+        amp: Peak amplitude (e.g. nA for IClamp injection)
+
+    Returns:
+        t (ms), waveform as NumPy arrays, ready for Vector.play(..., continuous=1)
+    """
+    onsets = get_pulse_onsets(tms_params)
+    offsets, values = pulse_template(tms_params['pshape'],
+                                     tms_params['width_ms'],
+                                     tms_params['pulse_resolution_ms'])
+
+    t = (onsets[:, None] + offsets[None, :]).ravel()
+    waveform = np.tile(values * amp, len(onsets))
+
+    return t, waveform
+
+
+def waveform_key(tms_params):
+    """Cache key identifying a pulse train; the amplitude is applied on top of it."""
+    return (tms_params['freq_Hz'], tms_params['width_ms'], tms_params['pshape'].lower(),
+            tms_params['pulse_resolution_ms'], tms_params['duration_ms'],
+            tms_params['stim_start_ms'], tms_params['stim_end_ms'])
+
+
+def get_shared_waveform(tms_params, amp):
+    """
+    Return the cached (t_vec, amp_vec) pair for these parameters, building it on first use.
+
+    The pulse train is built once per parameter set at unit amplitude. Its time
+    Vector is shared by every amplitude, and amp == 1 plays the unit Vector
+    itself (the field engine scales es and plays only that one). Each other
+    distinct amplitude gets one scaled copy of the unit Vector: an IClamp has
+    no gain of its own and its amp is the only target Vector.play can drive,
+    while a point process scaling a played GLOBAL would not run under
+    CoreNEURON, which the iclamp engine supports. Amplitudes are the
+    population amplitude times cell_scales, so there are few of them and
+    memory stays O(samples x distinct amplitudes), not O(cells x samples).
+    """
+    key = waveform_key(tms_params)
+    if key not in _WAVEFORM_CACHE:
+        t, unit = build_waveform(tms_params, 1.0)
+        unit_vec = h.Vector(unit)
+        _WAVEFORM_CACHE[key] = {'t': h.Vector(t), 'amps': {1.0: unit_vec}}
+
+    entry = _WAVEFORM_CACHE[key]
+    amp = round(float(amp), 12)
+    if amp not in entry['amps']:
+        entry['amps'][amp] = entry['amps'][1.0].c().mul(amp)
+    return entry['t'], entry['amps'][amp]
+
+
+def clear_waveform_cache():
+    """Drop all shared waveforms (clamps still playing them keep their own references)."""
+    _WAVEFORM_CACHE.clear()
+
+
+def find_soma_section(cell):
+    """Return the NEURON soma section of a NetPyNE cell (first section as fallback)."""
+    if 'soma_0' in cell.secs:
+        return cell.secs['soma_0']['hObj']
+    elif 'soma' in cell.secs:
+        return cell.secs['soma']['hObj']
+    else:
+        first_sec_name = list(cell.secs.keys())[0]
+        return cell.secs[first_sec_name]['hObj']
+
+
+def play_waveform(soma_sec, t_vec, amp_vec):
+    """Create one IClamp at the soma and drive its amplitude from amp_vec."""
+    clamp = h.IClamp(soma_sec(0.5))
+    clamp.delay = 0
+    clamp.dur = 1e9
+    clamp.amp = 0
+    amp_vec.play(clamp._ref_amp, t_vec, 1)
+    return clamp
+
+
+def waveform_vectors(tms_params, amp, waveform_mode):
+    """(t_vec, amp_vec) for one clamp: the cached shared pair, or a private copy for 'per_cell'."""
+    if waveform_mode == 'shared':
+        return get_shared_waveform(tms_params, amp)
+    t, waveform = build_waveform(tms_params, amp)
+    return h.Vector(t), h.Vector(waveform)
+
+
+def apply_tms_from_params(sim, cfg, target_pop='HL23PYR', cell_scales=None):
     """
     Apply TMS protocol using cfg.tms_params (new standard format).
     
-    Reads from cfg.tms_params and applies field-based biphasic rTMS.
+    Reads from cfg.tms_params, precomputes the pulse train for the requested
+    pulse shape and plays it into a single IClamp per target cell.
+
+    tms_params['engine'] == 'field' switches to the extracellular field
+    engine (apply_tms_field), which stimulates every cell in the network.
+
+    With tms_params['waveform_mode'] == 'shared' all cells play one cached
+    waveform and only a per-cell scale factor is kept; 'per_cell' gives every
+    cell its own copy of the vectors.
+
+    Args:
+        sim: NetPyNE sim object (after sim.create)
+        cfg: SimConfig with tms_params
+        target_pop: Population receiving the stimulation
+        cell_scales: Optional {gid: factor} applied on top of the population amplitude
+
+    Returns:
+        dict with 'clamps', 'vectors' and 'scales' (keep a reference for the whole
+        run, otherwise NEURON frees the played vectors), plus what replay_tms needs
     """
     if not hasattr(cfg, 'tms_params'):
-        print("[TMS] No tms_params found - skipping")
-        return []
+        root_print("[TMS] No tms_params found - skipping")
+        return {'clamps': [], 'vectors': [], 'scales': {}}
     
     tms_params = cfg.tms_params
+    cell_scales = cell_scales or {}
+
+    if tms_params['engine'] == 'field':
+        return apply_tms_field(sim, cfg)
+    elif tms_params['engine'] != 'iclamp':
+        raise ValueError(f"Unknown TMS engine '{tms_params['engine']}' (expected 'iclamp' or 'field')")
     
     # Extract parameters (NO defaults - cfg.tms_params is source of truth)
     field_Vm = tms_params['ef_amp_V_per_m']
@@ -58,65 +239,394 @@ def apply_tms_from_params(sim, cfg, target_pop='HL23PYR'):
     stim_start = tms_params['stim_start_ms']
     stim_end = tms_params['stim_end_ms']
     width_ms = tms_params['width_ms']
-    
-    # Calculate number of pulses
-    stim_duration = stim_end - stim_start
-    n_pulses = int(stim_duration * freq_Hz / 1000.0)
-    pulse_interval = 1000.0 / freq_Hz
+    pshape = tms_params['pshape']
+    waveform_mode = tms_params['waveform_mode']
+
+    if waveform_mode not in ('shared', 'per_cell'):
+        raise ValueError(f"Unknown TMS waveform_mode '{waveform_mode}' (expected 'shared' or 'per_cell')")
     
     # Convert field to current
     amp_nA = convert_field_to_current(field_Vm, cell_type=target_pop, compartment='soma')
+    n_pulses = len(get_pulse_onsets(tms_params))
     
-    print(f"[TMS] ========== TMS Protocol (from tms_params) ==========")
-    print(f"[TMS] Field strength: {field_Vm} V/m → {amp_nA:.4f} nA")
-    print(f"[TMS] Frequency: {freq_Hz} Hz")
-    print(f"[TMS] Number of pulses: {n_pulses}")
-    print(f"[TMS] Pulse duration: {width_ms} ms (biphasic)")
-    print(f"[TMS] Stimulation window: {stim_start} - {stim_end} ms")
-    print(f"[TMS] Target population: {target_pop}")
+    root_print(f"[TMS] ========== TMS Protocol (from tms_params) ==========")
+    root_print(f"[TMS] Field strength: {field_Vm} V/m → {amp_nA:.4f} nA")
+    root_print(f"[TMS] Frequency: {freq_Hz} Hz")
+    root_print(f"[TMS] Number of pulses: {n_pulses}")
+    root_print(f"[TMS] Pulse duration: {width_ms} ms ({pshape})")
+    root_print(f"[TMS] Stimulation window: {stim_start} - {stim_end} ms")
+    root_print(f"[TMS] Target population: {target_pop}")
+    root_print(f"[TMS] Waveform mode: {waveform_mode}")
     
-    # Apply pulses to all cells in target population
+    # One played waveform per cell in target population
     clamps = []
-    cell_count = 0
+    vectors = []
+    scales = {}
     
     for cell in sim.net.cells:
         if cell.tags.get('pop') == target_pop:
-            # Find soma section
-            soma_sec = None
-            if 'soma_0' in cell.secs:
-                soma_sec = cell.secs['soma_0']['hObj']
-            elif 'soma' in cell.secs:
-                soma_sec = cell.secs['soma']['hObj']
-            else:
-                first_sec_name = list(cell.secs.keys())[0]
-                soma_sec = cell.secs[first_sec_name]['hObj']
-            
-            # Apply pulse train
-            for pulse_idx in range(n_pulses):
-                pulse_onset = stim_start + pulse_idx * pulse_interval
-                pulse_clamps = apply_biphasic_pulse(soma_sec, pulse_onset, amp_nA, duration=width_ms)
-                clamps.extend(pulse_clamps)
-            
-            cell_count += 1
+            soma_sec = find_soma_section(cell)
+            scale = cell_scales.get(cell.gid, 1.0)
+
+            t_vec, amp_vec = waveform_vectors(tms_params, amp_nA * scale, waveform_mode)
+            clamps.append(play_waveform(soma_sec, t_vec, amp_vec))
+            vectors.extend([t_vec, amp_vec])
+            scales[cell.gid] = scale
+
+    n_samples = sum(int(v.size()) for v in {id(v): v for v in vectors}.values())
     
-    print(f"[TMS] Applied to {cell_count} cells")
-    print(f"[TMS] Total IClamp objects: {len(clamps)}")
-    print(f"[TMS] ================================================\n")
+    root_print(f"[TMS] Applied to {len(clamps)} cells")
+    root_print(f"[TMS] Total IClamp objects: {len(clamps)}")
+    root_print(f"[TMS] Waveform samples held: {n_samples}")
+    root_print(f"[TMS] ================================================\n")
     
-    return clamps
+    return {'engine': 'iclamp', 'clamps': clamps, 'vectors': vectors, 'scales': scales,
+            'target_pop': target_pop, 'tms_params': dict(tms_params)}
+
+
+#------------------------------------------------------------------------------
+# Extracellular field engine (tms_params['engine'] == 'field')
+#------------------------------------------------------------------------------
+
+def get_segment_coordinates(sec, pt3d):
+    """
+    Return an (nseg, 3) array of segment-centre coordinates (um).
+
+    pt3d is the section's list of (x, y, z, diam) points in morphology
+    coordinates (NetPyNE's sec['geom']['pt3d']); segment centres are placed
+    by arc length along them.
+    """
+    seg_x = np.array([seg.x for seg in sec])
+
+    if not pt3d:
+        return np.full((len(seg_x), 3), np.nan)
+
+    pts = np.asarray(pt3d, dtype=float)[:, :3]
+    arc = np.concatenate([[0.0], np.cumsum(np.linalg.norm(np.diff(pts, axis=0), axis=1))])
+
+    return np.column_stack([np.interp(seg_x * arc[-1], arc, pts[:, k]) for k in range(3)])
+
+
+def cell_origin(cell, inverted_y=True):
+    """
+    Network position of a cell in NEURON coordinates (um).
+
+    Same convention as NetPyNE's pt3dRelativeToCellLocation: the morphology
+    origin goes to (x, y, z) from the cell tags, with y negated when
+    inverted_y (cfg.invertedYCoord, cortical depth pointing down).
+    """
+    y = -cell.tags['y'] if inverted_y else cell.tags['y']
+    return np.array([cell.tags['x'], y, cell.tags['z']], dtype=float)
+
+
+def collect_segments(cells, inverted_y=True):
+    """
+    Gather every segment of every cell in one pass.
+
+    Coordinates come from each section's morphology points (the unshifted
+    copy NetPyNE keeps in sec['geom']['pt3d']) placed at cell_origin, so cells
+    of the same type at different network positions get different fields,
+    whether or not NetPyNE moved the hObj 3D points.
+
+    Returns:
+        segs: List of NEURON segments
+        coords: (n_segments, 3) array of segment-centre coordinates (um)
+        cell_index: (n_segments,) index into cells
+    """
+    segs = []
+    coords = []
+    cell_index = []
+
+    for i, cell in enumerate(cells):
+        origin = cell_origin(cell, inverted_y)
+        for sec_dict in cell.secs.values():
+            sec = sec_dict['hObj']
+            sec_coords = get_segment_coordinates(sec, sec_dict.get('geom', {}).get('pt3d'))
+            # Sections without 3D points (e.g. replaced axon) sit at the cell position
+            sec_coords[np.isnan(sec_coords[:, 0])] = 0.0
+            segs.extend(seg for seg in sec)
+            coords.append(sec_coords + origin)
+            cell_index.extend([i] * len(sec_coords))
+
+    coords = np.vstack(coords) if coords else np.zeros((0, 3))
+    return segs, coords, np.array(cell_index, dtype=int)
+
+
+def compute_quasipotentials(coords, tms_params):
+    """
+    Quasipotential (mV per V/m of field amplitude) at each segment.
+
+    The field points along E_field_dir and its amplitude decays linearly by
+    decay_rate_percent_per_mm along decay_dir, measured from ref_point_um.
+    Both projections come from a single (n_segments x 3) @ (3 x 2) product.
+
+    Args:
+        coords: (n_segments, 3) segment coordinates (um)
+        tms_params: cfg.tms_params dictionary
+
+    Returns:
+        (n_segments,) array
+    """
+    e_dir = np.asarray(tms_params['E_field_dir'], dtype=float)
+    d_dir = np.asarray(tms_params['decay_dir'], dtype=float)
+    ref = np.asarray(tms_params['ref_point_um'], dtype=float)
+    decay_rate = tms_params['decay_rate_percent_per_mm'] / 100.0
+
+    directions = np.column_stack([e_dir / np.linalg.norm(e_dir), d_dir / np.linalg.norm(d_dir)])
+    proj = (coords - ref) @ directions    # um along field, um along decay axis
+
+    decay = np.clip(1.0 - decay_rate * proj[:, 1] / 1000.0, 0.0, None)
+
+    # phi = -E . r ; (V/m) * um = 1e-3 mV
+    return -proj[:, 0] * decay * 1e-3
+
+
+def insert_field_coupling(segs, es):
+    """Insert extracellular + xtra on the segments' sections and set es / ex pointers."""
+    done = set()
+    for seg in segs:
+        sec = seg.sec
+        if sec.hname() not in done:
+            try:
+                sec.insert('extracellular')
+                sec.insert('xtra')
+            except ValueError:
+                raise RuntimeError("xtra mechanism not found - recompile mechanisms: nrnivmodl mod/")
+            done.add(sec.hname())
+
+    for seg, value in zip(segs, es):
+        seg.xtra.es = value
+        h.setpointer(seg._ref_e_extracellular, 'ex', seg.xtra)
+
+
+def cell_segments(cell):
+    """All NEURON segments of a NetPyNE cell, in the order used by collect_segments."""
+    return [seg for sec_dict in cell.secs.values() for seg in sec_dict['hObj']]
+
+
+def field_cache_path(cache_dir, pop, cells, tms_params, inverted_y=True):
+    """
+    Cache file for the unit quasipotentials of one population.
+
+    The key hashes the population's SWC file, the cell positions (as placed
+    by cell_origin) and the
+    field geometry, so it is shared by all runs (Healthy/AD stages, any
+    amplitude or pulse train) on the same network layout.
+
+    Returns:
+        Path to the .npz file, or None if the morphology file is not found
+    """
+    swc_path = os.path.join('morphologies', cells[0].tags['cellType'] + '.swc')
+    if not os.path.exists(swc_path):
+        return None
+
+    key = hashlib.sha1()
+    with open(swc_path, 'rb') as f:
+        key.update(f.read())
+    positions = np.array([cell_origin(c, inverted_y) for c in cells], dtype=float)
+    key.update(positions.tobytes())
+    key.update(json.dumps({k: tms_params[k] for k in FIELD_GEOMETRY_KEYS}, sort_keys=True).encode())
+
+    return os.path.join(cache_dir, f"{pop}_{key.hexdigest()[:16]}.npz")
+
+
+def get_unit_quasipotentials(cells, tms_params, inverted_y=True):
+    """
+    Per-segment quasipotentials for a 1 V/m field, using the on-disk cache.
+
+    Populations found in tms_params['field_cache_dir'] are loaded; all others
+    are computed together in one vectorized pass and written back.
+
+    Returns:
+        segs: List of NEURON segments
+        phi: (n_segments,) array (mV per V/m)
+        n_cached: Number of populations loaded from the cache
+    """
+    cache_dir = tms_params['field_cache_dir']
+
+    by_pop = {}
+    for cell in cells:
+        by_pop.setdefault(cell.tags['pop'], []).append(cell)
+
+    pop_segs = {pop: [seg for cell in pop_cells for seg in cell_segments(cell)]
+                for pop, pop_cells in by_pop.items()}
+    pop_phi = {}
+    pop_paths = {}
+
+    if cache_dir:
+        for pop, pop_cells in by_pop.items():
+            path = field_cache_path(cache_dir, pop, pop_cells, tms_params, inverted_y)
+            pop_paths[pop] = path
+            if path and os.path.exists(path):
+                phi = np.load(path)['phi']
+                if len(phi) == len(pop_segs[pop]):
+                    pop_phi[pop] = phi
+
+    missing = [pop for pop in by_pop if pop not in pop_phi]
+    if missing:
+        missing_cells = [cell for pop in missing for cell in by_pop[pop]]
+        _, coords, _ = collect_segments(missing_cells, inverted_y)
+        phi_all = compute_quasipotentials(coords, tms_params)
+
+        start = 0
+        for pop in missing:
+            n = len(pop_segs[pop])
+            pop_phi[pop] = phi_all[start:start + n]
+            start += n
+            if pop_paths.get(pop):
+                os.makedirs(cache_dir, exist_ok=True)
+                atomic_savez(pop_paths[pop], phi=pop_phi[pop])
+
+    segs = [seg for pop in by_pop for seg in pop_segs[pop]]
+    phi = np.concatenate([pop_phi[pop] for pop in by_pop]) if by_pop else np.zeros(0)
+
+    return segs, phi, len(by_pop) - len(missing)
+
+
+def apply_tms_field(sim, cfg, pops=None):
+    """
+    Apply TMS as an extracellular field to every segment of the selected cells.
+
+    The quasipotential of all segments is computed in one vectorized pass (or
+    loaded from tms_params['field_cache_dir']) and the pulse train is played
+    once into the GLOBAL xtra stimulus variable.
+
+    Args:
+        sim: NetPyNE sim object (after sim.create)
+        cfg: SimConfig with tms_params
+        pops: Populations to stimulate (None = cfg.allpops)
+
+    Returns:
+        dict with 'vectors', 'n_cells' and 'n_segments', plus what replay_tms needs
+    """
+    tms_params = cfg.tms_params
+    field_Vm = tms_params['ef_amp_V_per_m']
+
+    if pops is None:
+        pops = cfg.allpops
+    cells = [cell for cell in sim.net.cells if cell.tags.get('pop') in pops]
+
+    segs, phi, n_cached = get_unit_quasipotentials(
+        cells, tms_params, getattr(cfg, 'invertedYCoord', True))
+    es = field_Vm * phi
+    insert_field_coupling(segs, es)
+
+    # Unit-amplitude time course, shared by every segment through stim_xtra
+    t_vec, stim_vec = get_shared_waveform(tms_params, 1.0)
+    stim_vec.play(h._ref_stim_xtra, t_vec, 1)
+
+    root_print(f"[TMS] ========== TMS Protocol (extracellular field) ==========")
+    root_print(f"[TMS] Field strength: {field_Vm} V/m, direction {tms_params['E_field_dir']}")
+    root_print(f"[TMS] Decay: {tms_params['decay_rate_percent_per_mm']} %/mm along {tms_params['decay_dir']}")
+    root_print(f"[TMS] Pulses: {len(get_pulse_onsets(tms_params))} x {tms_params['width_ms']} ms ({tms_params['pshape']}) at {tms_params['freq_Hz']} Hz")
+    root_print(f"[TMS] Applied to {len(cells)} cells, {len(segs)} segments")
+    root_print(f"[TMS] Field coupling loaded from cache for {n_cached} population(s)")
+    if len(es):
+        root_print(f"[TMS] Quasipotential range: {es.min():.3f} to {es.max():.3f} mV")
+    root_print(f"[TMS] ================================================\n")
+
+    return {'engine': 'field', 'vectors': [t_vec, stim_vec], 'n_cells': len(cells),
+            'n_segments': len(segs), 'tms_params': dict(tms_params), 'coupled_field_Vm': field_Vm}
+
+
+#------------------------------------------------------------------------------
+# Re-targeting an applied protocol (checkpoint branches)
+#------------------------------------------------------------------------------
+
+def check_replay_times(old_vectors, new_vectors, t_restore):
+    """
+    Check that new played vectors can resume from a SaveState taken at t_restore.
+
+    SaveState restores each PlayRecord positionally: its sample index and the
+    pending event at its next sample time. Both are only right for the new
+    vectors if there are as many of them and their time vectors match the old
+    ones up to and including the first sample after t_restore. Later samples,
+    the amplitudes and the vector lengths may differ.
+
+    Args:
+        old_vectors, new_vectors: applied['vectors'] lists ([t_vec, y_vec, ...])
+        t_restore: Time of the state that will be restored (ms)
+
+    Raises:
+        ValueError: The restored play positions would not fit the new vectors
+    """
+    if len(old_vectors) != len(new_vectors):
+        raise ValueError(f"[TMS] {len(new_vectors) // 2} played vectors replace {len(old_vectors) // 2}; "
+                         "a saved state cannot be restored onto them")
+
+    for old_t, new_t in zip(old_vectors[0::2], new_vectors[0::2]):
+        old_t, new_t = np.asarray(old_t), np.asarray(new_t)
+        n = min(int(np.searchsorted(old_t, t_restore, side='right')) + 1, len(old_t))
+        if len(new_t) < n or not np.array_equal(old_t[:n], new_t[:n]):
+            raise ValueError(f"[TMS] Played time vector changes at or before the first sample after "
+                             f"t = {t_restore} ms; keep the stimulation onset and the pulse up to "
+                             "the restore time unchanged")
+
+
+def replay_tms(applied, tms_params, t_restore=None):
+    """
+    Swap the waveform of an already applied TMS protocol for a new parameter set.
+
+    The clamps (or the xtra coupling) stay in place and only the played vectors
+    change, one-for-one, so the model keeps the same structure and the same
+    number of PlayRecords; a SaveState taken before the swap can still be
+    restored afterwards. Call before h.finitialize (see checkpoint.run_branch).
+
+    Amplitude, frequency, width, pulse shape and stimulation window may change,
+    as long as the time samples up to the restored time do not
+    (check_replay_times, run when t_restore is given). The field engine keeps
+    its per-segment coupling, so its geometry (FIELD_GEOMETRY_KEYS) must not
+    change either.
+
+    Args:
+        applied: dict returned by apply_tms_from_params
+        tms_params: New parameters (same keys as cfg.tms_params)
+        t_restore: Time (ms) of the SaveState that will be restored, if any
+
+    Returns:
+        applied, updated in place (keep the reference: it owns the new vectors)
+    """
+    old_params = applied['tms_params']
+    old_vectors = applied['vectors']
+
+    for vec in applied['vectors']:
+        vec.play_remove()
+
+    if applied['engine'] == 'field':
+        changed = [k for k in FIELD_GEOMETRY_KEYS if tms_params[k] != old_params[k]]
+        if changed:
+            raise ValueError(f"[TMS] Field geometry cannot change between branches: {changed}")
+
+        if applied['coupled_field_Vm'] == 0:
+            raise ValueError("[TMS] Field coupling was applied at 0 V/m; apply it at a non-zero amplitude to branch")
+
+        # es was set for the amplitude at coupling time; scale the time course instead
+        scale = tms_params['ef_amp_V_per_m'] / applied['coupled_field_Vm']
+        t_vec, stim_vec = get_shared_waveform(tms_params, scale)
+        stim_vec.play(h._ref_stim_xtra, t_vec, 1)
+        applied['vectors'] = [t_vec, stim_vec]
+    else:
+        amp_nA = convert_field_to_current(tms_params['ef_amp_V_per_m'],
+                                          cell_type=applied['target_pop'], compartment='soma')
+        vectors = []
+        for clamp, scale in zip(applied['clamps'], applied['scales'].values()):
+            t_vec, amp_vec = waveform_vectors(tms_params, amp_nA * scale, tms_params['waveform_mode'])
+            amp_vec.play(clamp._ref_amp, t_vec, 1)
+            vectors.extend([t_vec, amp_vec])
+        applied['vectors'] = vectors
+
+    if t_restore is not None:
+        check_replay_times(old_vectors, applied['vectors'], t_restore)
+    applied['tms_params'] = dict(tms_params)
+
+    root_print(f"[TMS] Replayed {applied['engine']} protocol: {tms_params['ef_amp_V_per_m']} V/m, "
+          f"{tms_params['freq_Hz']} Hz, {tms_params['width_ms']} ms {tms_params['pshape']}")
+    return applied
 
 
 def get_tms_pulse_times(cfg):
     """Return the exact times of all TMS pulses for analysis/plotting."""
     if hasattr(cfg, 'tms_params'):
-        freq_Hz = cfg.tms_params['freq_Hz']
-        stim_start = cfg.tms_params['stim_start_ms']
-        stim_end = cfg.tms_params['stim_end_ms']
-
-        stim_duration = stim_end - stim_start
-        n_pulses = int(stim_duration * freq_Hz / 1000.0)
-        pulse_interval = 1000.0 / freq_Hz
-
-        return [stim_start + i * pulse_interval for i in range(n_pulses)]
+        return get_pulse_onsets(cfg.tms_params).tolist()
 
     return []